@@ -245,6 +245,14 @@ run_index_full() {
   automation_log "INFO" "index-full" "done"
 }
 
+run_index_watch() {
+  automation_log "INFO" "index-watch" "start"
+  python3 "${ROOT_DIR}/scripts/knowledge_index.py" watch \
+    --root "${KNOWLEDGE_ROOT}" \
+    --db "${KNOWLEDGE_INDEX_DB}" || return "${E_INDEX}"
+  automation_log "INFO" "index-watch" "done"
+}
+
 run_search() {
   local query="${1:-}"
   if [ -z "${query}" ]; then
@@ -2358,6 +2366,7 @@ Usage:
   scripts/agentsys.sh health
   scripts/agentsys.sh index
   scripts/agentsys.sh index-full
+  scripts/agentsys.sh index-watch
   scripts/agentsys.sh search "<关键词>"
   scripts/agentsys.sh lifecycle
   scripts/agentsys.sh summary
@@ -2484,6 +2493,7 @@ case "${cmd}" in
   health) run_health ;;
   index) run_index ;;
   index-full) run_index_full ;;
+  index-watch) run_index_watch ;;
   search) shift; run_search "${1:-}" ;;
   lifecycle) run_lifecycle ;;
   summary) run_summary ;;
@@ -27,6 +27,7 @@ from apps.research_hub.app import ResearchHubApp
 from apps.tooling_hub.app import ToolingHubApp
 from core.kernel.memory_store import load_memory, memory_rate, memory_snapshot, save_memory, update_strategy
 from core.skill_intelligence import build_loop_closure, compose_prompt_v2
+from scripts.keyword_automaton import KeywordAutomaton
 from scripts.skill_parser import SkillMeta, parse_all_skills
 
 
@@ -176,6 +177,55 @@ def _skill_score(text: str, skill: SkillMeta) -> Tuple[float, Dict[str, Any]]:
     return score, {"trigger_hits": hits, "token_overlap": overlap}
 
 
+def _skill_signature(skills: List[SkillMeta]) -> Tuple[Any, ...]:
+    return tuple((s.name, s.description, tuple(map(str, s.triggers)), tuple(map(str, s.calls))) for s in skills)
+
+
+def compile_skill_index(skills: List[SkillMeta]) -> Dict[str, Any]:
+    """Precompute per-skill token sets as an inverted index (token -> skill ids) plus one trigger automaton.
+
+    `score_skills` then scores a request against every skill with a single pass
+    over its tokens, giving the same numbers as calling `_skill_score` per skill.
+    """
+    postings: Dict[str, List[int]] = {}
+    triggers = KeywordAutomaton()
+    for sid, s in enumerate(skills):
+        for tk in set(_tokenize(f"{s.name} {s.description} {' '.join(s.triggers)} {' '.join(s.calls)}")):
+            postings.setdefault(tk, []).append(sid)
+        triggers.add_many(s.triggers, sid)
+    return {"skills": list(skills), "postings": postings, "triggers": triggers.build()}
+
+
+_SKILL_INDEX: Tuple[Tuple[Any, ...], Dict[str, Any]] | None = None
+
+
+def _skill_index_for(skills: List[SkillMeta]) -> Dict[str, Any]:
+    global _SKILL_INDEX
+    sig = _skill_signature(skills)
+    if _SKILL_INDEX is None or _SKILL_INDEX[0] != sig:
+        _SKILL_INDEX = (sig, compile_skill_index(skills))
+    return _SKILL_INDEX[1]
+
+
+def score_skills(text: str, index: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+    """(score, details) for every skill in `index`, in catalog order."""
+    skills = index["skills"]
+    tks = set(_tokenize(text))
+    overlap = [0] * len(skills)
+    postings = index["postings"]
+    for tk in tks:
+        for sid in postings.get(tk, ()):
+            overlap[sid] += 1
+    hits_by = index["triggers"].match(text)
+    denom = max(1, len(tks))
+    out: List[Tuple[float, Dict[str, Any]]] = []
+    for sid in range(len(skills)):
+        hits = hits_by.get(sid, [])
+        score = round(float(len(hits)) * 0.4 + min(1.0, overlap[sid] / denom) * 0.8, 4)
+        out.append((score, {"trigger_hits": hits, "token_overlap": overlap[sid]}))
+    return out
+
+
 def _research_score(text: str) -> Tuple[float, Dict[str, Any]]:
     low = text.lower()
     hits = [word for word in RESEARCH_WORDS if word in low]
@@ -204,11 +254,11 @@ def _plan_candidates(
         base_weight = max(base_weight, 0.95)
 
     skills = parse_all_skills(silent=True)
+    scored = score_skills(text, _skill_index_for(skills))
     rows: List[Dict[str, Any]] = []
-    for s in skills:
+    for s, (base, details) in zip(skills, scored):
         if s.name not in SUPPORTED_SKILLS:
             continue
-        base, details = _skill_score(text, s)
         mem = memory_rate(memory, s.name, prior=prior)
         final = round(base * base_weight + mem * memory_weight, 4)
         if final < min_skill_score:
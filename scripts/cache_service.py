@@ -4,8 +4,10 @@ AgentSystem 缓存服务层 - 全局缓存管理器
 
 功能：
 - 多级缓存管理（Tool/Skill/Context/Conversation）
-- 缓存生命周期自动管理（5分钟TTL）
+- 缓存生命周期自动管理（5分钟TTL，读取时惰性过期）
+- 按字节计量的统一容量上限与可选磁盘层（scripts/result_cache.py）
 - 缓存命中统计与成本优化
+- 工具调用结果缓存（与 ToolUseRouter / MCPCacheMiddleware 共享同一后端）
 
 使用示例：
     from scripts.cache_service import CacheService, cache_service
@@ -38,34 +40,28 @@ AgentSystem 缓存服务层 - 全局缓存管理器
 
 from __future__ import annotations
 
-import hashlib
-import json
-import time
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-ROOT = Path(__file__).resolve().parents[1]
-
+try:
+    from scripts.result_cache import ResultCache, shared_result_cache
+except ImportError:
+    from result_cache import ResultCache, shared_result_cache
 
-@dataclass
-class CacheEntry:
-    """缓存条目"""
-    key: str
-    value: Any
-    created_at: float
-    last_accessed: float
-    access_count: int = 0
-    ttl: int = 300  # 5分钟
+ROOT = Path(__file__).resolve().parents[1]
 
-    def is_valid(self) -> bool:
-        """检查缓存是否有效"""
-        return (time.time() - self.created_at) < self.ttl
+# 命名空间（共享缓存引擎中的键空间）
+TOOL_NS = "tool"
+SKILL_NS = "skill"
+CONTEXT_NS = "context"
+CONVERSATION_NS = "conversation"
+RESULTS_NS = "results"
+CACHE_TYPES = (TOOL_NS, SKILL_NS, CONTEXT_NS, CONVERSATION_NS)
 
-    def refresh(self):
-        """刷新缓存访问时间"""
-        self.last_accessed = time.time()
-        self.access_count += 1
+# 按序列化字节数粗略折算 token（会话缓存仍需随请求发送，不计入节省）
+BYTES_PER_TOKEN = 4
+TOKEN_SAVING_TYPES = (TOOL_NS, SKILL_NS, CONTEXT_NS)
 
 
 @dataclass
@@ -86,110 +82,42 @@ class CacheService:
     """
     全局缓存服务管理器
 
-    支持四级缓存：
-    1. Tool Cache - MCP工具定义缓存
-    2. Skill Cache - 技能系统提示缓存
-    3. Context Cache - 文档/背景信息缓存
-    4. Conversation Cache - 会话上下文缓存
+    四级缓存映射到共享缓存引擎（ResultCache）的命名空间：
+    1. Tool Cache - MCP工具定义缓存（按 server）
+    2. Skill Cache - 技能系统提示缓存（按 skill_name）
+    3. Context Cache - 文档/背景信息缓存（按 doc_id）
+    4. Conversation Cache - 会话上下文缓存（按 session_id）
+
+    容量按字节统一淘汰，TTL 在读取时惰性判断，命中统计与字节数由引擎记录。
     """
 
     DEFAULT_TTL = 300  # 5分钟
 
-    def __init__(self, ttl: int = DEFAULT_TTL):
+    def __init__(self, ttl: int = DEFAULT_TTL, result_cache: Optional[ResultCache] = None):
         self.ttl = ttl
-
-        # 四级缓存存储
-        self._tool_cache: Dict[str, CacheEntry] = {}
-        self._skill_cache: Dict[str, CacheEntry] = {}
-        self._context_cache: Dict[str, CacheEntry] = {}
-        self._conversation_cache: Dict[str, CacheEntry] = {}
-
-        # 统计信息
-        self._stats = CacheStats()
-
-        # 缓存键映射（用于追踪哪些内容被缓存）
-        self._tool_key_map: Dict[str, str] = {}  # server -> cache_key
-        self._skill_key_map: Dict[str, str] = {}  # skill_name -> cache_key
-        self._context_key_map: Dict[str, str] = {}  # doc_id -> cache_key
+        self.engine = result_cache or shared_result_cache()
+        # 兼容旧属性名：工具调用结果存放在 results 命名空间
+        self.results = self.engine
 
     # ==================== 工具缓存 ====================
 
     def cache_tools(self, server: str, tools_data: Dict[str, Any]):
         """缓存 MCP 工具定义"""
-        cache_key = self._generate_tool_key(server, tools_data)
-        self._tool_cache[cache_key] = CacheEntry(
-            key=cache_key,
-            value=tools_data,
-            created_at=time.time(),
-            last_accessed=time.time(),
-            ttl=self.ttl
-        )
-        self._tool_key_map[server] = cache_key
+        self.engine.set(server, tools_data, ttl=self.ttl, namespace=TOOL_NS)
 
     def get_cached_tools(self, server: str) -> Optional[Dict[str, Any]]:
         """获取缓存的工具定义"""
-        cache_key = self._tool_key_map.get(server)
-        if not cache_key:
-            self._stats.tool_misses += 1
-            return None
-
-        entry = self._tool_cache.get(cache_key)
-        if not entry or not entry.is_valid():
-            self._stats.tool_misses += 1
-            # 清理过期缓存
-            if cache_key in self._tool_cache:
-                del self._tool_cache[cache_key]
-            return None
-
-        entry.refresh()
-        self._stats.tool_hits += 1
-        # 估算节省的 tokens（假设工具定义平均 500 tokens）
-        self._stats.total_tokens_saved += 500
-        return entry.value
-
-    def _generate_tool_key(self, server: str, tools_data: Dict[str, Any]) -> str:
-        """生成工具缓存键"""
-        content = json.dumps(tools_data, sort_keys=True)
-        return f"tool:{server}:{hashlib.sha256(content.encode()).hexdigest()}"
+        return self.engine.get(server, namespace=TOOL_NS)
 
     # ==================== 技能缓存 ====================
 
     def cache_skill_prompt(self, skill_name: str, prompt_data: Dict[str, Any]):
         """缓存技能系统提示"""
-        cache_key = self._generate_skill_key(skill_name, prompt_data)
-        self._skill_cache[cache_key] = CacheEntry(
-            key=cache_key,
-            value=prompt_data,
-            created_at=time.time(),
-            last_accessed=time.time(),
-            ttl=self.ttl
-        )
-        self._skill_key_map[skill_name] = cache_key
+        self.engine.set(skill_name, prompt_data, ttl=self.ttl, namespace=SKILL_NS)
 
     def get_cached_skill_prompt(self, skill_name: str) -> Optional[Dict[str, Any]]:
         """获取缓存的技能提示"""
-        cache_key = self._skill_key_map.get(skill_name)
-        if not cache_key:
-            self._stats.skill_misses += 1
-            return None
-
-        entry = self._skill_cache.get(cache_key)
-        if not entry or not entry.is_valid():
-            self._stats.skill_misses += 1
-            if cache_key in self._skill_cache:
-                del self._skill_cache[cache_key]
-            return None
-
-        entry.refresh()
-        self._stats.skill_hits += 1
-        # 估算节省 tokens（假设系统提示平均 1000 tokens）
-        self._stats.total_tokens_saved += 1000
-        return entry.value
-
-    def _generate_skill_key(self, skill_name: str, prompt_data: Dict[str, Any]) -> str:
-        """生成技能缓存键"""
-        content = json.dumps(prompt_data, sort_keys=True)
-        return f"skill:{skill_name}:{hashlib.sha256(content.encode()).hexdigest()}"
+        return self.engine.get(skill_name, namespace=SKILL_NS)
 
     # ==================== 上下文缓存 ====================
 
@@ -199,15 +127,8 @@ class CacheService:
         summary_data: Dict[str, Any]
     ):
         """缓存文档摘要"""
-        cache_key = self._generate_context_key(doc_id, summary_data)
-        self._context_cache[cache_key] = CacheEntry(
-            key=cache_key,
-            value=summary_data,
-            created_at=time.time(),
-            last_accessed=time.time(),
-            ttl=self.ttl * 2  # 文档缓存时间更长（10分钟）
-        )
-        self._context_key_map[doc_id] = cache_key
+        # 文档缓存时间更长（10分钟）
+        self.engine.set(doc_id, summary_data, ttl=self.ttl * 2, namespace=CONTEXT_NS)
 
     def get_cached_document_summary(
         self,
@@ -215,33 +136,13 @@ class CacheService:
         query: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """获取缓存的文档摘要"""
-        cache_key = self._context_key_map.get(doc_id)
-        if not cache_key:
-            self._stats.context_misses += 1
-            return None
-
-        entry = self._context_cache.get(cache_key)
-        if not entry or not entry.is_valid():
-            self._stats.context_misses += 1
-            if cache_key in self._context_cache:
-                del self._context_cache[cache_key]
-            return None
-
-        # 如果提供了查询，检查是否相关
-        if query and "keywords" in entry.value:
-            if not self._is_relevant_to_query(entry.value.get("keywords", []), query):
-                return None
-
-        entry.refresh()
-        self._stats.context_hits += 1
-        # 估算节省 tokens（假设文档摘要平均 5000 tokens）
-        self._stats.total_tokens_saved += 5000
-        return entry.value
-
-    def _generate_context_key(self, doc_id: str, context_data: Dict[str, Any]) -> str:
-        """生成上下文缓存键"""
-        content = json.dumps(context_data, sort_keys=True)
-        return f"context:{doc_id}:{hashlib.sha256(content.encode()).hexdigest()}"
+        # 如果提供了查询，检查是否相关；不相关的摘要不返回，也不计为命中
+        def _relevant(value: Any) -> bool:
+            if query and isinstance(value, dict) and "keywords" in value:
+                return self._is_relevant_to_query(value.get("keywords", []), query)
+            return True
+
+        return self.engine.get(doc_id, namespace=CONTEXT_NS, accept=_relevant)
 
     def _is_relevant_to_query(self, keywords: List[str], query: str) -> bool:
         """检查缓存内容是否与查询相关"""
@@ -256,32 +157,14 @@ class CacheService:
         conversation_data: Dict[str, Any]
     ):
         """缓存会话上下文"""
-        cache_key = f"conv:{session_id}"
-        self._conversation_cache[cache_key] = CacheEntry(
-            key=cache_key,
-            value=conversation_data,
-            created_at=time.time(),
-            last_accessed=time.time(),
-            ttl=self.ttl
-        )
+        self.engine.set(session_id, conversation_data, ttl=self.ttl, namespace=CONVERSATION_NS)
 
     def get_cached_conversation(
         self,
         session_id: str
     ) -> Optional[Dict[str, Any]]:
         """获取缓存的会话上下文"""
-        cache_key = f"conv:{session_id}"
-        entry = self._conversation_cache.get(cache_key)
-
-        if not entry or not entry.is_valid():
-            self._stats.conversation_misses += 1
-            if cache_key in self._conversation_cache:
-                del self._conversation_cache[cache_key]
-            return None
-
-        entry.refresh()
-        self._stats.conversation_hits += 1
-        return entry.value
+        return self.engine.get(session_id, namespace=CONVERSATION_NS)
 
     def append_to_conversation(
         self,
@@ -296,114 +179,67 @@ class CacheService:
         cached["messages"].append(message)
         self.cache_conversation(session_id, cached)
 
+    # ==================== 调用结果缓存 ====================
+
+    def cache_call_result(self, key: str, result: Any, ttl: Optional[float] = None):
+        """缓存工具调用结果（ttl 为空时使用后端默认值）"""
+        self.engine.set(key, result, ttl=ttl, namespace=RESULTS_NS)
+
+    def get_cached_call_result(self, key: str) -> Optional[Any]:
+        """获取缓存的工具调用结果"""
+        return self.engine.get(key, namespace=RESULTS_NS)
+
     # ==================== 统计与管理 ====================
 
     def get_stats(self) -> CacheStats:
-        """获取缓存统计"""
-        return self._stats
+        """获取缓存统计（由引擎计数器汇总）"""
+        stats = CacheStats()
+        for ns in CACHE_TYPES:
+            ns_stats = self.engine.namespace_stats(ns)
+            setattr(stats, f"{ns}_hits", ns_stats["hits"])
+            setattr(stats, f"{ns}_misses", ns_stats["misses"])
+            if ns in TOKEN_SAVING_TYPES:
+                stats.total_tokens_saved += ns_stats["bytes_served"] // BYTES_PER_TOKEN
+        return stats
 
     def get_hit_rate(self, cache_type: str = "all") -> float:
         """获取缓存命中率"""
-        if cache_type == "tool":
-            total = self._stats.tool_hits + self._stats.tool_misses
-            return self._stats.tool_hits / total if total > 0 else 0.0
-        elif cache_type == "skill":
-            total = self._stats.skill_hits + self._stats.skill_misses
-            return self._stats.skill_hits / total if total > 0 else 0.0
-        elif cache_type == "context":
-            total = self._stats.context_hits + self._stats.context_misses
-            return self._stats.context_hits / total if total > 0 else 0.0
-        elif cache_type == "conversation":
-            total = self._stats.conversation_hits + self._stats.conversation_misses
-            return self._stats.conversation_hits / total if total > 0 else 0.0
-        else:
-            # 总体命中率
-            total_hits = (
-                self._stats.tool_hits +
-                self._stats.skill_hits +
-                self._stats.context_hits +
-                self._stats.conversation_hits
-            )
-            total = (
-                self._stats.tool_hits + self._stats.tool_misses +
-                self._stats.skill_hits + self._stats.skill_misses +
-                self._stats.context_hits + self._stats.context_misses +
-                self._stats.conversation_hits + self._stats.conversation_misses
-            )
-            return total_hits / total if total > 0 else 0.0
+        types = (cache_type,) if cache_type in CACHE_TYPES else CACHE_TYPES
+        hits = misses = 0
+        for ns in types:
+            ns_stats = self.engine.namespace_stats(ns)
+            hits += ns_stats["hits"]
+            misses += ns_stats["misses"]
+        total = hits + misses
+        return hits / total if total > 0 else 0.0
 
     def clear_all(self):
-        """清除所有缓存"""
-        self._tool_cache.clear()
-        self._skill_cache.clear()
-        self._context_cache.clear()
-        self._conversation_cache.clear()
-        self._tool_key_map.clear()
-        self._skill_key_map.clear()
-        self._context_key_map.clear()
-        self._stats = CacheStats()
-
-    def clear_expired(self):
-        """清除过期缓存"""
-        # 清除工具缓存
-        expired_tools = [
-            k for k, v in self._tool_cache.items() if not v.is_valid()
-        ]
-        for k in expired_tools:
-            del self._tool_cache[k]
-
-        # 清除技能缓存
-        expired_skills = [
-            k for k, v in self._skill_cache.items() if not v.is_valid()
-        ]
-        for k in expired_skills:
-            del self._skill_cache[k]
-
-        # 清除上下文缓存
-        expired_contexts = [
-            k for k, v in self._context_cache.items() if not v.is_valid()
-        ]
-        for k in expired_contexts:
-            del self._context_cache[k]
-
-        # 清除会话缓存
-        expired_convs = [
-            k for k, v in self._conversation_cache.items() if not v.is_valid()
-        ]
-        for k in expired_convs:
-            del self._conversation_cache[k]
+        """清除本服务的四级缓存（RESULTS_NS 由各路由器共享，不在此清除）"""
+        for ns in CACHE_TYPES:
+            self.engine.clear(ns)
+            self.engine.reset_stats(ns)
+
+    def clear_expired(self) -> int:
+        """主动清除过期缓存（读取时已惰性过期，这里只回收内存）"""
+        return sum(self.engine.purge_expired(ns) for ns in CACHE_TYPES)
 
     def get_cache_info(self) -> Dict[str, Any]:
         """获取缓存详细信息"""
-        return {
-            "tool_cache": {
-                "count": len(self._tool_cache),
-                "keys": list(self._tool_key_map.keys())
-            },
-            "skill_cache": {
-                "count": len(self._skill_cache),
-                "keys": list(self._skill_key_map.keys())
-            },
-            "context_cache": {
-                "count": len(self._context_cache),
-                "keys": list(self._context_key_map.keys())
-            },
-            "conversation_cache": {
-                "count": len(self._conversation_cache)
-            },
-            "stats": {
-                "tool_hits": self._stats.tool_hits,
-                "tool_misses": self._stats.tool_misses,
-                "skill_hits": self._stats.skill_hits,
-                "skill_misses": self._stats.skill_misses,
-                "context_hits": self._stats.context_hits,
-                "context_misses": self._stats.context_misses,
-                "conversation_hits": self._stats.conversation_hits,
-                "conversation_misses": self._stats.conversation_misses,
-                "total_tokens_saved": self._stats.total_tokens_saved,
-                "hit_rate": f"{self.get_hit_rate() * 100:.1f}%"
+        info: Dict[str, Any] = {}
+        for ns in CACHE_TYPES:
+            ns_stats = self.engine.namespace_stats(ns)
+            info[f"{ns}_cache"] = {
+                "count": ns_stats["entries"],
+                "bytes": ns_stats["bytes"],
+                "keys": self.engine.keys(ns),
             }
+        stats = self.get_stats()
+        info["stats"] = {
+            **{name: getattr(stats, name) for name in stats.__dataclass_fields__},
+            "hit_rate": f"{self.get_hit_rate() * 100:.1f}%",
         }
+        info["result_cache"] = self.engine.stats()
+        return info
 
 
 # 全局缓存服务实例
@@ -5,8 +5,10 @@ from __future__ import annotations
 
 import argparse
 import datetime as dt
+import hashlib
 import json
 import os
+import threading
 import tomllib
 from collections import Counter
 from pathlib import Path
@@ -15,15 +17,17 @@ from typing import Any, Dict, Iterable, List
 ROOT = Path(__file__).resolve().parents[1]
 ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
 CFG_DEFAULT = ROOT / "config" / "capability_catalog.toml"
+CACHE_DEFAULT = ROOT / "日志" / "agent_os" / "capability_catalog_cache.json"
+CACHE_VERSION = 1
 
 import sys
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 try:
-    from scripts.skill_parser import SkillMeta, parse_all_skills
+    from scripts.skill_parser import SKILL_DIR, SkillMeta, parse_all_skills, parse_skill_file
 except ModuleNotFoundError:  # direct script execution
-    from skill_parser import SkillMeta, parse_all_skills  # type: ignore
+    from skill_parser import SKILL_DIR, SkillMeta, parse_all_skills, parse_skill_file  # type: ignore
 
 
 def _now() -> str:
@@ -38,6 +42,7 @@ def load_cfg(path: Path = CFG_DEFAULT) -> Dict[str, Any]:
                 "out_json": str(ROOT / "日志" / "agent_os" / "capability_catalog_latest.json"),
                 "out_md": str(ROOT / "日志" / "agent_os" / "capability_catalog_latest.md"),
                 "contracts_cfg": str(ROOT / "config" / "skill_contracts.toml"),
+                "catalog_cache": str(CACHE_DEFAULT),
             },
             "layer_mapping": {},
         }
@@ -106,35 +111,163 @@ def _contract_checks(skill: SkillMeta, contracts: Dict[str, Any]) -> Dict[str, A
     return {"contract_score": score, "issues": issues, "maturity": maturity}
 
 
-def scan(skills: List[SkillMeta] | None = None, cfg: Dict[str, Any] | None = None) -> Dict[str, Any]:
+def _skill_row(skill: SkillMeta, layer_mapping: Dict[str, Any], contracts: Dict[str, Any]) -> Dict[str, Any]:
+    mapped = str(layer_mapping.get(skill.name, "")).strip()
+    layer = mapped if mapped else _heuristic_layer(skill.name, skill.description, skill.calls)
+    contract = _contract_checks(skill, contracts)
+    return {
+        "skill": skill.name,
+        "layer": layer,
+        "version": skill.version,
+        "description": skill.description,
+        "trigger_count": len(skill.triggers),
+        "parameter_count": len(skill.parameters),
+        "call_count": len(skill.calls),
+        "contract_score": contract["contract_score"],
+        "maturity": contract["maturity"],
+        "issues": contract["issues"],
+    }
+
+
+def _sha256_file(path: Path) -> str:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return ""
+
+
+# Warm-process state: {cache_path: {"entries": {...}, "hashes": {...}}}; entries mirror the on-disk cache.
+_CATALOG_STATE: Dict[str, Dict[str, Any]] = {}
+_CONTRACTS_MEMO: Dict[str, tuple] = {}
+
+
+def _catalog_state(cache_path: Path) -> Dict[str, Any]:
+    key = str(cache_path)
+    state = _CATALOG_STATE.get(key)
+    if state is None:
+        entries: Dict[str, Any] = {}
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("version") == CACHE_VERSION and isinstance(cached.get("entries"), dict):
+                entries = cached["entries"]
+        except (OSError, ValueError):
+            entries = {}
+        state = {"entries": entries, "hashes": {}}
+        _CATALOG_STATE[key] = state
+    return state
+
+
+def _file_hash(state: Dict[str, Any], path: Path) -> str:
+    """sha256 of a file, re-read only when its (mtime_ns, size) stamp moves."""
+    try:
+        st = path.stat()
+    except OSError:
+        return ""
+    stamp = [st.st_mtime_ns, st.st_size]
+    hit = state["hashes"].get(str(path))
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    digest = _sha256_file(path)
+    state["hashes"][str(path)] = (stamp, digest)
+    return digest
+
+
+def _load_contracts_cached(path: Path, digest: str) -> Dict[str, Any]:
+    hit = _CONTRACTS_MEMO.get(str(path))
+    if hit is not None and hit[0] == digest:
+        return hit[1]
+    contracts = _load_contract_registry(path)
+    _CONTRACTS_MEMO[str(path)] = (digest, contracts)
+    return contracts
+
+
+def _incremental_rows(
+    skill_dir: Path,
+    cache_path: Path,
+    contracts_cfg: Path,
+    payload: Dict[str, Any],
+) -> tuple:
+    """Skill rows for every file in `skill_dir`, recomputing only files whose
+    (skill hash, contracts hash, cfg hash) key changed since the cached report."""
+    state = _catalog_state(cache_path)
+    contracts_hash = _file_hash(state, contracts_cfg)
+    cfg_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+    layer_mapping = payload.get("layer_mapping", {}) if isinstance(payload, dict) else {}
+    contracts: Dict[str, Any] | None = None
+
+    entries: Dict[str, Any] = state["entries"]
+    seen: set[str] = set()
+    rows: List[Dict[str, Any]] = []
+    recomputed = 0
+    for md_file in skill_dir.glob("*.md"):
+        if "references" in md_file.parts:
+            continue
+        fkey = str(md_file)
+        seen.add(fkey)
+        key = f"{_file_hash(state, md_file)}:{contracts_hash}:{cfg_hash}"
+        entry = entries.get(fkey)
+        if entry is None or entry.get("key") != key:
+            if contracts is None:
+                contracts = _load_contracts_cached(contracts_cfg, contracts_hash)
+            skill = parse_skill_file(md_file, silent=True)
+            entry = {"key": key, "row": _skill_row(skill, layer_mapping, contracts) if skill else None}
+            entries[fkey] = entry
+            recomputed += 1
+        if entry["row"] is not None:
+            rows.append(dict(entry["row"], issues=list(entry["row"]["issues"])))
+    stale = [k for k in entries if k not in seen and Path(k).parent == skill_dir]
+    for k in stale:
+        entries.pop(k, None)
+
+    if recomputed or stale:
+        # per-process/thread temp name: concurrent scans never interleave writes into one file
+        tmp = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"version": CACHE_VERSION, "entries": entries}, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, cache_path)
+        except OSError:
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+    if contracts is None:
+        contracts = _load_contracts_cached(contracts_cfg, contracts_hash)
+    return rows, contracts, recomputed
+
+
+def scan(
+    skills: List[SkillMeta] | None = None,
+    cfg: Dict[str, Any] | None = None,
+    skill_dir: Path | None = None,
+    cache_path: Path | None = None,
+) -> Dict[str, Any]:
+    """Build the catalog report.
+
+    Without explicit `skills`, rows come from the incremental cache: only skill
+    files whose content, the contracts file or the catalog cfg changed are
+    re-parsed and re-checked.
+    """
     payload = cfg or load_cfg(CFG_DEFAULT)
     defaults = payload.get("defaults", {}) if isinstance(payload.get("defaults", {}), dict) else {}
     contracts_cfg = Path(str(defaults.get("contracts_cfg", ROOT / "config" / "skill_contracts.toml")))
-    contracts = _load_contract_registry(contracts_cfg)
     layer_mapping = payload.get("layer_mapping", {}) if isinstance(payload, dict) else {}
     builtins = payload.get("builtins", {}) if isinstance(payload, dict) else {}
     rows: List[Dict[str, Any]] = []
     gaps: List[Dict[str, Any]] = []
+    recomputed = None
 
-    for skill in (skills if skills is not None else parse_all_skills(silent=True)):
-        mapped = str(layer_mapping.get(skill.name, "")).strip()
-        layer = mapped if mapped else _heuristic_layer(skill.name, skill.description, skill.calls)
-        contract = _contract_checks(skill, contracts)
-        row = {
-            "skill": skill.name,
-            "layer": layer,
-            "version": skill.version,
-            "description": skill.description,
-            "trigger_count": len(skill.triggers),
-            "parameter_count": len(skill.parameters),
-            "call_count": len(skill.calls),
-            "contract_score": contract["contract_score"],
-            "maturity": contract["maturity"],
-            "issues": contract["issues"],
-        }
-        rows.append(row)
-        if contract["issues"]:
-            gaps.append({"skill": skill.name, "issues": contract["issues"]})
+    if skills is not None:
+        contracts = _load_contract_registry(contracts_cfg)
+        rows = [_skill_row(skill, layer_mapping, contracts) for skill in skills]
+    else:
+        if cache_path is None:
+            cache_path = Path(str(defaults.get("catalog_cache", CACHE_DEFAULT)))
+            cache_path = cache_path if cache_path.is_absolute() else ROOT / cache_path
+        rows, contracts, recomputed = _incremental_rows(skill_dir or SKILL_DIR, cache_path, contracts_cfg, payload)
+    for row in rows:
+        if row["issues"]:
+            gaps.append({"skill": row["skill"], "issues": row["issues"]})
 
     for name, meta in (builtins.items() if isinstance(builtins, dict) else []):
         if any(str(r.get("skill", "")) == str(name) for r in rows):
@@ -164,7 +297,7 @@ def scan(skills: List[SkillMeta] | None = None, cfg: Dict[str, Any] | None = Non
         sum(int(r["contract_score"]) for r in rows) / max(1, len(rows)),
         2,
     )
-    return {
+    report = {
         "ts": _now(),
         "summary": {
             "skills_total": len(rows),
@@ -176,6 +309,9 @@ def scan(skills: List[SkillMeta] | None = None, cfg: Dict[str, Any] | None = Non
         "skills": rows,
         "gaps": gaps,
     }
+    if recomputed is not None:
+        report["cache"] = {"path": str(cache_path), "recomputed": recomputed}
+    return report
 
 
 def render_md(report: Dict[str, Any]) -> str:
@@ -7,6 +7,11 @@ import re
 import sqlite3
 from pathlib import Path
 
+try:
+    from scripts.knowledge_index import search_passages
+except ImportError:
+    from knowledge_index import search_passages
+
 
 POLICY_KEYWORDS = {
     "政策",
@@ -159,54 +164,23 @@ def build_fts_queries(topic: str, tokens, scope):
 
 def fetch_candidates(db, queries, per_query_limit=24):
     conn = sqlite3.connect(db)
-    cur = conn.cursor()
-    cols = {r[1] for r in cur.execute("PRAGMA table_info(docs)").fetchall()}
-    has_domain = "domain" in cols
-
-    if has_domain:
-        sql = """
-        SELECT d.title, d.path, d.updated_date, d.source_url, d.confidence,
-               COALESCE(d.domain, '') AS domain,
-               snippet(docs_fts, 2, '[', ']', '...', 18) AS snip,
-               bm25(docs_fts) AS bm
-        FROM docs_fts
-        JOIN docs d ON d.path = docs_fts.path
-        WHERE docs_fts MATCH ?
-        ORDER BY bm
-        LIMIT ?
-        """
-    else:
-        sql = """
-        SELECT d.title, d.path, d.updated_date, d.source_url, d.confidence,
-               '' AS domain,
-               snippet(docs_fts, 2, '[', ']', '...', 18) AS snip,
-               bm25(docs_fts) AS bm
-        FROM docs_fts
-        JOIN docs d ON d.path = docs_fts.path
-        WHERE docs_fts MATCH ?
-        ORDER BY bm
-        LIMIT ?
-        """
-
     by_path = {}
     for q in queries:
         try:
-            rows = cur.execute(sql, (q, per_query_limit)).fetchall()
+            docs = search_passages(conn, q, per_query_limit, per_doc=1, snippet_tokens=18)
         except sqlite3.OperationalError:
             continue
-        for row in rows:
-            title, path, updated, source_url, conf, domain, snip, bm = row
-            if not domain:
-                domain = infer_domain_from_path(path)
+        for doc in docs:
+            path = doc["path"]
             item = {
-                "title": title,
+                "title": doc["title"],
                 "path": path,
-                "updated_date": updated,
-                "source_url": source_url,
-                "confidence": float(conf or 0),
-                "domain": domain,
-                "snippet": snip or "",
-                "bm25": float(bm),
+                "updated_date": doc["updated_date"],
+                "source_url": doc["source_url"],
+                "confidence": doc["confidence"],
+                "domain": doc["domain"] or infer_domain_from_path(path),
+                "snippet": doc["passages"][0]["snippet"],
+                "bm25": doc["bm25"],
             }
             old = by_path.get(path)
             if old is None or abs(item["bm25"]) < abs(old["bm25"]):
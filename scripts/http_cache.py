@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Shared on-disk HTTP GET cache with conditional revalidation and an offline mode.
+
+Bodies are stored content-addressed (`bodies/<sha[:2]>/<sha256>`), so identical payloads
+served under several URLs are kept once; a small sqlite index maps each URL to its body,
+validators (ETag / Last-Modified) and fetch time. A lookup is served from disk while it is
+younger than the caller's `max_age`; older entries are revalidated with If-None-Match /
+If-Modified-Since (a 304 only refreshes the timestamp). In offline mode — or when the
+network fails — whatever is on disk is served as `stale`.
+
+The cache is bounded: a URL re-stored with new content drops its superseded body, and
+after a store (at most once per `prune_interval`) entries not validated within
+`max_entry_age` are expired, then the least recently validated ones are evicted until
+the bodies fit `max_body_bytes`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
+DEFAULT_DIR = ROOT / "日志" / "http_cache"
+DIR_ENV = "AGENTSYSTEM_HTTP_CACHE_DIR"
+OFFLINE_ENV = "AGENTSYSTEM_HTTP_OFFLINE"
+DEFAULT_MAX_AGE = 3600.0
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MAX_ENTRY_AGE = 14 * 86400.0
+DEFAULT_MAX_BODY_BYTES = 256 * 1024 * 1024
+DEFAULT_PRUNE_INTERVAL = 300.0
+# unreferenced body / temp files younger than this may belong to a store still in progress
+ORPHAN_GRACE = 60.0
+
+Opener = Callable[[urllib.request.Request, float], Any]
+
+
+class OfflineCacheMiss(LookupError):
+    """Offline mode and nothing cached for the URL."""
+
+
+def _default_opener(req: urllib.request.Request, timeout: float):
+    return urllib.request.urlopen(req, timeout=timeout, context=ssl.create_default_context())
+
+
+def _decode_body(raw: bytes, encoding: str) -> bytes:
+    encoding = (encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(raw)
+        except zlib.error:
+            return zlib.decompress(raw, -zlib.MAX_WBITS)
+    return raw
+
+
+class HttpCache:
+    def __init__(
+        self,
+        root: Path = DEFAULT_DIR,
+        offline: bool = False,
+        max_entry_age: float = DEFAULT_MAX_ENTRY_AGE,
+        max_body_bytes: int = DEFAULT_MAX_BODY_BYTES,
+        prune_interval: float = DEFAULT_PRUNE_INTERVAL,
+    ):
+        self.root = Path(root)
+        self.offline = bool(offline)
+        self.max_entry_age = float(max_entry_age)
+        self.max_body_bytes = int(max_body_bytes)
+        self.prune_interval = float(prune_interval)
+        self._next_prune = 0.0
+        self._prune_lock = threading.Lock()
+        self.bodies = self.root / "bodies"
+        self.bodies.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "index.db"
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                  url TEXT PRIMARY KEY,
+                  body_sha TEXT NOT NULL,
+                  status INTEGER NOT NULL,
+                  content_type TEXT NOT NULL DEFAULT '',
+                  etag TEXT NOT NULL DEFAULT '',
+                  last_modified TEXT NOT NULL DEFAULT '',
+                  fetched_at REAL NOT NULL,
+                  validated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _body_path(self, sha: str) -> Path:
+        return self.bodies / sha[:2] / sha
+
+    def _put_body(self, body: bytes) -> str:
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._body_path(sha)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{sha}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(body)
+            os.replace(tmp, path)
+        return sha
+
+    def _drop_body_if_unreferenced(self, sha: str) -> None:
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM responses WHERE body_sha = ? LIMIT 1", (sha,)).fetchone() is None:
+                self._body_path(sha).unlink(missing_ok=True)
+
+    def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        with self._prune_lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.prune_interval
+        try:
+            self.prune()
+        except (OSError, sqlite3.Error):
+            pass
+
+    def _lookup(self, url: str) -> Optional[sqlite3.Row]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is not None and not self._body_path(row["body_sha"]).exists():
+            return None
+        return row
+
+    def _serve(self, row: sqlite3.Row, state: str) -> Dict[str, Any]:
+        return {
+            "url": row["url"],
+            "status": int(row["status"]),
+            "content_type": row["content_type"],
+            "body": self._body_path(row["body_sha"]).read_bytes(),
+            "cache": state,
+            "fetched_at": float(row["fetched_at"]),
+        }
+
+    def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        *,
+        max_age: float = DEFAULT_MAX_AGE,
+        timeout: float = DEFAULT_TIMEOUT,
+        offline: Optional[bool] = None,
+        stale_on_error: bool = True,
+        max_bytes: Optional[int] = None,
+        opener: Optional[Opener] = None,
+    ) -> Dict[str, Any]:
+        """GET `url` through the cache.
+
+        The result's `cache` is one of fresh / revalidated / miss / stale. Network errors
+        propagate unless a cached copy exists and `stale_on_error` is set.
+        """
+        row = self._lookup(url)
+        now = time.time()
+        if row is not None and now - float(row["validated_at"]) < max_age:
+            return self._serve(row, "fresh")
+        if self.offline if offline is None else offline:
+            if row is None:
+                raise OfflineCacheMiss(f"offline and not cached: {url}")
+            return self._serve(row, "stale")
+
+        req_headers = dict(headers or {})
+        if row is not None:
+            if row["etag"]:
+                req_headers["If-None-Match"] = row["etag"]
+            if row["last_modified"]:
+                req_headers["If-Modified-Since"] = row["last_modified"]
+        req = urllib.request.Request(url=url, method="GET", headers=req_headers)
+        try:
+            with (opener or _default_opener)(req, timeout) as resp:
+                raw = resp.read() if max_bytes is None else resp.read(max_bytes)
+                status = int(getattr(resp, "status", 200))
+                resp_headers = resp.headers
+        except urllib.error.HTTPError as exc:
+            if exc.code == 304 and row is not None:
+                with self._connect() as conn:
+                    conn.execute("UPDATE responses SET validated_at = ? WHERE url = ?", (now, url))
+                    conn.commit()
+                return self._serve(row, "revalidated")
+            if row is not None and stale_on_error:
+                return self._serve(row, "stale")
+            raise
+        except Exception:
+            if row is not None and stale_on_error:
+                return self._serve(row, "stale")
+            raise
+
+        body = raw
+        if max_bytes is None or len(raw) < max_bytes:
+            # a compressed body cut at max_bytes cannot be decoded; it is kept as read
+            body = _decode_body(raw, resp_headers.get("Content-Encoding", ""))
+        sha = self._put_body(body)
+        content_type = str(resp_headers.get("Content-Type", "") or "")
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO responses(url, body_sha, status, content_type, etag, last_modified, fetched_at, validated_at)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                  body_sha=excluded.body_sha,
+                  status=excluded.status,
+                  content_type=excluded.content_type,
+                  etag=excluded.etag,
+                  last_modified=excluded.last_modified,
+                  fetched_at=excluded.fetched_at,
+                  validated_at=excluded.validated_at
+                """,
+                (
+                    url,
+                    sha,
+                    status,
+                    content_type,
+                    str(resp_headers.get("ETag", "") or ""),
+                    str(resp_headers.get("Last-Modified", "") or ""),
+                    now,
+                    now,
+                ),
+            )
+            conn.commit()
+        if row is not None and row["body_sha"] != sha:
+            self._drop_body_if_unreferenced(row["body_sha"])
+        self._maybe_prune()
+        return {"url": url, "status": status, "content_type": content_type, "body": body, "cache": "miss", "fetched_at": now}
+
+    def get_json(self, url: str, headers: Optional[Dict[str, str]] = None, **kwargs: Any) -> Any:
+        return json.loads(self.get(url, headers, **kwargs)["body"].decode("utf-8"))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, oldest = conn.execute("SELECT COUNT(*), MIN(validated_at) FROM responses").fetchone()
+            bodies = conn.execute("SELECT COUNT(DISTINCT body_sha) FROM responses").fetchone()[0]
+        size = sum(p.stat().st_size for p in self.bodies.glob("*/*") if p.is_file())
+        return {"root": str(self.root), "entries": entries, "bodies": bodies, "body_bytes": size, "oldest_validated_at": oldest}
+
+    def prune(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Expire old entries, evict least recently validated ones over the byte budget, drop orphan bodies."""
+        now = time.time() if now is None else now
+        sizes: Dict[str, int] = {}
+        settled = set()
+        for path in self.bodies.glob("*/*"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if path.suffix == ".tmp":
+                if now - st.st_mtime > ORPHAN_GRACE:
+                    path.unlink(missing_ok=True)
+                continue
+            sizes[path.name] = st.st_size
+            if now - st.st_mtime > ORPHAN_GRACE:
+                settled.add(path.name)
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM responses WHERE validated_at < ?", (now - self.max_entry_age,)).rowcount
+            rows = conn.execute("SELECT url, body_sha FROM responses ORDER BY validated_at").fetchall()
+            refs: Dict[str, int] = {}
+            for row in rows:
+                refs[row["body_sha"]] = refs.get(row["body_sha"], 0) + 1
+            removed = 0
+            for sha in [sha for sha in sizes if sha not in refs and sha in settled]:
+                self._body_path(sha).unlink(missing_ok=True)
+                del sizes[sha]
+                removed += 1
+            total = sum(sizes.values())
+            evicted = []
+            for row in rows:
+                if total <= self.max_body_bytes:
+                    break
+                evicted.append((row["url"],))
+                refs[row["body_sha"]] -= 1
+                if refs[row["body_sha"]] == 0 and row["body_sha"] in sizes:
+                    self._body_path(row["body_sha"]).unlink(missing_ok=True)
+                    total -= sizes.pop(row["body_sha"])
+                    removed += 1
+            conn.executemany("DELETE FROM responses WHERE url = ?", evicted)
+            conn.commit()
+        return {"expired_entries": expired, "evicted_entries": len(evicted), "removed_bodies": removed, "body_bytes": total}
+
+
+_SHARED: Optional[HttpCache] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_http_cache() -> HttpCache:
+    """Process-wide cache; AGENTSYSTEM_HTTP_CACHE_DIR relocates it, AGENTSYSTEM_HTTP_OFFLINE=1 serves disk only."""
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            raw = os.getenv(DIR_ENV, "").strip()
+            root = DEFAULT_DIR
+            if raw:
+                root = Path(raw) if Path(raw).is_absolute() else ROOT / raw
+            offline = os.getenv(OFFLINE_ENV, "").strip().lower() in {"1", "true", "yes"}
+            _SHARED = HttpCache(root, offline=offline)
+        return _SHARED
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Shared HTTP response cache")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("prune")
+    args = parser.parse_args()
+    cache = shared_http_cache()
+    if args.cmd == "prune":
+        print(json.dumps(cache.prune(), ensure_ascii=False))
+    else:
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Aho-Corasick multi-keyword matcher shared by the skill router and MCP router."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+
+class KeywordAutomaton:
+    """Case-insensitive substring matcher over many keywords.
+
+    Each keyword carries payloads (typically rule ids). `match` scans the text
+    once and returns {payload: [keywords hit]}, with keywords in the order they
+    were added for that payload, so callers get the same hit lists as a
+    `kw.lower() in text.lower()` loop, at a cost independent of the rule count.
+    """
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+        self._entries: List[Tuple[Hashable, int, Any]] = []
+        self._always: List[int] = []
+        self._built = False
+
+    def add(self, keyword: Any, payload: Hashable, order: int = 0) -> None:
+        """Register `keyword` for `payload`; `order` ranks hits within that payload."""
+        entry = len(self._entries)
+        self._entries.append((payload, order, keyword))
+        pattern = str(keyword).lower()
+        if not pattern:
+            self._always.append(entry)
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(entry)
+        self._built = False
+
+    def add_many(self, keywords: Iterable[Any], payload: Hashable) -> None:
+        for idx, kw in enumerate(keywords):
+            self.add(kw, payload, order=idx)
+
+    def build(self) -> "KeywordAutomaton":
+        queue: deque = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def matched_entries(self, text: str) -> List[int]:
+        if not self._built:
+            self.build()
+        seen = set(self._always)
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        for ch in text.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                seen.update(out[node])
+        return sorted(seen)
+
+    def match(self, text: str) -> Dict[Hashable, List[Any]]:
+        grouped: Dict[Hashable, List[Tuple[int, Any]]] = {}
+        for entry in self.matched_entries(text):
+            payload, order, keyword = self._entries[entry]
+            grouped.setdefault(payload, []).append((order, keyword))
+        return {p: [kw for _o, kw in sorted(hits, key=lambda x: x[0])] for p, hits in grouped.items()}
@@ -1,26 +1,92 @@
 #!/usr/bin/env python3
 import argparse
+import ctypes
+import ctypes.util
 import datetime as dt
 import hashlib
+import json
 import os
 import re
+import select
 import sqlite3
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 
 TITLE_RE = re.compile(r"^#\s+(.+)$")
 SOURCE_URL_RE = re.compile(r"(https?://\S+)")
 DATE_RE = re.compile(r"(20\d{2}-\d{2}-\d{2})")
+# CJK runs are indexed as overlapping bigrams in the `cjk` column: unicode61
+# would otherwise treat a whole run of Chinese characters as a single token.
+CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+CJK_SPLIT_RE = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)")
+FTS_OPERATORS = {"AND", "OR", "NOT"}
+DOC_COLUMNS = [
+    "id",
+    "path",
+    "title",
+    "updated_date",
+    "source_url",
+    "source_hash",
+    "confidence",
+    "domain",
+    "file_mtime",
+    "content_hash",
+    "indexed_at",
+]
+PASSAGE_COLUMNS = ["id", "doc_id", "ord", "heading", "start_offset", "end_offset", "line", "text", "cjk"]
+FTS_COLUMNS = ["heading", "text", "cjk"]
+# Documents are indexed as heading-aware passages of at most this many characters.
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+SENTENCE_END_RE = re.compile(r"[。！？；!?;.]\s*|\n")
+PASSAGE_MAX_CHARS = 800
+PASSAGES_PER_DOC = 3
+# Below this many changed files a process pool costs more than it saves.
+PARALLEL_MIN_FILES = 64
+WRITE_BATCH = 256
+SKIP_DIRS = {"日志", "templates"}
+RRF_K = 60
+# Text window around the first CJK term; FTS snippet() cannot highlight hits in the cjk column.
+SNIPPET_WINDOW_SQL = "substr(p.text, max(1, instr(p.text, ?) - 24), 96)"
 
 
-def connect(db_path):
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    conn.execute("PRAGMA journal_mode=WAL;")
+SYNC_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS passages_ai AFTER INSERT ON passages BEGIN
+      INSERT INTO passages_fts(rowid, heading, text, cjk) VALUES (new.id, new.heading, new.text, new.cjk);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS passages_ad AFTER DELETE ON passages BEGIN
+      INSERT INTO passages_fts(passages_fts, rowid, heading, text, cjk) VALUES ('delete', old.id, old.heading, old.text, old.cjk);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS passages_au AFTER UPDATE OF heading, text, cjk ON passages
+    WHEN old.heading IS NOT new.heading OR old.text IS NOT new.text OR old.cjk IS NOT new.cjk
+    BEGIN
+      INSERT INTO passages_fts(passages_fts, rowid, heading, text, cjk) VALUES ('delete', old.id, old.heading, old.text, old.cjk);
+      INSERT INTO passages_fts(rowid, heading, text, cjk) VALUES (new.id, new.heading, new.text, new.cjk);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+      DELETE FROM passages WHERE doc_id = old.id;
+    END
+    """,
+]
+TRIGGER_NAMES = ["passages_ai", "passages_ad", "passages_au", "docs_ad", "docs_ai", "docs_au"]
+
+
+def _create_schema(conn):
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS docs (
-          path TEXT PRIMARY KEY,
+          id INTEGER PRIMARY KEY,
+          path TEXT NOT NULL UNIQUE,
           title TEXT,
           updated_date TEXT,
           source_url TEXT,
@@ -33,23 +99,172 @@ def connect(db_path):
         )
         """
     )
+    # one row per heading-aware passage; offsets are character positions in the source file text
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS passages (
+          id INTEGER PRIMARY KEY,
+          doc_id INTEGER NOT NULL,
+          ord INTEGER NOT NULL,
+          heading TEXT,
+          start_offset INTEGER NOT NULL,
+          end_offset INTEGER NOT NULL,
+          line INTEGER NOT NULL,
+          text TEXT,
+          cjk TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS passages_doc ON passages(doc_id, ord)")
+    # external-content FTS keyed by passages.id: the index stores no copy of the text,
+    # and lookups/deletes go through rowids instead of scanning
     conn.execute(
         """
-        CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts
-        USING fts5(path, title, content, tokenize='unicode61')
+        CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts
+        USING fts5(heading, text, cjk, content='passages', content_rowid='id', tokenize='unicode61')
+        """
+    )
+    for stmt in SYNC_TRIGGERS:
+        conn.execute(stmt)
+
+
+def _drop_schema(conn):
+    # individual statements: executescript() would commit the caller's open transaction
+    for name in TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for table in ("passages_fts", "passages", "docs_fts", "docs"):
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def connect(db_path):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    expected = {"docs": DOC_COLUMNS, "passages": PASSAGE_COLUMNS, "passages_fts": FTS_COLUMNS, "docs_fts": []}
+    for table, cols in expected.items():
+        found = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if found and found != cols:
+            # older layout (whole-document FTS rows): the index is derived data, so drop it
+            # and let the next build re-index everything
+            _drop_schema(conn)
+            break
+    _create_schema(conn)
+    # directory manifest: lets incremental scans skip listing directories whose mtime is unchanged
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dir_manifest (
+          dir TEXT PRIMARY KEY,
+          mtime_ns INTEGER NOT NULL,
+          subdirs TEXT NOT NULL,
+          files TEXT NOT NULL
+        )
         """
     )
-    # compatible schema migration
-    cols = {r[1] for r in conn.execute("PRAGMA table_info(docs)").fetchall()}
-    if "file_mtime" not in cols:
-        conn.execute("ALTER TABLE docs ADD COLUMN file_mtime INTEGER DEFAULT 0")
-    if "content_hash" not in cols:
-        conn.execute("ALTER TABLE docs ADD COLUMN content_hash TEXT DEFAULT ''")
-    if "domain" not in cols:
-        conn.execute("ALTER TABLE docs ADD COLUMN domain TEXT DEFAULT ''")
     return conn
 
 
+def bump_generation(conn):
+    """Advance the index generation; cached search results keyed on an older one go stale."""
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+    conn.execute(
+        "INSERT INTO meta(k, v) VALUES('generation', '1') "
+        "ON CONFLICT(k) DO UPDATE SET v = CAST(CAST(v AS INTEGER) + 1 AS TEXT)"
+    )
+
+
+def index_generation(conn):
+    try:
+        row = conn.execute("SELECT v FROM meta WHERE k = 'generation'").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def cjk_bigrams(text):
+    """Space-separated overlapping bigrams of every CJK run (single characters kept as-is)."""
+    out = []
+    for run in CJK_RUN_RE.findall(text or ""):
+        if len(run) == 1:
+            out.append(run)
+        else:
+            out.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return " ".join(out)
+
+
+def cjk_segment(text):
+    """Content of the cjk column: bigrams of CJK runs plus Latin fragments glued to them.
+
+    unicode61 reads "支付SaaS市场" as one token, so "saas" is only findable through this column.
+    """
+    out = []
+    for word in re.findall(r"\w+", text or ""):
+        if not CJK_RUN_RE.search(word):
+            continue
+        for chunk in CJK_SPLIT_RE.split(word):
+            if not chunk:
+                continue
+            out.append(cjk_bigrams(chunk) if CJK_RUN_RE.fullmatch(chunk) else chunk)
+    return " ".join(out)
+
+
+def cjk_terms(query):
+    return CJK_RUN_RE.findall(query or "")
+
+
+def _cjk_phrase(run):
+    if len(run) == 1:
+        # no unigram tokens: a lone character matches as a bigram prefix
+        return f"cjk : {run}*"
+    return 'cjk : "' + cjk_bigrams(run) + '"'
+
+
+def fts_match_query(query):
+    """Rewrite a user query for MATCH: CJK runs become bigram phrases on the cjk column.
+
+    Queries without CJK characters are passed through untouched, so FTS5 syntax keeps working.
+    AND/OR/NOT survive the rewrite; other punctuation inside CJK queries is dropped.
+    """
+    if not CJK_RUN_RE.search(query or ""):
+        return query
+    parts = []
+    for term in query.split():
+        if term in FTS_OPERATORS:
+            if parts and parts[-1] not in FTS_OPERATORS:
+                parts.append(term)
+            continue
+        pieces = []
+        for chunk in CJK_SPLIT_RE.split(term):
+            if not chunk:
+                continue
+            if CJK_RUN_RE.fullmatch(chunk):
+                pieces.append(_cjk_phrase(chunk))
+            else:
+                pieces.extend(f'"{w}"' for w in re.findall(r"\w+", chunk))
+        if len(pieces) > 1:
+            parts.append("(" + " AND ".join(pieces) + ")")
+        elif pieces:
+            parts.append(pieces[0])
+    while parts and parts[-1] in FTS_OPERATORS:
+        parts.pop()
+    # FTS5 rejects implicit AND before a column filter, so spell it out
+    out = []
+    for part in parts:
+        if out and out[-1] not in FTS_OPERATORS and part not in FTS_OPERATORS:
+            out.append("AND")
+        out.append(part)
+    return " ".join(out)
+
+
+def display_snippet(fts_snippet, window, query):
+    """Use the FTS snippet unless the hit was CJK-only; then highlight terms inside `window`."""
+    terms = cjk_terms(query)
+    if not terms or "[" in (fts_snippet or "") or not window:
+        return fts_snippet
+    pattern = "|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True))
+    text = re.sub(r"\s+", " ", window).strip()
+    return "..." + re.sub(f"({pattern})", r"[\1]", text) + "..."
+
+
 def content_hash(text):
     return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
 
@@ -136,14 +351,105 @@ def infer_domain(path: Path):
     return "generic"
 
 
-def extract_doc(path: Path):
+def _split_long(text, start, end, max_chars):
+    """Cut [start, end) into spans of at most max_chars, preferring sentence ends."""
+    spans = []
+    while end - start > max_chars:
+        cut = 0
+        for m in SENTENCE_END_RE.finditer(text, start + max_chars // 2, start + max_chars):
+            cut = m.end()
+        cut = cut or start + max_chars
+        spans.append((start, cut))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    if start < end:
+        spans.append((start, end))
+    return spans
+
+
+def chunk_passages(text, title="", max_chars=PASSAGE_MAX_CHARS):
+    """Split markdown into heading-aware passages.
+
+    Each passage belongs to one section and carries the heading trail (document title
+    first), its [start, end) character offsets into `text` and 1-based start line.
+    Paragraphs are packed up to `max_chars`; longer ones are cut at sentence ends.
+    """
+    title = (title or "").strip()
+    stack = []
+    paragraphs = []  # (start, end, line) of the current section
+    passages = []
+
+    def heading_trail():
+        trail = [h for _level, h in stack]
+        if title and (not trail or trail[0] != title):
+            trail.insert(0, title)
+        return " > ".join(trail)
+
+    def flush_section():
+        heading = heading_trail()
+        spans = []
+        for start, end, line in paragraphs:
+            for a, b in _split_long(text, start, end, max_chars):
+                spans.append((a, b, line + text.count("\n", start, a)))
+        cur = None
+        for a, b, line in spans:
+            if cur is not None and b - cur[0] <= max_chars:
+                cur[1] = b
+                continue
+            if cur is not None:
+                passages.append((heading, *cur))
+            cur = [a, b, line]
+        if cur is not None:
+            passages.append((heading, *cur))
+        paragraphs.clear()
+
+    offset = 0
+    para = None
+    for lineno, raw in enumerate(text.splitlines(keepends=True), start=1):
+        line = raw.rstrip("\r\n")
+        m = HEADING_RE.match(line)
+        if m or not line.strip():
+            if para is not None:
+                paragraphs.append(tuple(para))
+                para = None
+            if m:
+                flush_section()
+                level = len(m.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, m.group(2).strip()))
+        else:
+            lead = len(line) - len(line.lstrip())
+            end = offset + len(line.rstrip())
+            if para is None:
+                para = [offset + lead, end, lineno]
+            else:
+                para[1] = end
+        offset += len(raw)
+    if para is not None:
+        paragraphs.append(tuple(para))
+    flush_section()
+
+    if not passages:
+        # heading-only or empty file: one passage so the document stays findable by title
+        start = len(text) - len(text.lstrip())
+        passages.append((heading_trail() or title, start, len(text.rstrip()), 1 + text.count("\n", 0, start)))
+    return [
+        {"ord": idx, "heading": heading, "start": a, "end": b, "line": line, "text": text[a:b]}
+        for idx, (heading, a, b, line) in enumerate(passages)
+    ]
+
+
+def extract_doc(path: Path, st=None):
+    st = st or path.stat()
     text = path.read_text(encoding="utf-8", errors="ignore")
     lines = text.splitlines()
     title, updated, source_url, source_hash, confidence = parse_metadata(lines)
     if not title:
         title = path.stem
     if not updated:
-        updated = dt.date.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d")
+        updated = dt.date.fromtimestamp(st.st_mtime).strftime("%Y-%m-%d")
     domain = infer_domain(path)
     return {
         "path": str(path),
@@ -153,19 +459,93 @@ def extract_doc(path: Path):
         "source_hash": source_hash,
         "confidence": derive_confidence(title, source_url, domain, confidence),
         "domain": domain,
-        "content": text,
         "content_hash": content_hash(text),
-        "file_mtime": int(path.stat().st_mtime),
+        "file_mtime": int(st.st_mtime),
+        "passages": [
+            {**p, "cjk": cjk_segment(p["heading"] + "\n" + p["text"])} for p in chunk_passages(text, title)
+        ],
     }
 
 
-def scan_files(root):
+def _extract_job(item):
+    return extract_doc(*item)
+
+
+def extract_docs(todo, workers=1):
+    """Yield extract_doc() results for (path, stat) pairs in order; a process pool when worth it."""
+    if workers <= 1 or len(todo) < PARALLEL_MIN_FILES:
+        for path, st in todo:
+            yield extract_doc(path, st)
+        return
+    chunksize = max(1, min(64, len(todo) // (workers * 8)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_extract_job, todo, chunksize=chunksize)
+
+
+def load_manifest(cur):
+    return {
+        r[0]: (int(r[1]), json.loads(r[2]), json.loads(r[3]))
+        for r in cur.execute("SELECT dir, mtime_ns, subdirs, files FROM dir_manifest").fetchall()
+    }
+
+
+def scan_tree(cur, root, trust_dir_mtime=False):
+    """Walk `root` through the persisted dir manifest; returns ([(Path, stat or None)], info).
+
+    Directories whose mtime_ns matches the manifest are not listed again. A directory mtime
+    only moves when entries are added, removed or renamed, so files are still stat()ed; with
+    `trust_dir_mtime` files in unchanged directories come back with stat None (treated as
+    unchanged), which misses in-place edits that did not go through a rename.
+    """
+    root = str(Path(root))
+    manifest = load_manifest(cur)
     files = []
-    for p in Path(root).rglob("*.md"):
-        if "日志" in p.parts or "templates" in p.parts:
+    updates = []
+    seen = set()
+    listed = reused = 0
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            st = os.stat(d)
+        except OSError:
             continue
-        files.append(p)
-    return files
+        seen.add(d)
+        known = manifest.get(d)
+        unchanged = known is not None and known[0] == st.st_mtime_ns
+        if unchanged:
+            subdirs, names = known[1], known[2]
+            reused += 1
+        else:
+            subdirs, names = [], []
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.is_dir():
+                            if entry.name not in SKIP_DIRS:
+                                subdirs.append(entry.name)
+                        elif entry.name.endswith(".md"):
+                            names.append(entry.name)
+            except OSError:
+                continue
+            subdirs.sort()
+            names.sort()
+            updates.append((d, st.st_mtime_ns, json.dumps(subdirs, ensure_ascii=False), json.dumps(names, ensure_ascii=False)))
+            listed += 1
+        for name in names:
+            path = os.path.join(d, name)
+            if unchanged and trust_dir_mtime:
+                files.append((Path(path), None))
+                continue
+            try:
+                files.append((Path(path), os.stat(path)))
+            except OSError:
+                continue
+        stack.extend(os.path.join(d, sub) for sub in reversed(subdirs))
+    cur.executemany("INSERT OR REPLACE INTO dir_manifest(dir, mtime_ns, subdirs, files) VALUES(?, ?, ?, ?)", updates)
+    gone = [(d,) for d in manifest if d not in seen and (d == root or d.startswith(root + os.sep))]
+    cur.executemany("DELETE FROM dir_manifest WHERE dir = ?", gone)
+    return files, {"dirs_listed": listed, "dirs_reused": reused}
 
 
 def load_existing(cur):
@@ -183,9 +563,12 @@ def load_existing(cur):
     }
 
 
-def upsert(cur, rec):
-    cur.execute("DELETE FROM docs_fts WHERE path = ?", (rec["path"],))
-    cur.execute(
+def upsert_many(cur, recs):
+    """Write full records and replace their passages; the triggers keep passages_fts in sync."""
+    if not recs:
+        return
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur.executemany(
         """
         INSERT INTO docs(path, title, updated_date, source_url, source_hash, confidence, domain, file_mtime, content_hash, indexed_at)
         VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -200,90 +583,324 @@ def upsert(cur, rec):
           content_hash=excluded.content_hash,
           indexed_at=excluded.indexed_at
         """,
-        (
-            rec["path"],
-            rec["title"],
-            rec["updated_date"],
-            rec["source_url"],
-            rec["source_hash"],
-            rec["confidence"],
-            rec["domain"],
-            rec["file_mtime"],
-            rec["content_hash"],
-            dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        ),
+        [
+            (
+                r["path"],
+                r["title"],
+                r["updated_date"],
+                r["source_url"],
+                r["source_hash"],
+                r["confidence"],
+                r["domain"],
+                r["file_mtime"],
+                r["content_hash"],
+                now,
+            )
+            for r in recs
+        ],
+    )
+    cur.executemany("DELETE FROM passages WHERE doc_id = (SELECT id FROM docs WHERE path = ?)", [(r["path"],) for r in recs])
+    cur.executemany(
+        """
+        INSERT INTO passages(doc_id, ord, heading, start_offset, end_offset, line, text, cjk)
+        SELECT id, ?, ?, ?, ?, ?, ?, ? FROM docs WHERE path = ?
+        """,
+        [
+            (p["ord"], p["heading"], p["start"], p["end"], p["line"], p["text"], p["cjk"], r["path"])
+            for r in recs
+            for p in r["passages"]
+        ],
+    )
+
+
+def upsert(cur, rec):
+    upsert_many(cur, [rec])
+
+
+def update_metadata_many(cur, recs):
+    """Content unchanged (same hash): refresh the lightweight docs columns only."""
+    if not recs:
+        return
+    now = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur.executemany(
+        """
+        UPDATE docs
+        SET title=?, updated_date=?, source_url=?, source_hash=?, confidence=?, domain=?,
+            file_mtime=?, indexed_at=?
+        WHERE path=?
+        """,
+        [
+            (
+                r["title"],
+                r["updated_date"],
+                r["source_url"],
+                r["source_hash"],
+                r["confidence"],
+                r["domain"],
+                r["file_mtime"],
+                now,
+                r["path"],
+            )
+            for r in recs
+        ],
     )
-    cur.execute("INSERT INTO docs_fts(path, title, content) VALUES(?, ?, ?)", (rec["path"], rec["title"], rec["content"]))
 
 
-def build_index(root, db_path, mode="incremental"):
+def build_index(root, db_path, mode="incremental", workers=1, trust_dir_mtime=False, verbose=True):
+    """Scan, extract (optionally in a process pool) and write; the calling thread is the only writer.
+
+    All writes go through batched executemany calls inside a single transaction.
+    Returns counters plus per-phase timings (seconds).
+    """
+    t_start = time.perf_counter()
+    timings = {}
     conn = connect(db_path)
     cur = conn.cursor()
     existing = load_existing(cur)
-    files = scan_files(root)
-    paths_now = {str(p) for p in files}
 
+    t0 = time.perf_counter()
+    files, scan_info = scan_tree(cur, root, trust_dir_mtime)
+    paths_now = {str(p) for p, _st in files}
     if mode == "full":
-        cur.execute("DELETE FROM docs")
-        cur.execute("DELETE FROM docs_fts")
+        # recreate instead of DELETE: per-row delete triggers would re-tokenize every old doc;
+        # load without the insert trigger and build the FTS index in one pass afterwards
+        _drop_schema(conn)
+        _create_schema(conn)
+        conn.execute("DROP TRIGGER passages_ai")
         existing = {}
 
-    added = updated = skipped = 0
-    for p in files:
+    todo = []
+    skipped = 0
+    for p, st in files:
         pstr = str(p)
-        mtime = int(p.stat().st_mtime)
+        if st is None:
+            if mode == "incremental" and pstr in existing:
+                skipped += 1
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
         if (
             mode == "incremental"
             and pstr in existing
-            and existing[pstr]["file_mtime"] == mtime
+            and existing[pstr]["file_mtime"] == int(st.st_mtime)
             and existing[pstr]["domain"]
             and existing[pstr]["confidence"] > 0
         ):
             skipped += 1
             continue
-        rec = extract_doc(p)
+        todo.append((p, st))
+    timings["scan"] = time.perf_counter() - t0
+
+    added = updated = 0
+    extract_s = write_s = 0.0
+    full_batch, light_batch = [], []
+
+    def flush():
+        nonlocal write_s
+        t = time.perf_counter()
+        upsert_many(cur, full_batch)
+        update_metadata_many(cur, light_batch)
+        full_batch.clear()
+        light_batch.clear()
+        write_s += time.perf_counter() - t
+
+    records = extract_docs(todo, workers)
+    while True:
+        t = time.perf_counter()
+        rec = next(records, None)
+        extract_s += time.perf_counter() - t
+        if rec is None:
+            break
+        pstr = rec["path"]
         if mode == "incremental" and pstr in existing and existing[pstr]["content_hash"] == rec["content_hash"]:
             # metadata may change via mtime; still update lightweight row
-            cur.execute(
-                """
-                UPDATE docs
-                SET title=?, updated_date=?, source_url=?, source_hash=?, confidence=?, domain=?,
-                    file_mtime=?, indexed_at=?
-                WHERE path=?
-                """,
-                (
-                    rec["title"],
-                    rec["updated_date"],
-                    rec["source_url"],
-                    rec["source_hash"],
-                    rec["confidence"],
-                    rec["domain"],
-                    rec["file_mtime"],
-                    dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    rec["path"],
-                ),
-            )
+            light_batch.append(rec)
             skipped += 1
-            continue
-        upsert(cur, rec)
-        if pstr in existing:
-            updated += 1
         else:
-            added += 1
+            full_batch.append(rec)
+            if pstr in existing:
+                updated += 1
+            else:
+                added += 1
+        if len(full_batch) + len(light_batch) >= WRITE_BATCH:
+            flush()
+    flush()
+    timings["extract"] = extract_s
 
-    deleted = 0
-    for old in existing.keys():
-        if old not in paths_now:
-            cur.execute("DELETE FROM docs WHERE path = ?", (old,))
-            cur.execute("DELETE FROM docs_fts WHERE path = ?", (old,))
-            deleted += 1
+    t0 = time.perf_counter()
+    stale = [(old,) for old in existing.keys() if old not in paths_now]
+    cur.executemany("DELETE FROM docs WHERE path = ?", stale)
+    deleted = len(stale)
+    if mode == "full":
+        cur.execute("INSERT INTO passages_fts(passages_fts) VALUES('rebuild')")
+        _create_schema(conn)
+    bump_generation(conn)
+    timings["write"] = write_s + time.perf_counter() - t0
 
+    t0 = time.perf_counter()
     conn.commit()
+    timings["commit"] = time.perf_counter() - t0
     total = cur.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
     conn.close()
-    print(
-        f"索引完成(mode={mode}): total={total}, added={added}, updated={updated}, skipped={skipped}, deleted={deleted} -> {db_path}"
-    )
+    timings["total"] = time.perf_counter() - t_start
+    if verbose:
+        print(
+            f"索引完成(mode={mode}): total={total}, added={added}, updated={updated}, skipped={skipped}, deleted={deleted} -> {db_path}"
+        )
+        print(
+            f"耗时(workers={workers}, extracted={len(todo)}, dirs_listed={scan_info['dirs_listed']}, "
+            f"dirs_reused={scan_info['dirs_reused']}): " + ", ".join(f"{k}={v:.3f}s" for k, v in timings.items())
+        )
+    return {
+        "mode": mode,
+        "workers": workers,
+        "total": total,
+        "added": added,
+        "updated": updated,
+        "skipped": skipped,
+        "deleted": deleted,
+        "extracted": len(todo),
+        **scan_info,
+        "timings": {k: round(v, 4) for k, v in timings.items()},
+    }
+
+
+def apply_changes(db_path, changed=(), deleted=()):
+    """Index exactly the given paths: re-extract `changed`, drop `deleted` (or vanished) ones."""
+    conn = connect(db_path)
+    cur = conn.cursor()
+    recs = []
+    gone = set(deleted)
+    for path in sorted(set(changed) - gone):
+        try:
+            recs.append(extract_doc(Path(path)))
+        except (FileNotFoundError, NotADirectoryError):
+            gone.add(path)
+    upsert_many(cur, recs)
+    cur.executemany("DELETE FROM docs WHERE path = ?", [(p,) for p in sorted(gone)])
+    bump_generation(conn)
+    conn.commit()
+    conn.close()
+    return {"updated": len(recs), "deleted": len(gone)}
+
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+class DirWatcher:
+    """Recursive inotify watcher (Linux only, via libc); `create` returns None elsewhere."""
+
+    def __init__(self, libc, fd):
+        self._libc = libc
+        self._fd = fd
+        self._dirs = {}
+
+    @classmethod
+    def create(cls, root):
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        watcher = cls(libc, fd)
+        watcher.add_tree(str(Path(root)))
+        return watcher
+
+    def add_tree(self, top):
+        for d, subdirs, _names in os.walk(top):
+            subdirs[:] = [s for s in subdirs if s not in SKIP_DIRS]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), WATCH_MASK)
+            if wd >= 0:
+                self._dirs[wd] = d
+
+    def read(self, timeout):
+        """[(path, mask)] for events within `timeout` seconds; new directories are watched automatically."""
+        ready, _w, _x = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        off = 0
+        while off + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+            name = os.fsdecode(buf[off + _EVENT.size : off + _EVENT.size + length].rstrip(b"\0"))
+            off += _EVENT.size + length
+            base = self._dirs.get(wd)
+            if mask & IN_DELETE_SELF:
+                self._dirs.pop(wd, None)
+            if base is None and not mask & IN_Q_OVERFLOW:
+                continue
+            path = os.path.join(base, name) if base and name else (base or "")
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and name not in SKIP_DIRS:
+                self.add_tree(path)
+            events.append((path, mask))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+def watch_index(root, db_path, debounce=1.0, poll_interval=5.0, workers=1):
+    """Keep the index in sync: inotify where available, manifest-driven polling otherwise."""
+    build_index(root, db_path, "incremental", workers)
+    watcher = DirWatcher.create(root)
+    if watcher is None:
+        print(f"inotify 不可用，改为每 {poll_interval:.0f}s 增量扫描")
+        while True:
+            time.sleep(poll_interval)
+            res = build_index(root, db_path, "incremental", workers, verbose=False)
+            if res["added"] or res["updated"] or res["deleted"]:
+                print(f"增量同步: added={res['added']}, updated={res['updated']}, deleted={res['deleted']}")
+    print(f"监听中: {root}")
+    changed, deleted = set(), set()
+    rescan = False
+    try:
+        while True:
+            events = watcher.read(debounce)
+            for path, mask in events:
+                if mask & IN_Q_OVERFLOW or (mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM)):
+                    # lost events or whole subtrees moved: fall back to one manifest-driven scan
+                    rescan = True
+                elif path.endswith(".md"):
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        deleted.add(path)
+                        changed.discard(path)
+                    else:
+                        changed.add(path)
+                        deleted.discard(path)
+            if events or not (rescan or changed or deleted):
+                continue
+            if rescan:
+                res = build_index(root, db_path, "incremental", workers, verbose=False)
+            else:
+                res = apply_changes(db_path, changed, deleted)
+            print("增量同步: " + ", ".join(f"{k}={res[k]}" for k in ("added", "updated", "deleted") if k in res))
+            changed.clear()
+            deleted.clear()
+            rescan = False
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
 
 
 def freshness_score(updated_date):
@@ -303,56 +920,153 @@ def freshness_score(updated_date):
     return 0.2
 
 
-def final_rank(bm25_score, updated_date, confidence):
-    relevance = 1.0 / (1.0 + abs(float(bm25_score)))
+def rrf_relevance(ranks, k=RRF_K):
+    """Reciprocal rank fusion over 1-based ranks (None = absent), scaled so rank 1 everywhere is 1.0."""
+    if not ranks:
+        return 0.0
+    return sum(1.0 / (k + r) for r in ranks if r) / (len(ranks) / (k + 1.0))
+
+
+def final_rank(bm25_score, updated_date, confidence, bm25_rank=None, dense_rank=None):
+    """Blend relevance with freshness and confidence.
+
+    With retrieval ranks (hybrid BM25 + dense lookups) relevance is their RRF score;
+    otherwise it is derived from the raw bm25 value as before.
+    """
+    if bm25_rank or dense_rank:
+        relevance = rrf_relevance([bm25_rank, dense_rank])
+    else:
+        relevance = 1.0 / (1.0 + abs(float(bm25_score)))
     fresh = freshness_score(updated_date)
     conf = max(0.0, min(float(confidence), 100.0)) / 100.0
     return 0.6 * relevance + 0.25 * fresh + 0.15 * conf
 
 
-def query_index(db_path, query, limit=10):
-    conn = connect(db_path)
-    cur = conn.cursor()
-    rows = cur.execute(
+def search_passages(conn, query, limit=10, per_doc=PASSAGES_PER_DOC, snippet_tokens=12):
+    """Rank passages by BM25 and group them by document.
+
+    Returns up to `limit` documents ordered by their best passage, each with up to
+    `per_doc` passages (heading trail, offsets, line, snippet). Snippets are built only
+    for the passages returned. Bad FTS syntax raises sqlite3.OperationalError.
+    """
+    match = fts_match_query(query)
+    if not match or limit <= 0:
+        return []
+    hits = conn.execute(
         """
-        SELECT d.path, d.title, d.updated_date, d.source_url, d.confidence,
-               COALESCE(d.domain, '') AS domain,
-               snippet(docs_fts, 2, '[', ']', '...', 12) AS snippet_text,
-               bm25(docs_fts) AS bm
-        FROM docs_fts
-        JOIN docs d ON d.path = docs_fts.path
-        WHERE docs_fts MATCH ?
-        ORDER BY bm
+        SELECT p.doc_id, p.id, bm25(passages_fts)
+        FROM passages_fts
+        JOIN passages p ON p.id = passages_fts.rowid
+        WHERE passages_fts MATCH ?
+        ORDER BY bm25(passages_fts)
         LIMIT ?
         """,
-        (query, max(limit * 5, limit)),
+        (match, max(200, limit * per_doc * 10)),
     ).fetchall()
-    conn.close()
+    grouped = {}
+    for doc_id, pid, bm in hits:
+        picked = grouped.get(doc_id)
+        if picked is None:
+            if len(grouped) >= limit:
+                continue
+            picked = grouped[doc_id] = []
+        if len(picked) < per_doc:
+            picked.append((pid, bm))
+    if not grouped:
+        return []
+
+    pids = [pid for picked in grouped.values() for pid, _bm in picked]
+    marks = ",".join("?" * len(pids))
+    details = {
+        r[0]: r[1:]
+        for r in conn.execute(
+            f"""
+            SELECT passages_fts.rowid, p.heading, p.start_offset, p.end_offset, p.line,
+                   snippet(passages_fts, 1, '[', ']', '...', {int(snippet_tokens)}),
+                   {SNIPPET_WINDOW_SQL}
+            FROM passages_fts
+            JOIN passages p ON p.id = passages_fts.rowid
+            WHERE passages_fts MATCH ? AND passages_fts.rowid IN ({marks})
+            """,
+            [(cjk_terms(query) or [""])[0], match, *pids],
+        )
+    }
+    marks = ",".join("?" * len(grouped))
+    docs = {
+        r[0]: r[1:]
+        for r in conn.execute(
+            f"""
+            SELECT id, path, title, updated_date, source_url, confidence, COALESCE(domain, '')
+            FROM docs WHERE id IN ({marks})
+            """,
+            list(grouped),
+        )
+    }
+    out = []
+    for doc_id, picked in grouped.items():
+        if doc_id not in docs:
+            continue
+        path, title, updated, source_url, confidence, domain = docs[doc_id]
+        passages = []
+        for pid, bm in picked:
+            heading, start, end, line, snip, window = details[pid]
+            passages.append(
+                {
+                    "passage_id": pid,
+                    "heading": heading or "",
+                    "start": start,
+                    "end": end,
+                    "line": line,
+                    "bm25": float(bm),
+                    "snippet": str(display_snippet(snip, window, query) or "").strip(),
+                }
+            )
+        out.append(
+            {
+                "doc_id": doc_id,
+                "path": path,
+                "title": title,
+                "updated_date": updated,
+                "source_url": source_url,
+                "confidence": float(confidence or 0.0),
+                "domain": domain,
+                "bm25": passages[0]["bm25"],
+                "passages": passages,
+            }
+        )
+    return out
 
-    if not rows:
+
+def query_index(db_path, query, limit=10):
+    conn = connect(db_path)
+    try:
+        docs = search_passages(conn, query, max(limit * 5, limit))
+    finally:
+        conn.close()
+
+    if not docs:
         print("无匹配结果")
         return
 
-    ranked = []
-    for r in rows:
-        path, title, updated, source_url, conf, domain, snip, bm = r
-        rank = final_rank(bm, updated, conf)
-        ranked.append((rank, path, title, updated, source_url, conf, domain, snip, bm))
-    ranked.sort(key=lambda x: x[0], reverse=True)
-
-    for i, item in enumerate(ranked[:limit], start=1):
-        rank, path, title, updated, source_url, conf, domain, snip, bm = item
-        print(f"{i}. {title} | {updated} | domain={domain} | rank={rank:.4f} | bm25={bm:.4f} | conf={conf:.1f}")
-        print(f"   path: {path}")
-        if source_url:
-            print(f"   source: {source_url}")
-        print(f"   snippet: {snip}")
+    ranked = sorted(docs, key=lambda d: final_rank(d["bm25"], d["updated_date"], d["confidence"]), reverse=True)
+    for i, d in enumerate(ranked[:limit], start=1):
+        rank = final_rank(d["bm25"], d["updated_date"], d["confidence"])
+        print(
+            f"{i}. {d['title']} | {d['updated_date']} | domain={d['domain']} | rank={rank:.4f} "
+            f"| bm25={d['bm25']:.4f} | conf={d['confidence']:.1f}"
+        )
+        print(f"   path: {d['path']}")
+        if d["source_url"]:
+            print(f"   source: {d['source_url']}")
+        for p in d["passages"]:
+            print(f"   L{p['line']} [{p['start']}:{p['end']}] {p['heading']}: {p['snippet']}")
 
 
 def stats(db_path):
     conn = connect(db_path)
     cur = conn.cursor()
     total = cur.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+    passages = cur.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
     latest = cur.execute("SELECT MAX(indexed_at) FROM docs").fetchone()[0]
     top_old = cur.execute(
         """
@@ -364,6 +1078,7 @@ def stats(db_path):
     ).fetchall()
     conn.close()
     print(f"docs_total={total}")
+    print(f"passages_total={passages}")
     print(f"last_indexed_at={latest}")
     print("oldest_low_conf_top5:")
     for t, u, c in top_old:
@@ -378,6 +1093,15 @@ def main():
     p_build.add_argument("--root", default="知识库")
     p_build.add_argument("--db", default="日志/knowledge_index.db")
     p_build.add_argument("--mode", choices=("incremental", "full"), default="incremental")
+    p_build.add_argument("--workers", type=int, default=0, help="extraction processes (0 = all cores)")
+    p_build.add_argument("--trust-dir-mtime", action="store_true", help="skip stat() for files in unchanged directories")
+
+    p_watch = sub.add_parser("watch")
+    p_watch.add_argument("--root", default="知识库")
+    p_watch.add_argument("--db", default="日志/knowledge_index.db")
+    p_watch.add_argument("--workers", type=int, default=0)
+    p_watch.add_argument("--debounce", type=float, default=1.0, help="seconds of quiet before applying changes")
+    p_watch.add_argument("--poll", type=float, default=5.0, help="rescan interval when inotify is unavailable")
 
     p_query = sub.add_parser("query")
     p_query.add_argument("--db", default="日志/knowledge_index.db")
@@ -389,7 +1113,9 @@ def main():
 
     args = parser.parse_args()
     if args.cmd == "build":
-        build_index(args.root, args.db, args.mode)
+        build_index(args.root, args.db, args.mode, args.workers or os.cpu_count() or 1, args.trust_dir_mtime)
+    elif args.cmd == "watch":
+        watch_index(args.root, args.db, args.debounce, args.poll, args.workers or os.cpu_count() or 1)
     elif args.cmd == "query":
         query_index(args.db, args.q, args.limit)
     elif args.cmd == "stats":
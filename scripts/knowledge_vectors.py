@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Dense retrieval tier for the knowledge index: hashed n-gram vectors in a NumPy memmap.
+
+CPU-only and model-free: CJK bigrams/trigrams and Latin words are feature-hashed into a
+fixed-size signed vector, L2-normalised, and stored row-per-passage in `<db>.vectors.npy`
+(opened with mmap_mode='r'). Queries are answered by a brute-force dot product, which stays
+in the low milliseconds for tens of thousands of rows at the default dimension. The tier is
+optional: without NumPy or a built matrix, dense_search() returns [] and callers keep BM25.
+
+Rows are keyed by passages.id, which the text index reuses across rebuilds, so the matrix is
+stamped with the index generation it was built at (meta `vectors_generation`). Any later
+build_index/apply_changes bumps the generation and the matrix is ignored until rebuilt.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+try:
+    from scripts.knowledge_index import CJK_RUN_RE, bump_generation, index_generation
+except ImportError:
+    from knowledge_index import CJK_RUN_RE, bump_generation, index_generation
+
+DEFAULT_DIM = 256
+VECTORS_GENERATION_KEY = "vectors_generation"
+LATIN_WORD_RE = re.compile(r"[a-z0-9]{2,}")
+
+
+def vectors_path(db_path) -> Path:
+    return Path(db_path).with_suffix(".vectors.npy")
+
+
+def ids_path(db_path) -> Path:
+    return Path(db_path).with_suffix(".vector_ids.npy")
+
+
+def vectors_generation(conn) -> int:
+    """Index generation the matrix was built at (0 when never built)."""
+    try:
+        row = conn.execute("SELECT v FROM meta WHERE k = ?", (VECTORS_GENERATION_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row[0]) if row else 0
+
+
+def vectors_current(conn) -> bool:
+    """True when no text-index write happened since the matrix was built."""
+    built = vectors_generation(conn)
+    return built > 0 and built == index_generation(conn)
+
+
+def _features(text: str) -> Counter:
+    text = (text or "").lower()
+    feats: Counter = Counter()
+    for run in CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            feats[run] += 1
+            continue
+        feats.update(run[i : i + 2] for i in range(len(run) - 1))
+        feats.update(run[i : i + 3] for i in range(len(run) - 2))
+    feats.update(LATIN_WORD_RE.findall(text))
+    return feats
+
+
+def embed(text: str, dim: int = DEFAULT_DIM):
+    """Signed feature-hashing embedding with sublinear tf, L2-normalised (float32)."""
+    feats = _features(text)
+    if not feats:
+        return np.zeros(dim, dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+    tf = np.fromiter(feats.values(), dtype=np.float32, count=len(feats))
+    weights = (1.0 + np.log(tf)) * np.where(hashes & 0x80000000, 1.0, -1.0)
+    vec = np.bincount(hashes % dim, weights=weights, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm > 0 else vec
+
+
+def build_vectors(db_path, dim: int = DEFAULT_DIM) -> Dict[str, object]:
+    """Embed every passage offline.
+
+    Each file is swapped in atomically, so readers never see a partial matrix; the ids and
+    the matrix are two files replaced one after the other, and load_index() rejects a pair
+    whose row counts disagree.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to build the dense index: pip install numpy")
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(str(db_path))
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        vec_file, id_file = vectors_path(db_path), ids_path(db_path)
+        tmp_vec = vec_file.with_name(vec_file.name + ".tmp")
+        tmp_ids = id_file.with_name(id_file.name + ".tmp")
+        matrix = np.lib.format.open_memmap(tmp_vec, mode="w+", dtype=np.float32, shape=(count, dim))
+        ids = np.zeros(count, dtype=np.int64)
+        n = 0
+        for passage_id, heading, text in conn.execute("SELECT id, heading, text FROM passages ORDER BY id"):
+            if n >= count:
+                break
+            # the heading trail starts with the document title, so titles weigh in every passage
+            matrix[n] = embed(f"{heading or ''}\n{text or ''}", dim)
+            ids[n] = passage_id
+            n += 1
+        matrix.flush()
+        del matrix
+        with open(tmp_ids, "wb") as f:
+            np.save(f, ids[:n])
+        os.replace(tmp_ids, id_file)
+        os.replace(tmp_vec, vec_file)
+        # dense hits feed search_knowledge, so its cached results must not outlive the old matrix
+        bump_generation(conn)
+        conn.execute(
+            "INSERT INTO meta(k, v) VALUES(?, ?) ON CONFLICT(k) DO UPDATE SET v = excluded.v",
+            (VECTORS_GENERATION_KEY, str(index_generation(conn))),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return {"rows": n, "dim": dim, "path": str(vec_file), "seconds": round(time.perf_counter() - t0, 3)}
+
+
+class DenseIndex:
+    def __init__(self, matrix, ids):
+        self.matrix = matrix
+        self.ids = ids
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[int, float]]:
+        """Top-k (passage_id, cosine) by brute-force dot product; non-positive scores are dropped."""
+        n = int(self.matrix.shape[0])
+        if n == 0 or k <= 0:
+            return []
+        q = embed(query, self.dim)
+        if not q.any():
+            return []
+        scores = self.matrix @ q
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+_LOADED: Dict[str, Tuple[Tuple[int, int], DenseIndex]] = {}
+
+
+def load_index(db_path):
+    """Memmap the matrix once per process; reloads when either file is rebuilt.
+
+    Returns None mid-rebuild, when the ids file no longer matches the matrix row count.
+    """
+    if np is None:
+        return None
+    vec_file, id_file = vectors_path(db_path), ids_path(db_path)
+    try:
+        st, id_st = vec_file.stat(), id_file.stat()
+    except OSError:
+        return None
+    key = str(vec_file)
+    sig = (st.st_mtime_ns, st.st_size, id_st.st_mtime_ns, id_st.st_size)
+    hit = _LOADED.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    try:
+        index = DenseIndex(np.load(vec_file, mmap_mode="r"), np.load(id_file))
+    except (OSError, ValueError):
+        return None
+    if len(index.ids) != int(index.matrix.shape[0]):
+        return None
+    _LOADED[key] = (sig, index)
+    return index
+
+
+def dense_search(db_path, query: str, k: int = 20, conn=None) -> List[Tuple[int, float]]:
+    """Dense hits, or [] when the matrix is missing or stale against the text index."""
+    if np is None or not Path(db_path).exists():
+        return []
+    if conn is None:
+        own = sqlite3.connect(str(db_path))
+        try:
+            current = vectors_current(own)
+        finally:
+            own.close()
+    else:
+        current = vectors_current(conn)
+    if not current:
+        return []
+    index = load_index(db_path)
+    if index is None:
+        return []
+    return index.search(query, k)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Dense (hashed n-gram) tier for the knowledge index")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build")
+    p_build.add_argument("--db", default="日志/knowledge_index.db")
+    p_build.add_argument("--dim", type=int, default=DEFAULT_DIM)
+    p_query = sub.add_parser("query")
+    p_query.add_argument("--db", default="日志/knowledge_index.db")
+    p_query.add_argument("--q", required=True)
+    p_query.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        print(json.dumps(build_vectors(args.db, args.dim), ensure_ascii=False))
+        return 0
+    t0 = time.perf_counter()
+    hits = dense_search(args.db, args.q, args.k)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(json.dumps({"ms": round(elapsed_ms, 2), "hits": hits}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,7 +5,7 @@ MCP 缓存中间件 - 为 MCP Connector 提供缓存支持
 功能：
 - 拦截 MCP 工具调用
 - 自动缓存工具定义
-- 缓存工具调用结果（可选）
+- 缓存工具调用结果（可选，使用共享结果缓存：字节上限 LRU、按工具 TTL、single-flight）
 
 使用示例：
     from scripts.mcp_cache_middleware import MCPCacheMiddleware, create_cached_runtime
@@ -22,15 +22,21 @@ MCP 缓存中间件 - 为 MCP Connector 提供缓存支持
 
 from __future__ import annotations
 
+import hashlib
+import json
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
 
 try:
     from scripts.cache_service import cache_service, CacheService
     from scripts.mcp_connector import Runtime, Registry, ServerConfig
+    from scripts.result_cache import ResultCache, shared_result_cache
 except ImportError:
     from cache_service import cache_service, CacheService
     from mcp_connector import Runtime, Registry, ServerConfig
+    from result_cache import ResultCache, shared_result_cache
+
+DEFAULT_CALL_TTL = 60.0  # 调用结果默认缓存秒数
 
 
 class MCPCacheMiddleware:
@@ -43,10 +49,20 @@ class MCPCacheMiddleware:
     - 缓存统计
     """
 
-    def __init__(self, cache_service: Optional[CacheService] = None):
+    def __init__(
+        self,
+        cache_service: Optional[CacheService] = None,
+        result_cache: Optional[ResultCache] = None,
+        tool_ttls: Optional[Dict[str, float]] = None,
+        cache_scope: str = "",
+    ):
         self._cache = cache_service or CacheService()
+        self._results = result_cache or shared_result_cache()
+        self._tool_ttls: Dict[str, float] = dict(tool_ttls or {})
         self._tool_definitions: Dict[str, Dict[str, Any]] = {}
         self._call_cache_enabled = False  # 默认不缓存调用结果
+        # 结果缓存键的作用域：连接不同 Registry（同名服务器指向不同实现）时应各用一个
+        self._cache_scope = cache_scope
 
     def enable_call_cache(self, enabled: bool = True):
         """启用/禁用工具调用结果缓存"""
@@ -81,33 +97,43 @@ class MCPCacheMiddleware:
 
         return None
 
+    def set_tool_ttl(self, tool: str, ttl_sec: float):
+        """设置单个工具的调用结果缓存秒数（<=0 表示不缓存）"""
+        self._tool_ttls[tool] = float(ttl_sec)
+
+    def _ttl_for(self, tool: str) -> float:
+        return self._tool_ttls.get(tool, DEFAULT_CALL_TTL)
+
+    def _call_key(self, server: str, tool: str, params: dict) -> str:
+        content = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        scope = f"{self._cache_scope}:" if self._cache_scope else ""
+        return f"call:{scope}{server}:{tool}:{hashlib.sha256(content.encode('utf-8')).hexdigest()}"
+
     def cache_call_result(self, server: str, tool: str, params: dict, result: Any):
         """缓存工具调用结果"""
         if not self._call_cache_enabled:
             return
-
-        cache_key = f"call:{server}:{tool}:{hash(frozenset(params.items()))}"
-        self._cache._call_cache[cache_key] = {
-            "result": result,
-            "cached_at": time.time()
-        }
+        self._results.set(self._call_key(server, tool, params), result, ttl=self._ttl_for(tool))
 
     def get_cached_call_result(self, server: str, tool: str, params: dict) -> Optional[Any]:
         """获取缓存的工具调用结果"""
         if not self._call_cache_enabled:
             return None
+        return self._results.get(self._call_key(server, tool, params))
 
-        cache_key = f"call:{server}:{tool}:{hash(frozenset(params.items()))}"
-        cached = self._cache._call_cache.get(cache_key)
-        if cached and time.time() - cached["cached_at"] < 60:  # 1分钟有效
-            return cached["result"]
-        return None
+    def call_with_cache(self, server: str, tool: str, params: dict, compute: Callable[[], Any]) -> Any:
+        """带缓存执行调用：命中直接返回，相同调用并发时只执行一次"""
+        ttl = self._ttl_for(tool)
+        if not self._call_cache_enabled or ttl <= 0:
+            return compute()
+        return self._results.get_or_compute(self._call_key(server, tool, params), compute, ttl=ttl)
 
     def get_stats(self) -> Dict[str, Any]:
         """获取缓存统计"""
         return {
             "cached_servers": list(self._tool_definitions.keys()),
-            "cache_service_stats": self._cache.get_cache_info()
+            "cache_service_stats": self._cache.get_cache_info(),
+            "result_cache": self._results.stats(),
         }
 
 
@@ -120,7 +146,8 @@ class CachedRuntime:
 
     def __init__(self, registry: Registry, middleware: Optional[MCPCacheMiddleware] = None):
         self._runtime = Runtime(registry)
-        self._middleware = middleware or MCPCacheMiddleware()
+        # 同名服务器在不同配置文件中可能指向不同实现，按配置文件隔离调用结果
+        self._middleware = middleware or MCPCacheMiddleware(cache_scope=str(registry.config_file))
 
     def __getattr__(self, name: str):
         """代理所有方法到原始 Runtime"""
@@ -158,18 +185,9 @@ class CachedRuntime:
 
     def call(self, server: str, tool: str, params: Dict[str, Any], route_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """调用工具（带缓存支持）"""
-        # 检查调用结果缓存
-        cached_result = self._middleware.get_cached_call_result(server, tool, params)
-        if cached_result is not None:
-            return cached_result
-
-        # 执行实际调用
-        result = self._runtime.call(server, tool, params, route_meta)
-
-        # 缓存结果（如果启用）
-        self._middleware.cache_call_result(server, tool, params, result)
-
-        return result
+        return self._middleware.call_with_cache(
+            server, tool, params, lambda: self._runtime.call(server, tool, params, route_meta)
+        )
 
     @property
     def cache_stats(self) -> Dict[str, Any]:
@@ -7,10 +7,15 @@ import argparse
 import datetime as dt
 import json
 import os
+import re
+import sqlite3
 import subprocess
+import threading
 import time
 import traceback
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -24,15 +29,17 @@ from core.registry.delivery_protocol import build_output_objects
 
 try:
     from scripts.mcp_connector import MCPError, Registry, Router, Runtime, parse_params
-    from scripts.mcp_observability import aggregate, load_log_path, load_records
+    from scripts.mcp_metrics_store import CallMetricsStore
+    from scripts.mcp_observability import aggregate, load_log_path, load_metrics_db_path, load_records
 except ModuleNotFoundError:  # direct script execution
     from mcp_connector import MCPError, Registry, Router, Runtime, parse_params  # type: ignore
-    from mcp_observability import aggregate, load_log_path, load_records  # type: ignore
+    from mcp_metrics_store import CallMetricsStore  # type: ignore
+    from mcp_observability import aggregate, load_log_path, load_metrics_db_path, load_records  # type: ignore
 
 
 RUNS_DIR = ROOT / "日志" / "mcp" / "runs"
 PIPELINES_DIR = ROOT / "日志" / "mcp" / "pipelines"
-BREAKER_FILE = ROOT / "日志" / "mcp" / "circuit_breaker.json"
+BREAKER_FILE = ROOT / "日志" / "mcp" / "circuit_breaker.db"
 
 SERVER_COST = {
     "filesystem": 0.95,
@@ -84,50 +91,147 @@ def _write_json(path: Path, payload: Dict[str, Any]) -> None:
 
 
 class CircuitBreakerStore:
-    def __init__(self, path: Path = BREAKER_FILE):
-        self.path = path
-        self.state = _load_json(path)
-        if not isinstance(self.state, dict):
-            self.state = {}
+    """Circuit breaker state in a small sqlite table shared by concurrent mcp-run processes.
+
+    Every transition is a single atomic UPSERT/UPDATE, so parallel runners never
+    lose each other's failures. Reads hit an in-memory snapshot refreshed at most
+    every `cache_ttl_sec`; a legacy JSON state file next to the db is imported once.
+    The db is created on the first write, so read-only callers (dry runs, route-smart)
+    leave nothing on disk.
+    """
+
+    def __init__(self, path: Path = BREAKER_FILE, cache_ttl_sec: float = 1.0):
+        self.path = path if path.suffix == ".db" else path.with_suffix(".db")
+        self.legacy_path = path.with_suffix(".json")
+        self.cache_ttl_sec = cache_ttl_sec
+        self._lock = threading.RLock()
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._cache_at = 0.0
+        self._ready = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if not self._ready:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._init_db()
+                self._ready = True
+        return self._open()
+
+    def _init_db(self) -> None:
+        with closing(self._open()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS breaker (
+                  key TEXT PRIMARY KEY,
+                  state TEXT NOT NULL DEFAULT 'closed',
+                  failures INTEGER NOT NULL DEFAULT 0,
+                  opened_at INTEGER NOT NULL DEFAULT 0,
+                  last_error TEXT NOT NULL DEFAULT '',
+                  updated_at INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            empty = conn.execute("SELECT 1 FROM breaker LIMIT 1").fetchone() is None
+            legacy = _load_json(self.legacy_path) if empty else {}
+            if isinstance(legacy, dict) and legacy:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO breaker(key, state, failures, opened_at, last_error, updated_at) VALUES(?,?,?,?,?,?)",
+                    [
+                        (
+                            str(k),
+                            str(v.get("state", "closed")),
+                            int(v.get("failures", 0) or 0),
+                            int(v.get("opened_at", 0) or 0),
+                            str(v.get("last_error", "")),
+                            int(v.get("updated_at", 0) or 0),
+                        )
+                        for k, v in legacy.items()
+                        if isinstance(v, dict)
+                    ],
+                )
 
-    def _save(self) -> None:
-        _write_json(self.path, self.state)
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._cache_at < self.cache_ttl_sec:
+            return
+        if not self._ready and not self.path.exists():
+            legacy = _load_json(self.legacy_path)
+            self._cache = {
+                str(k): {"key": str(k), "state": "closed", "failures": 0, "opened_at": 0, "last_error": "", "updated_at": 0, **v}
+                for k, v in (legacy.items() if isinstance(legacy, dict) else [])
+                if isinstance(v, dict)
+            }
+            self._cache_at = now
+            return
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM breaker").fetchall()
+        self._cache = {r["key"]: dict(r) for r in rows}
+        self._cache_at = now
+
+    def _store_row(self, conn: sqlite3.Connection, key: str) -> None:
+        row = conn.execute("SELECT * FROM breaker WHERE key=?", (key,)).fetchone()
+        if row is not None:
+            self._cache[key] = dict(row)
+
+    @property
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._refresh(force=True)
+            return {k: {kk: vv for kk, vv in v.items() if kk != "key"} for k, v in self._cache.items()}
 
     def is_open(self, key: str, cooldown_sec: int) -> bool:
-        rec = self.state.get(key, {})
-        if rec.get("state") != "open":
-            return False
-        opened_at = int(rec.get("opened_at", 0) or 0)
-        if int(time.time()) - opened_at >= cooldown_sec:
-            rec["state"] = "half_open"
-            self.state[key] = rec
-            self._save()
+        with self._lock:
+            self._refresh()
+            rec = self._cache.get(key)
+            if not rec or rec.get("state") != "open":
+                return False
+            opened_at = int(rec.get("opened_at", 0) or 0)
+            if int(time.time()) - opened_at < cooldown_sec:
+                return True
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "UPDATE breaker SET state='half_open', updated_at=? WHERE key=? AND state='open' AND opened_at=?",
+                    (int(time.time()), key, opened_at),
+                )
+                self._store_row(conn, key)
             return False
-        return True
 
     def record_success(self, key: str) -> None:
-        self.state[key] = {
-            "state": "closed",
-            "failures": 0,
-            "opened_at": 0,
-            "last_error": "",
-            "updated_at": int(time.time()),
-        }
-        self._save()
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT INTO breaker(key, state, failures, opened_at, last_error, updated_at)
+                VALUES(?, 'closed', 0, 0, '', ?)
+                ON CONFLICT(key) DO UPDATE SET
+                  state='closed', failures=0, opened_at=0, last_error='', updated_at=excluded.updated_at
+                """,
+                (key, int(time.time())),
+            )
+            self._store_row(conn, key)
 
     def record_failure(self, key: str, error: str, threshold: int) -> None:
-        rec = self.state.get(
-            key,
-            {"state": "closed", "failures": 0, "opened_at": 0, "last_error": "", "updated_at": 0},
-        )
-        rec["failures"] = int(rec.get("failures", 0) or 0) + 1
-        rec["last_error"] = str(error)
-        rec["updated_at"] = int(time.time())
-        if rec["failures"] >= threshold:
-            rec["state"] = "open"
-            rec["opened_at"] = int(time.time())
-        self.state[key] = rec
-        self._save()
+        now = int(time.time())
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                """
+                INSERT INTO breaker(key, state, failures, opened_at, last_error, updated_at)
+                VALUES(?, CASE WHEN 1 >= ? THEN 'open' ELSE 'closed' END, 1, CASE WHEN 1 >= ? THEN ? ELSE 0 END, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                  failures=failures+1,
+                  state=CASE WHEN failures+1 >= ? THEN 'open' ELSE state END,
+                  opened_at=CASE WHEN failures+1 >= ? THEN excluded.updated_at ELSE opened_at END,
+                  last_error=excluded.last_error,
+                  updated_at=excluded.updated_at
+                """,
+                (key, threshold, threshold, now, str(error), now, threshold, threshold),
+            )
+            self._store_row(conn, key)
 
 
 def _derive_risk(server: str, tool: str) -> Dict[str, Any]:
@@ -144,19 +248,25 @@ def _derive_risk(server: str, tool: str) -> Dict[str, Any]:
     return {"level": level, "reasons": reasons}
 
 
-def load_call_metrics(days: int = 14, log_path: Optional[Path] = None) -> Dict[str, Dict[str, Any]]:
-    lp = log_path or load_log_path()
-    report = aggregate(load_records(lp), days=days)
-    out: Dict[str, Dict[str, Any]] = {}
-    for row in report.get("server_tool", []):
-        key = f"{row.get('server')}/{row.get('tool')}"
-        out[key] = row
-    return out
-
-
-def _rule_hits(text: str, keywords: List[str]) -> List[str]:
-    low = text.lower()
-    return [kw for kw in keywords if str(kw).lower() in low]
+def load_call_metrics(
+    days: int = 14,
+    log_path: Optional[Path] = None,
+    metrics_db: Optional[Path] = None,
+) -> Dict[str, Dict[str, Any]]:
+    store = CallMetricsStore(metrics_db or load_metrics_db_path())
+    if log_path is None and not store.exists():
+        # read-only callers (route-smart, dry runs) never create the metrics db; the first recorded call does
+        log_path = load_log_path()
+    if log_path is not None:
+        # Explicit log: full re-aggregation (offline analysis of an arbitrary audit file).
+        report = aggregate(load_records(log_path), days=days)
+        out: Dict[str, Dict[str, Any]] = {}
+        for row in report.get("server_tool", []):
+            key = f"{row.get('server')}/{row.get('tool')}"
+            out[key] = row
+        return out
+    store.ensure_seeded(load_log_path())
+    return store.server_tool_metrics(days=days)
 
 
 def build_candidates(
@@ -167,14 +277,14 @@ def build_candidates(
     enabled = {s.name for s in registry.list_servers(enabled_only=True)}
     candidates: Dict[str, Dict[str, Any]] = {}
 
-    for rule in router.rules:
+    hits_by_rule = router.match(text)
+    for idx in sorted(hits_by_rule):
+        rule = router.rules[idx]
         server = str(rule.get("server", "")).strip()
         tool = str(rule.get("tool", "")).strip()
         if not server or not tool:
             continue
-        hits = _rule_hits(text, list(rule.get("keywords", [])))
-        if not hits:
-            continue
+        hits = hits_by_rule[idx]
         conf = round(
             min(1.0, len(hits) / max(1.0, len(rule.get("keywords", [])) * 0.5)),
             3,
@@ -332,11 +442,12 @@ def cmd_run(
     runtime: Optional[Runtime] = None,
     registry: Optional[Registry] = None,
     router: Optional[Router] = None,
+    breaker: Optional[CircuitBreakerStore] = None,
 ) -> Dict[str, Any]:
     reg = registry or Registry()
     rt = runtime or Runtime(reg)
     rtr = router or Router()
-    breaker = CircuitBreakerStore(breaker_path)
+    breaker = breaker or CircuitBreakerStore(breaker_path)
     metrics = load_call_metrics(days=metrics_days)
     ranked = rank_candidates(
         text=text,
@@ -663,6 +774,148 @@ def load_pipeline_spec(path: Path) -> Dict[str, Any]:
     return data
 
 
+_STEP_REF = re.compile(r"\$\{steps\.([A-Za-z0-9_\-]+)((?:\.[A-Za-z0-9_\-]+)*)\}")
+
+
+class _MissingRef(Exception):
+    pass
+
+
+def _lookup_ref(results: Dict[str, Dict[str, Any]], step_id: str, path: str) -> Any:
+    if step_id not in results:
+        raise _MissingRef(step_id)
+    cur: Any = results[step_id]
+    for part in [p for p in path.split(".") if p]:
+        if isinstance(cur, dict) and part in cur:
+            cur = cur[part]
+        elif isinstance(cur, list) and part.isdigit() and int(part) < len(cur):
+            cur = cur[int(part)]
+        else:
+            raise MCPError("PIPELINE_REF_UNRESOLVED", f"cannot resolve ${{steps.{step_id}{path}}}")
+    return cur
+
+
+def _step_refs(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [m.group(1) for m in _STEP_REF.finditer(value)]
+    if isinstance(value, dict):
+        return [ref for v in value.values() for ref in _step_refs(v)]
+    if isinstance(value, list):
+        return [ref for v in value for ref in _step_refs(v)]
+    return []
+
+
+def resolve_step_refs(value: Any, results: Dict[str, Dict[str, Any]], strict: bool = True) -> Any:
+    """Substitute `${steps.<id>.<path>}` with outputs of finished steps.
+
+    A value that is exactly one reference keeps the referenced type; embedded
+    references are rendered as text. With strict=False (dry-run) references to
+    steps without results are left untouched.
+    """
+    if isinstance(value, dict):
+        return {k: resolve_step_refs(v, results, strict) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_step_refs(v, results, strict) for v in value]
+    if not isinstance(value, str) or "${steps." not in value:
+        return value
+    whole = _STEP_REF.fullmatch(value)
+    try:
+        if whole:
+            return _lookup_ref(results, whole.group(1), whole.group(2))
+
+        def _sub(m: "re.Match[str]") -> str:
+            got = _lookup_ref(results, m.group(1), m.group(2))
+            return got if isinstance(got, str) else json.dumps(got, ensure_ascii=False)
+
+        return _STEP_REF.sub(_sub, value)
+    except _MissingRef as e:
+        if strict:
+            raise MCPError("PIPELINE_REF_UNRESOLVED", f"step has no result yet: {e}") from e
+        return value
+
+
+def plan_pipeline_dag(steps: List[Any]) -> List[Dict[str, Any]]:
+    """Validate steps and resolve dependencies (explicit `depends_on` plus `${steps.x}` refs).
+
+    Specs without any `depends_on` keep the legacy behaviour: each step depends
+    on the previous one, so existing pipelines still run strictly in order.
+    """
+    nodes: List[Dict[str, Any]] = []
+    seen: Dict[str, int] = {}
+    dag_mode = any(isinstance(s, dict) and "depends_on" in s for s in steps)
+    for idx, step in enumerate(steps, start=1):
+        if not isinstance(step, dict):
+            raise MCPError("INVALID_PIPELINE", f"step #{idx} must be object")
+        text = str(step.get("text", "")).strip()
+        if not text:
+            raise MCPError("INVALID_PIPELINE", f"step #{idx} missing text")
+        params = step.get("params", {})
+        if not isinstance(params, dict):
+            raise MCPError("INVALID_PIPELINE", f"step #{idx} params must be object")
+        sid = str(step.get("id", f"step_{idx}"))
+        if sid in seen:
+            raise MCPError("INVALID_PIPELINE", f"duplicate step id: {sid}")
+        seen[sid] = idx
+        deps = step.get("depends_on", [])
+        if isinstance(deps, str):
+            deps = [deps]
+        if not isinstance(deps, list):
+            raise MCPError("INVALID_PIPELINE", f"step #{idx} depends_on must be list")
+        deps = [str(d) for d in deps]
+        after = [nodes[-1]["id"]] if not dag_mode and nodes else []
+        for ref in _step_refs(params):
+            if ref not in deps:
+                deps.append(ref)
+        nodes.append({"index": idx, "id": sid, "text": text, "params": params, "step": step, "depends_on": deps, "after": after})
+
+    for node in nodes:
+        for dep in node["depends_on"]:
+            if dep not in seen:
+                raise MCPError("INVALID_PIPELINE", f"step {node['id']} depends on unknown step: {dep}")
+            if dep == node["id"]:
+                raise MCPError("INVALID_PIPELINE", f"step {node['id']} depends on itself")
+
+    # Kahn's algorithm purely for cycle detection; execution order is decided at runtime.
+    indeg = {n["id"]: len(set(n["depends_on"] + n["after"])) for n in nodes}
+    children: Dict[str, List[str]] = {n["id"]: [] for n in nodes}
+    for n in nodes:
+        for dep in set(n["depends_on"] + n["after"]):
+            children[dep].append(n["id"])
+    queue = [sid for sid, d in indeg.items() if d == 0]
+    visited = 0
+    while queue:
+        sid = queue.pop()
+        visited += 1
+        for child in children[sid]:
+            indeg[child] -= 1
+            if indeg[child] == 0:
+                queue.append(child)
+    if visited != len(nodes):
+        raise MCPError("INVALID_PIPELINE", "pipeline depends_on graph has a cycle")
+    return nodes
+
+
+class _ThrottledRuntime:
+    """Runtime proxy enforcing a per-server concurrency cap across pipeline workers."""
+
+    def __init__(self, runtime: Runtime, default_limit: int, server_limits: Dict[str, int]):
+        self.runtime = runtime
+        self.default_limit = max(1, int(default_limit))
+        self.server_limits = {str(k): max(1, int(v)) for k, v in server_limits.items()}
+        self._lock = threading.Lock()
+        self._sems: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _sem(self, server: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if server not in self._sems:
+                self._sems[server] = threading.BoundedSemaphore(self.server_limits.get(server, self.default_limit))
+            return self._sems[server]
+
+    def call(self, server: str, tool: str, params: Dict[str, Any], route_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._sem(server):
+            return self.runtime.call(server, tool, params, route_meta=route_meta)
+
+
 def cmd_pipeline(
     file: Path,
     dry_run: bool,
@@ -673,28 +926,44 @@ def cmd_pipeline(
     metrics_days: int,
     continue_on_error: bool,
     pipelines_dir: Path = PIPELINES_DIR,
+    max_parallel: Optional[int] = None,
+    runs_dir: Path = RUNS_DIR,
+    breaker_path: Path = BREAKER_FILE,
+    runtime: Optional[Runtime] = None,
+    registry: Optional[Registry] = None,
+    router: Optional[Router] = None,
 ) -> Dict[str, Any]:
     spec = load_pipeline_spec(file)
     defaults = spec.get("defaults", {})
-    steps = spec.get("steps", [])
     name = str(spec.get("name", file.stem))
+    nodes = plan_pipeline_dag(spec.get("steps", []))
+
+    reg = registry or Registry()
+    rtr = router or Router()
+    parallel = max(1, int(max_parallel if max_parallel is not None else defaults.get("max_parallel", 4)))
+    server_cap = int(defaults.get("server_concurrency", reg.settings().get("maxConcurrentCalls", 5)))
+    server_limits = defaults.get("server_limits", {})
+    if not isinstance(server_limits, dict):
+        raise MCPError("INVALID_PIPELINE", "defaults.server_limits must be object")
+    # one Runtime/Router/breaker for all workers: AuditLogger serialises log appends,
+    # metrics and breaker writes are per-call sqlite connections
+    rt = _ThrottledRuntime(runtime or Runtime(reg), server_cap, server_limits)
+    breaker = CircuitBreakerStore(breaker_path)
 
     pipe_id = _run_id("pipeline")
-    out_steps: List[Dict[str, Any]] = []
     started = time.time()
+    results: Dict[str, Dict[str, Any]] = {}
+    records: Dict[str, Dict[str, Any]] = {}
+    state_lock = threading.Lock()
 
-    for idx, step in enumerate(steps, start=1):
-        if not isinstance(step, dict):
-            raise MCPError("INVALID_PIPELINE", f"step #{idx} must be object")
-        text = str(step.get("text", "")).strip()
-        if not text:
-            raise MCPError("INVALID_PIPELINE", f"step #{idx} missing text")
-        params = step.get("params", {})
-        if not isinstance(params, dict):
-            raise MCPError("INVALID_PIPELINE", f"step #{idx} params must be object")
-
+    def _execute(node: Dict[str, Any]) -> Dict[str, Any]:
+        step = node["step"]
+        t0 = time.time()
+        with state_lock:
+            snapshot = dict(results)
+        params = resolve_step_refs(node["params"], snapshot, strict=not dry_run)
         out = cmd_run(
-            text=text,
+            text=node["text"],
             override_params=params,
             top_k=int(step.get("top_k", defaults.get("top_k", top_k))),
             max_attempts=int(step.get("max_attempts", defaults.get("max_attempts", max_attempts))),
@@ -702,24 +971,73 @@ def cmd_pipeline(
             failure_threshold=int(step.get("failure_threshold", defaults.get("failure_threshold", failure_threshold))),
             dry_run=dry_run,
             metrics_days=int(step.get("metrics_days", defaults.get("metrics_days", metrics_days))),
+            runs_dir=runs_dir,
+            breaker_path=breaker_path,
+            runtime=rt,  # type: ignore[arg-type]
+            registry=reg,
+            router=rtr,
+            breaker=breaker,
         )
-        out_steps.append(
-            {
-                "index": idx,
-                "id": step.get("id", f"step_{idx}"),
-                "text": text,
-                "ok": bool(out.get("ok", False)),
-                "mode": out.get("mode", ""),
-                "run_id": out.get("run_id", ""),
-                "run_file": out.get("run_file", ""),
-                "error": out.get("error", ""),
-                "selected": out.get("selected", {}),
-                "result_preview": _safe_preview(out.get("result", {})),
-            }
-        )
-        if not bool(out.get("ok", False)) and not continue_on_error:
-            break
+        out["_started_ms"] = int((t0 - started) * 1000)
+        out["_duration_ms"] = int((time.time() - t0) * 1000)
+        return out
+
+    def _record(node: Dict[str, Any], out: Dict[str, Any]) -> None:
+        records[node["id"]] = {
+            "index": node["index"],
+            "id": node["id"],
+            "text": node["text"],
+            "depends_on": node["depends_on"],
+            "ok": bool(out.get("ok", False)),
+            "status": str(out.get("status", "ok" if out.get("ok") else "error")),
+            "mode": out.get("mode", ""),
+            "run_id": out.get("run_id", ""),
+            "run_file": out.get("run_file", ""),
+            "error": out.get("error", ""),
+            "selected": out.get("selected", {}),
+            "result_preview": _safe_preview(out.get("result", {})),
+            "started_ms": out.get("_started_ms", 0),
+            "duration_ms": out.get("_duration_ms", 0),
+        }
 
+    pending = {n["id"]: n for n in nodes}
+    running: Dict[Any, Dict[str, Any]] = {}
+    aborted = False
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        while pending or running:
+            if not aborted:
+                for sid in [n["id"] for n in nodes if n["id"] in pending]:
+                    if len(running) >= parallel:
+                        break
+                    node = pending[sid]
+                    deps = node["depends_on"]
+                    if any(d in records and not records[d]["ok"] for d in deps):
+                        pending.pop(sid)
+                        _record(node, {"ok": False, "status": "skipped", "error": "dependency_failed"})
+                        continue
+                    if all(d in records for d in deps + node["after"]):
+                        pending.pop(sid)
+                        running[pool.submit(_execute, node)] = node
+            if not running:
+                break
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for fut in done:
+                node = running.pop(fut)
+                try:
+                    out = fut.result()
+                except MCPError as e:
+                    out = {"ok": False, "error": f"{e.code}: {e}"}
+                except Exception as e:
+                    # a bad step spec or adapter bug fails only this step (and its dependents)
+                    out = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                with state_lock:
+                    if out.get("ok") and "result" in out:
+                        results[node["id"]] = {"result": out.get("result"), "selected": out.get("selected", {})}
+                _record(node, out)
+                if not records[node["id"]]["ok"] and not continue_on_error:
+                    aborted = True
+
+    out_steps = sorted(records.values(), key=lambda x: x["index"])
     report = {
         "ok": all(x.get("ok", False) for x in out_steps) if out_steps else True,
         "mode": "pipeline",
@@ -727,6 +1045,7 @@ def cmd_pipeline(
         "name": name,
         "spec_file": str(file),
         "dry_run": dry_run,
+        "max_parallel": parallel,
         "steps": out_steps,
         "duration_ms": int((time.time() - started) * 1000),
         "ts": _now_ts(),
@@ -774,6 +1093,7 @@ def build_cli() -> argparse.ArgumentParser:
     pipe.add_argument("--failure-threshold", type=int, default=3)
     pipe.add_argument("--metrics-days", type=int, default=14)
     pipe.add_argument("--continue-on-error", action="store_true")
+    pipe.add_argument("--max-parallel", type=int, default=None, help="max concurrently running steps (default: spec defaults.max_parallel or 4)")
 
     return p
 
@@ -829,6 +1149,7 @@ def main(argv: Optional[List[str]] = None) -> int:
                 failure_threshold=int(args.failure_threshold),
                 metrics_days=int(args.metrics_days),
                 continue_on_error=bool(args.continue_on_error),
+                max_parallel=args.max_parallel,
             )
             print_json(out)
             return 0 if out.get("ok", False) else 1
@@ -4,17 +4,21 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import selectors
 import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import traceback
 import urllib.parse
 import urllib.request
 import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
@@ -26,6 +30,13 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 from core.policy import CommandPolicy, PathSqlPolicy, PolicyViolation
 
+try:
+    from scripts.keyword_automaton import KeywordAutomaton
+    from scripts.mcp_metrics_store import CallMetricsStore
+except ModuleNotFoundError:  # direct script execution
+    from keyword_automaton import KeywordAutomaton  # type: ignore
+    from mcp_metrics_store import CallMetricsStore  # type: ignore
+
 
 class MCPError(RuntimeError):
     def __init__(self, code: str, message: str):
@@ -46,6 +57,10 @@ class ServerConfig:
     endpoint: str = ""
 
 
+# Read-only tools that may safely run twice (protocol + local) when hedging.
+HEDGE_SAFE_TOOLS = {"read_file", "list_dir", "exists", "get", "query", "search_code", "search", "think"}
+
+
 def load_json(path: Path) -> Dict[str, Any]:
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -104,6 +119,16 @@ class Registry:
     def protocol_timeout_ms(self) -> int:
         return int(self.settings().get("protocolTimeoutMs", 1500))
 
+    def adaptive_timeout(self) -> Dict[str, Any]:
+        cfg = {"enabled": True, "multiplier": 1.5, "minMs": 300, "maxMs": self.protocol_timeout_ms() * 4, "minSamples": 20}
+        cfg.update(self.settings().get("adaptiveTimeout", {}) or {})
+        return cfg
+
+    def hedging(self) -> Dict[str, Any]:
+        cfg = {"enabled": False, "percentile": 90, "minSamples": 20, "tools": sorted(HEDGE_SAFE_TOOLS)}
+        cfg.update(self.settings().get("hedging", {}) or {})
+        return cfg
+
 
 class PolicyEngine:
     def __init__(self, registry: Registry):
@@ -157,22 +182,142 @@ class AuditLogger:
         self.log_file = Path(fp)
         if not self.log_file.is_absolute():
             self.log_file = ROOT / self.log_file
+        self.metrics_db = Path(log_cfg.get("metricsDbPath", "日志/mcp/call_metrics.db"))
+        if not self.metrics_db.is_absolute():
+            self.metrics_db = ROOT / self.metrics_db
+        self.results_dir = Path(log_cfg.get("resultsDir", "日志/mcp/results"))
+        if not self.results_dir.is_absolute():
+            self.results_dir = ROOT / self.results_dir
+        self.max_preview_bytes = int(log_cfg.get("maxPreviewBytes", 4096))
+        # results_dir retention: drop spooled results older than N days, then oldest-first down to the byte budget
+        self.results_max_age_s = float(log_cfg.get("resultsMaxAgeDays", 14)) * 86400
+        self.results_max_bytes = int(log_cfg.get("resultsMaxBytes", 256 * 1024 * 1024))
+        self.results_prune_interval_s = float(log_cfg.get("resultsPruneIntervalSec", 300))
+        self._next_prune = 0.0
+        self._metrics: Optional[CallMetricsStore] = None
+        # shared by pipeline/hedge worker threads
+        self._lock = threading.Lock()
+
+    def metrics_store(self) -> CallMetricsStore:
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = CallMetricsStore(self.metrics_db)
+            return self._metrics
+
+    def spool_result(self, output: Any) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """Return (preview, ref) for the audit line.
+
+        Small outputs are kept inline unchanged. Larger ones are JSON-encoded
+        incrementally into a content-addressed file under results_dir; only a
+        truncated preview plus {path, bytes, sha256} goes into the audit log.
+        """
+        limit = self.max_preview_bytes
+        head: List[bytes] = []
+        size = 0
+        digest = hashlib.sha256()
+        tmp = None
+        try:
+            for chunk in json.JSONEncoder(ensure_ascii=False, default=str).iterencode(output):
+                data = chunk.encode("utf-8")
+                digest.update(data)
+                size += len(data)
+                if tmp is not None:
+                    tmp.write(data)
+                    continue
+                head.append(data)
+                if size > limit:
+                    self.results_dir.mkdir(parents=True, exist_ok=True)
+                    tmp = tempfile.NamedTemporaryFile("wb", dir=self.results_dir, suffix=".part", delete=False)
+                    for h in head:
+                        tmp.write(h)
+        except Exception:
+            if tmp is not None:
+                tmp.close()
+                Path(tmp.name).unlink(missing_ok=True)
+            raise
+        if tmp is None:
+            return output, None
+        tmp.close()
+        sha = digest.hexdigest()
+        final = self.results_dir / f"{sha}.json"
+        os.replace(tmp.name, final)
+        self._maybe_prune_results(keep=final)
+        preview = b"".join(head)[:limit].decode("utf-8", errors="ignore") + "..."
+        return preview, {"path": str(final), "bytes": size, "sha256": sha}
+
+    def _maybe_prune_results(self, keep: Path) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.results_prune_interval_s
+        try:
+            self.prune_results(keep=keep)
+        except OSError:
+            pass
+
+    def prune_results(self, now: Optional[float] = None, keep: Optional[Path] = None) -> Dict[str, int]:
+        """Apply results_dir retention; returns {"removed", "freed_bytes", "kept_bytes"}.
+
+        Files past results_max_age_s go first (including orphaned .part files),
+        then the oldest spooled results until the directory fits results_max_bytes.
+        Re-spooling identical content refreshes its mtime, so hot results survive;
+        `keep` (the result just referenced by an audit line) is never removed.
+        """
+        now = time.time() if now is None else now
+        files = []
+        for p in self.results_dir.glob("*"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if p.is_file() and p.suffix in (".json", ".part"):
+                files.append((st.st_mtime, st.st_size, p))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = freed = 0
+        for mtime, size, p in files:
+            expired = now - mtime > self.results_max_age_s
+            if p == keep or (not expired and (total <= self.results_max_bytes or p.suffix == ".part")):
+                continue
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            freed += size
+        return {"removed": removed, "freed_bytes": freed, "kept_bytes": total}
 
     def write(self, payload: Dict[str, Any]) -> None:
         if not self.save_to_file:
             return
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.log_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        try:
+            store = self.metrics_store()
+            store.ensure_seeded(self.log_file)
+        except Exception:
+            store = None
+        line = json.dumps(payload, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(line)
+        if store is not None:
+            try:
+                store.record(payload)
+            except Exception:
+                pass
 
 
 class MCPStdioClient:
     def __init__(self, server: ServerConfig, timeout_ms: int):
         self.server = server
-        self.timeout_s = max(1, int(timeout_ms / 1000))
+        self.timeout_s = max(0.2, timeout_ms / 1000.0)
         self.proc: Optional[subprocess.Popen[bytes]] = None
         self.req_id = 0
         self._buf = bytearray()
+        self._body_start = 0
+        self._body_len: Optional[int] = None
 
     def __enter__(self) -> "MCPStdioClient":
         cmd = [self.server.command] + self.server.args
@@ -216,7 +361,7 @@ class MCPStdioClient:
         self.proc.stdin.write(header + payload)
         self.proc.stdin.flush()
 
-    def _read_one(self, timeout_s: int) -> Dict[str, Any]:
+    def _read_one(self, timeout_s: float) -> Dict[str, Any]:
         if self.proc is None or self.proc.stdout is None:
             raise MCPError("PROTOCOL_IO", "stdio client not started")
         sel = selectors.DefaultSelector()
@@ -229,7 +374,7 @@ class MCPStdioClient:
                 if not events:
                     continue
                 for _key, _mask in events:
-                    chunk = self.proc.stdout.read1(4096)
+                    chunk = self.proc.stdout.read1(65536)
                     if not chunk:
                         raise MCPError("PROTOCOL_EOF", "MCP stdio closed unexpectedly")
                     self._buf.extend(chunk)
@@ -241,31 +386,40 @@ class MCPStdioClient:
         raise MCPError("PROTOCOL_TIMEOUT", "MCP stdio response timeout")
 
     def _try_parse_message(self) -> Optional[Dict[str, Any]]:
-        sep = b"\r\n\r\n"
-        if sep in self._buf:
-            h_end = self._buf.index(sep)
-            header_blob = bytes(self._buf[:h_end]).decode("ascii", errors="replace")
-            content_len = 0
-            for line in header_blob.split("\r\n"):
-                if line.lower().startswith("content-length:"):
-                    try:
-                        content_len = int(line.split(":", 1)[1].strip())
-                    except ValueError:
-                        content_len = 0
-            if content_len <= 0:
+        # Parse in place: header offsets are remembered across chunks and the body is
+        # decoded straight from a memoryview, so large payloads are not copied per chunk.
+        if self._body_len is None:
+            h_end = self._buf.find(b"\r\n\r\n", 0, 8192)
+            if h_end >= 0:
+                header_blob = self._buf[:h_end].decode("ascii", errors="replace")
+                content_len = 0
+                for line in header_blob.split("\r\n"):
+                    if line.lower().startswith("content-length:"):
+                        try:
+                            content_len = int(line.split(":", 1)[1].strip())
+                        except ValueError:
+                            content_len = 0
+                if content_len <= 0:
+                    return None
+                self._body_start = h_end + 4
+                self._body_len = content_len
+        if self._body_len is not None:
+            end = self._body_start + self._body_len
+            if len(self._buf) < end:
                 return None
-            body_start = h_end + len(sep)
-            if len(self._buf) < body_start + content_len:
-                return None
-            body = bytes(self._buf[body_start: body_start + content_len])
-            del self._buf[: body_start + content_len]
-            return json.loads(body.decode("utf-8", errors="replace"))
-
-        if b"\n" in self._buf:
-            line, _, rest = bytes(self._buf).partition(b"\n")
-            txt = line.decode("utf-8", errors="replace").strip()
+            with memoryview(self._buf) as mv:
+                body = str(mv[self._body_start: end], "utf-8", errors="replace")
+            del self._buf[:end]
+            self._body_len = None
+            self._body_start = 0
+            return json.loads(body)
+
+        nl = self._buf.find(b"\n")
+        if nl >= 0:
+            with memoryview(self._buf) as mv:
+                txt = str(mv[:nl], "utf-8", errors="replace").strip()
             if txt.startswith("{") and txt.endswith("}"):
-                self._buf = bytearray(rest)
+                del self._buf[: nl + 1]
                 return json.loads(txt)
         return None
 
@@ -299,7 +453,7 @@ class MCPStdioClient:
 class MCPSseClient:
     def __init__(self, server: ServerConfig, timeout_ms: int):
         self.server = server
-        self.timeout_s = max(1, int(timeout_ms / 1000))
+        self.timeout_s = max(0.2, timeout_ms / 1000.0)
         self.req_id = 0
 
     def _endpoint(self) -> str:
@@ -337,12 +491,12 @@ class ProtocolExecutor:
     def __init__(self, timeout_ms: int):
         self.timeout_ms = timeout_ms
 
-    def _run_stdio(self, server: ServerConfig, method: str, params: Dict[str, Any]) -> Any:
-        with MCPStdioClient(server, self.timeout_ms) as c:
+    def _run_stdio(self, server: ServerConfig, method: str, params: Dict[str, Any], timeout_ms: Optional[int] = None) -> Any:
+        with MCPStdioClient(server, timeout_ms or self.timeout_ms) as c:
             return c.request(method, params)
 
-    def _run_sse(self, server: ServerConfig, method: str, params: Dict[str, Any]) -> Any:
-        c = MCPSseClient(server, self.timeout_ms)
+    def _run_sse(self, server: ServerConfig, method: str, params: Dict[str, Any], timeout_ms: Optional[int] = None) -> Any:
+        c = MCPSseClient(server, timeout_ms or self.timeout_ms)
         if method == "tools/list":
             _ = c.request(
                 "initialize",
@@ -362,13 +516,19 @@ class ProtocolExecutor:
             result = self._run_stdio(server, method, {})
         return result.get("tools", result if isinstance(result, list) else [])
 
-    def call_tool(self, server: ServerConfig, tool: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    def call_tool(
+        self,
+        server: ServerConfig,
+        tool: str,
+        params: Dict[str, Any],
+        timeout_ms: Optional[int] = None,
+    ) -> Dict[str, Any]:
         method = "tools/call"
         request = {"name": tool, "arguments": params}
         if server.transport == "sse":
-            result = self._run_sse(server, method, request)
+            result = self._run_sse(server, method, request, timeout_ms)
         else:
-            result = self._run_stdio(server, method, request)
+            result = self._run_stdio(server, method, request, timeout_ms)
         return result if isinstance(result, dict) else {"result": result}
 
 
@@ -586,24 +746,30 @@ class Router:
     def __init__(self, routes_file: Path = ROUTES_FILE):
         self.routes_file = routes_file
         self.rules = self._load_rules()
+        self.matcher = self._compile()
 
     def _load_rules(self) -> List[Dict[str, Any]]:
         if self.routes_file.exists():
             return load_json(self.routes_file).get("rules", [])
         return []
 
+    def _compile(self) -> KeywordAutomaton:
+        matcher = KeywordAutomaton()
+        for idx, rule in enumerate(self.rules):
+            matcher.add_many(rule.get("keywords", []), idx)
+        return matcher.build()
+
+    def match(self, text: str) -> Dict[int, List[Any]]:
+        """Keyword hits per rule index, from one pass over the text."""
+        return self.matcher.match(text.strip())
+
     def route(self, text: str) -> Dict[str, Any]:
-        low = text.strip().lower()
         best: Optional[Tuple[float, Dict[str, Any]]] = None
-        for rule in self.rules:
-            score = 0.0
-            hits = []
-            for kw in rule.get("keywords", []):
-                if str(kw).lower() in low:
-                    score += 1.0
-                    hits.append(kw)
-            if score <= 0:
-                continue
+        hits_by_rule = self.match(text)
+        for idx in sorted(hits_by_rule):
+            rule = self.rules[idx]
+            hits = hits_by_rule[idx]
+            score = float(len(hits))
             denom = max(1.0, len(rule.get("keywords", [])) * 0.5)
             cand = {
                 "rule": rule.get("name"),
@@ -636,6 +802,7 @@ class Runtime:
         self.audit = AuditLogger(registry)
         self.timeout_ms = registry.timeout_ms()
         self.protocol = ProtocolExecutor(registry.protocol_timeout_ms())
+        self._latency_cache: Dict[Tuple[str, str], Tuple[float, Dict[str, int]]] = {}
 
     def _local_adapter_for(self, server_name: str) -> Adapter:
         srv = self.registry.get_server(server_name, require_enabled=True)
@@ -656,8 +823,123 @@ class Runtime:
     def _protocol_list_tools(self, srv: ServerConfig) -> List[Dict[str, Any]]:
         return self.protocol.list_tools(srv)
 
-    def _protocol_call(self, srv: ServerConfig, tool: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        return self.protocol.call_tool(srv, tool, params)
+    def _protocol_call(
+        self,
+        srv: ServerConfig,
+        tool: str,
+        params: Dict[str, Any],
+        timeout_ms: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return self.protocol.call_tool(srv, tool, params, timeout_ms=timeout_ms)
+
+    def _local_call(self, server: str, tool: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._local_adapter_for(server).call_tool(tool, params)
+
+    def _latency_profile(self, server: str, tool: str) -> Dict[str, int]:
+        key = (server, tool)
+        now = time.monotonic()
+        hit = self._latency_cache.get(key)
+        if hit is not None and now - hit[0] < 30:
+            return hit[1]
+        try:
+            prof = self.audit.metrics_store().latency_profile(server, tool)
+        except Exception:
+            prof = {"total": 0, "p90_ms": 0, "p95_ms": 0}
+        self._latency_cache[key] = (now, prof)
+        return prof
+
+    def _record_protocol_latency(self, server: str, tool: str, duration_ms: int) -> None:
+        if not self.audit.save_to_file:
+            return
+        try:
+            self.audit.metrics_store().record_protocol_latency(server, tool, duration_ms)
+        except Exception:
+            pass
+
+    def protocol_timeout_for(self, server: str, tool: str) -> int:
+        """Protocol timeout from observed p95 protocol-path latency, clamped to [minMs, maxMs]; static setting until enough samples."""
+        base = self.registry.protocol_timeout_ms()
+        cfg = self.registry.adaptive_timeout()
+        if not cfg.get("enabled", True):
+            return base
+        prof = self._latency_profile(server, tool)
+        if prof["total"] < int(cfg.get("minSamples", 20)) or prof["p95_ms"] <= 0:
+            return base
+        adaptive = prof["p95_ms"] * float(cfg.get("multiplier", 1.5))
+        return int(min(max(adaptive, float(cfg.get("minMs", 300))), float(cfg.get("maxMs", base * 4))))
+
+    def hedge_delay_for(self, server: str, tool: str) -> Optional[int]:
+        """How long the protocol path may run before the local adapter is fired in parallel; None disables hedging."""
+        cfg = self.registry.hedging()
+        if not cfg.get("enabled", False) or tool not in set(cfg.get("tools", [])):
+            return None
+        prof = self._latency_profile(server, tool)
+        if prof["total"] < int(cfg.get("minSamples", 20)):
+            return int(cfg.get("fallbackDelayMs", self.registry.protocol_timeout_ms() // 2))
+        return max(1, prof["p90_ms"] if int(cfg.get("percentile", 90)) <= 90 else prof["p95_ms"])
+
+    def _hedged_call(
+        self,
+        srv: ServerConfig,
+        tool: str,
+        params: Dict[str, Any],
+        timeout_ms: int,
+        delay_ms: int,
+        hedge: Dict[str, Any],
+    ) -> Tuple[Dict[str, Any], str]:
+        """Race the protocol path against the local adapter once `delay_ms` passes; first success wins.
+
+        A running call cannot be interrupted, so the loser keeps going in its worker thread until
+        it finishes or hits its own timeout (`timeout_ms` for the protocol path, the adapter's
+        HTTP timeout for local) and its result is discarded. A successful protocol call is
+        recorded as a latency sample whether it wins or not, so slow-but-healthy servers are not
+        hidden from the p90/p95 by hedges that always fire first.
+        """
+        primary = f"protocol:{srv.transport}"
+        pool = ThreadPoolExecutor(max_workers=2)
+        started = time.time()
+        first = pool.submit(self._protocol_call, srv, tool, params, timeout_ms)
+
+        def _sample(fut) -> None:
+            if not fut.cancelled() and fut.exception() is None:
+                self._record_protocol_latency(srv.name, tool, int((time.time() - started) * 1000))
+
+        first.add_done_callback(_sample)
+        futures = {first: primary}
+        errors: Dict[str, str] = {}
+        try:
+            pending = set(futures)
+            done, pending = wait(pending, timeout=delay_ms / 1000.0)
+            if not done:
+                hedge["fired"] = True
+                hedged = pool.submit(self._local_call, srv.name, tool, params)
+                futures[hedged] = "local"
+                pending.add(hedged)
+            while done or pending:
+                for fut in done:
+                    path = futures[fut]
+                    try:
+                        out = fut.result()
+                    except Exception as e:
+                        errors[path] = f"{type(e).__name__}: {e}"
+                        continue
+                    hedge["winner"] = path
+                    if path == "local" and primary in errors:
+                        out = {"protocol_fallback": {"fallback_reason": errors[primary]}, **out}
+                    return out, path
+                if not pending and not hedge["fired"]:
+                    # Primary failed before the hedge delay: plain local fallback.
+                    hedge["fired"] = True
+                    hedged = pool.submit(self._local_call, srv.name, tool, params)
+                    futures[hedged] = "local"
+                    pending.add(hedged)
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        hedge["errors"] = errors
+        raise MCPError("HEDGE_ALL_FAILED", json.dumps(errors, ensure_ascii=False))
 
     def list_tools(self, server: Optional[str] = None) -> Dict[str, Any]:
         servers = [self.registry.get_server(server)] if server else self.registry.list_servers(enabled_only=True)
@@ -682,21 +964,31 @@ class Runtime:
         err = None
         output: Dict[str, Any] = {}
         mode = "local"
+        timeout_ms: Optional[int] = None
+        protocol_ms: Optional[int] = None
+        hedge: Dict[str, Any] = {}
         try:
             srv = self.registry.get_server(server, require_enabled=True)
             if "command" in params:
                 self.policy.validate_command_text(str(params.get("command", "")))
 
             if self.registry.protocol_preferred():
+                timeout_ms = self.protocol_timeout_for(server, tool)
+                delay_ms = self.hedge_delay_for(server, tool)
+                if delay_ms is not None and delay_ms < timeout_ms:
+                    hedge = {"delay_ms": delay_ms, "fired": False, "winner": ""}
+                    output, mode = self._hedged_call(srv, tool, params, timeout_ms, delay_ms, hedge)
+                    return output
                 try:
-                    output = self._protocol_call(srv, tool, params)
+                    t_proto = time.time()
+                    output = self._protocol_call(srv, tool, params, timeout_ms)
+                    protocol_ms = int((time.time() - t_proto) * 1000)
                     mode = f"protocol:{srv.transport}"
                     return output
                 except Exception as e:
                     output = {"fallback_reason": str(e)}
 
-            local = self._local_adapter_for(server)
-            local_out = local.call_tool(tool, params)
+            local_out = self._local_call(server, tool, params)
             if output:
                 local_out = {"protocol_fallback": output, **local_out}
             output = local_out
@@ -708,21 +1000,33 @@ class Runtime:
             raise
         finally:
             duration_ms = int((time.time() - start) * 1000)
-            self.audit.write(
-                {
-                    "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "trace_id": trace_id,
-                    "server": server,
-                    "tool": tool,
-                    "params": params,
-                    "status": status,
-                    "duration_ms": duration_ms,
-                    "mode": mode,
-                    "error": err,
-                    "route": route_meta or {},
-                    "result_preview": output if status == "ok" else None,
-                }
-            )
+            record = {
+                "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "trace_id": trace_id,
+                "server": server,
+                "tool": tool,
+                "params": params,
+                "status": status,
+                "duration_ms": duration_ms,
+                "mode": mode,
+                "error": err,
+                "route": route_meta or {},
+                "result_preview": None,
+            }
+            if status == "ok" and self.audit.save_to_file:
+                try:
+                    record["result_preview"], ref = self.audit.spool_result(output)
+                    if ref is not None:
+                        record["result_ref"] = ref
+                except Exception as e:
+                    record["result_preview"] = f"<unserializable result: {type(e).__name__}>"
+            if timeout_ms is not None:
+                record["timeout_ms"] = timeout_ms
+            if protocol_ms is not None:
+                record["protocol_ms"] = protocol_ms
+            if hedge:
+                record["hedge"] = hedge
+            self.audit.write(record)
 
 
 def _diagnose_sample(server_name: str) -> Tuple[str, Dict[str, Any]]:
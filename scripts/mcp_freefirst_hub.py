@@ -9,14 +9,28 @@ import json
 import os
 import re
 import ssl
+import time
 import tomllib
+import urllib.parse
 import urllib.request
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+try:
+    from scripts.http_cache import shared_http_cache
+except ImportError:
+    from http_cache import shared_http_cache
 
 ROOT = Path(__file__).resolve().parents[1]
 ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
 CFG_DEFAULT = ROOT / "config" / "mcp_freefirst.toml"
+DEFAULT_CACHE_MAX_AGE_SEC = 1800
+# run_sync fetches in parallel: pool size, concurrent requests per host, total wall-clock budget
+DEFAULT_MAX_WORKERS = 6
+DEFAULT_PER_HOST_LIMIT = 2
+DEFAULT_SYNC_BUDGET_SEC = 20
 
 
 def load_cfg(path: Path) -> Dict[str, Any]:
@@ -65,7 +79,7 @@ def html_to_text(html: str, max_len: int = 1200) -> str:
     return txt[:max_len]
 
 
-def _open_with_ssl_strategy(req: urllib.request.Request, timeout: int, verify_ssl: bool, insecure_fallback: bool):
+def _open_with_ssl_strategy(req: urllib.request.Request, timeout: float, verify_ssl: bool, insecure_fallback: bool):
     if not str(req.full_url).lower().startswith("https://"):
         return urllib.request.urlopen(req, timeout=timeout), "plain_http"
 
@@ -92,20 +106,47 @@ def _open_with_ssl_strategy(req: urllib.request.Request, timeout: int, verify_ss
         raise
 
 
-def fetch_one(url: str, timeout: int, user_agent: str, verify_ssl: bool, insecure_fallback: bool) -> Dict[str, Any]:
-    req = urllib.request.Request(url=url, headers={"User-Agent": user_agent}, method="GET")
-    resp_obj, ssl_mode = _open_with_ssl_strategy(req, timeout=timeout, verify_ssl=verify_ssl, insecure_fallback=insecure_fallback)
-    with resp_obj as resp:
-        raw = resp.read(300_000)
-        body = raw.decode("utf-8", errors="replace")
-        return {
-            "http_status": int(getattr(resp, "status", 200)),
-            "content_type": str(resp.headers.get("Content-Type", "")),
-            "bytes": len(raw),
-            "title": extract_title(body),
-            "snippet": html_to_text(body),
-            "ssl_mode": ssl_mode,
-        }
+def fetch_one(
+    url: str,
+    timeout: float,
+    user_agent: str,
+    verify_ssl: bool,
+    insecure_fallback: bool,
+    max_age: float = DEFAULT_CACHE_MAX_AGE_SEC,
+    offline: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Fetch through the shared HTTP cache; the SSL strategy only runs when the network is used.
+
+    A failed fetch raises even when an older copy is cached, so run_sync reports the source
+    as an error; cached copies are served as `stale` only in offline mode.
+    """
+    ssl_modes: List[str] = []
+
+    def opener(req: urllib.request.Request, t: float):
+        resp, mode = _open_with_ssl_strategy(req, timeout=t, verify_ssl=verify_ssl, insecure_fallback=insecure_fallback)
+        ssl_modes.append(mode)
+        return resp
+
+    res = shared_http_cache().get(
+        url,
+        {"User-Agent": user_agent},
+        max_age=max_age,
+        timeout=timeout,
+        offline=offline,
+        stale_on_error=False,
+        max_bytes=300_000,
+        opener=opener,
+    )
+    body = res["body"].decode("utf-8", errors="replace")
+    return {
+        "http_status": res["status"],
+        "content_type": res["content_type"],
+        "bytes": len(res["body"]),
+        "title": extract_title(body),
+        "snippet": html_to_text(body),
+        "ssl_mode": ssl_modes[-1] if ssl_modes else "",
+        "cache": res["cache"],
+    }
 
 
 def classify_error(msg: str) -> str:
@@ -123,12 +164,28 @@ def classify_error(msg: str) -> str:
     return "other"
 
 
-def run_sync(cfg: Dict[str, Any], query: str, topic: str, max_sources: int) -> Dict[str, Any]:
+def _host(src: Dict[str, Any]) -> str:
+    return urllib.parse.urlsplit(str(src.get("url", ""))).netloc.lower()
+
+
+def run_sync(cfg: Dict[str, Any], query: str, topic: str, max_sources: int, offline: bool = False) -> Dict[str, Any]:
+    """Fetch the selected sources concurrently within one wall-clock budget.
+
+    Sources wait in per-host queues and are submitted to the bounded pool only while their
+    host has fewer than `per_host_limit` requests in flight, so a busy host never ties up
+    workers that idle hosts could use; each request's timeout shrinks to the budget left.
+    Sources not finished when the budget ends are recorded as timeouts and coverage counts
+    only what finished.
+    """
     defaults = cfg.get("defaults", {})
+    default_max_age = float(defaults.get("cache_max_age_sec", DEFAULT_CACHE_MAX_AGE_SEC))
     timeout = int(defaults.get("request_timeout_sec", 12))
     ua = str(defaults.get("user_agent", "AgentSystem-FreeFirst/1.0"))
     verify_ssl = bool(defaults.get("ssl_verify", True))
     insecure_fallback = bool(defaults.get("ssl_insecure_fallback", True))
+    max_workers = max(1, int(defaults.get("max_workers", DEFAULT_MAX_WORKERS)))
+    per_host_limit = max(1, int(defaults.get("per_host_limit", DEFAULT_PER_HOST_LIMIT)))
+    budget = float(defaults.get("sync_budget_sec", DEFAULT_SYNC_BUDGET_SEC))
     out_dir = Path(str(defaults.get("output_dir", ROOT / "日志/mcp/freefirst")))
     if not out_dir.is_absolute():
         out_dir = ROOT / out_dir
@@ -139,33 +196,88 @@ def run_sync(cfg: Dict[str, Any], query: str, topic: str, max_sources: int) -> D
     out_jsonl = out_dir / f"raw_{ts}.jsonl"
     latest = out_dir / "latest.json"
 
+    start = time.monotonic()
+    deadline = start + budget
+    sources = select_sources(cfg, topic, max_sources)
+
+    def fetch_src(src: Dict[str, Any]) -> Dict[str, Any]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("timed out: sync budget spent before the request started")
+        return fetch_one(
+            str(src.get("url", "")),
+            timeout=min(float(timeout), remaining),
+            user_agent=ua,
+            verify_ssl=verify_ssl,
+            insecure_fallback=insecure_fallback,
+            max_age=float(src.get("max_age_sec", default_max_age)),
+            offline=True if offline else None,
+        )
+
     records: List[Dict[str, Any]] = []
-    for src in select_sources(cfg, topic, max_sources):
-        rec = {
-            "ts": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "date": day,
-            "query": query,
-            "topic": topic,
-            "source_id": src["id"],
-            "source_name": src.get("name", src["id"]),
-            "source_tier": src.get("tier", "L2_public"),
-            "url": src.get("url", ""),
-            "status": "ok",
-            "error": "",
-        }
+    timed_out = 0
+    futures: List[Any] = [None] * len(sources)
+    if sources:
+        queues: Dict[str, deque] = {}
+        for idx, src in enumerate(sources):
+            queues.setdefault(_host(src), deque()).append(idx)
+        in_flight = dict.fromkeys(queues, 0)
+        pending: Dict[Any, str] = {}
+        workers = min(max_workers, len(sources))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="freefirst")
+
+        def refill() -> None:
+            # round-robin over hosts with a free slot until the pool is full or nothing is eligible
+            submitted = True
+            while submitted and len(pending) < workers:
+                submitted = False
+                for host, queue in queues.items():
+                    if len(pending) >= workers:
+                        break
+                    if queue and in_flight[host] < per_host_limit:
+                        idx = queue.popleft()
+                        futures[idx] = pool.submit(fetch_src, sources[idx])
+                        pending[futures[idx]] = host
+                        in_flight[host] += 1
+                        submitted = True
+
         try:
-            data = fetch_one(
-                rec["url"],
-                timeout=timeout,
-                user_agent=ua,
-                verify_ssl=verify_ssl,
-                insecure_fallback=insecure_fallback,
-            )
-            rec.update(data)
-        except Exception as e:
-            rec["status"] = "error"
-            rec["error"] = str(e)
-        records.append(rec)
+            refill()
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    in_flight[pending.pop(fut)] -= 1
+                refill()
+        finally:
+            # stragglers are abandoned; their requests end at their own (budget-capped) timeout
+            pool.shutdown(wait=False, cancel_futures=True)
+        for src, fut in zip(sources, futures):
+            rec = {
+                "ts": dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "date": day,
+                "query": query,
+                "topic": topic,
+                "source_id": src["id"],
+                "source_name": src.get("name", src["id"]),
+                "source_tier": src.get("tier", "L2_public"),
+                "url": src.get("url", ""),
+                "status": "ok",
+                "error": "",
+            }
+            if fut is None or not fut.done() or fut.cancelled():
+                timed_out += 1
+                rec["status"] = "error"
+                rec["error"] = f"timed out: not finished within the {budget:g}s sync budget"
+            else:
+                try:
+                    rec.update(fut.result())
+                except Exception as e:
+                    rec["status"] = "error"
+                    rec["error"] = str(e)
+            records.append(rec)
 
     with out_jsonl.open("w", encoding="utf-8") as f:
         for r in records:
@@ -173,11 +285,15 @@ def run_sync(cfg: Dict[str, Any], query: str, topic: str, max_sources: int) -> D
 
     ok = [r for r in records if r.get("status") == "ok"]
     ssl_modes: Dict[str, int] = {}
+    cache_states: Dict[str, int] = {}
     err_cls: Dict[str, int] = {}
     for r in records:
         mode = str(r.get("ssl_mode", ""))
         if mode:
             ssl_modes[mode] = ssl_modes.get(mode, 0) + 1
+        state = str(r.get("cache", ""))
+        if state:
+            cache_states[state] = cache_states.get(state, 0) + 1
         if r.get("status") == "error":
             c = classify_error(str(r.get("error", "")))
             err_cls[c] = err_cls.get(c, 0) + 1
@@ -188,7 +304,10 @@ def run_sync(cfg: Dict[str, Any], query: str, topic: str, max_sources: int) -> D
         "attempted": len(records),
         "succeeded": len(ok),
         "coverage_rate": round((len(ok) / len(records)) * 100, 2) if records else 0.0,
+        "timed_out": timed_out,
+        "elapsed_sec": round(time.monotonic() - start, 3),
         "ssl_mode_counts": ssl_modes,
+        "cache_counts": cache_states,
         "error_class_counts": err_cls,
         "out_jsonl": str(out_jsonl),
     }
@@ -202,6 +321,7 @@ def main() -> int:
     parser.add_argument("--query", default="")
     parser.add_argument("--topic", default="")
     parser.add_argument("--max-sources", type=int, default=0)
+    parser.add_argument("--offline", action="store_true", help="serve cached responses only")
     args = parser.parse_args()
 
     cfg_path = Path(args.config)
@@ -213,7 +333,7 @@ def main() -> int:
     topic = args.topic.strip() or detect_topic(cfg, query)
     max_sources = args.max_sources if args.max_sources > 0 else int(cfg.get("defaults", {}).get("max_sources", 6))
 
-    print(json.dumps(run_sync(cfg, query, topic, max_sources), ensure_ascii=False, indent=2))
+    print(json.dumps(run_sync(cfg, query, topic, max_sources, offline=args.offline), ensure_ascii=False, indent=2))
     return 0
 
 
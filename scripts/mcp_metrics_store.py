@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Rolling pre-aggregated MCP call metrics (per day/server/tool counters + latency histogram)."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
+DEFAULT_DB = ROOT / "日志" / "mcp" / "call_metrics.db"
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS_MS = [50, 100, 200, 500, 1000, 2000, 3000, 5000, 10000, 30000]
+_BUCKET_COLS = [f"b{i}" for i in range(len(LATENCY_BUCKETS_MS) + 1)]
+
+
+def bucket_index(duration_ms: int) -> int:
+    for idx, bound in enumerate(LATENCY_BUCKETS_MS):
+        if duration_ms <= bound:
+            return idx
+    return len(LATENCY_BUCKETS_MS)
+
+
+def histogram_percentile(hist: List[int], p: float, max_ms: int = 0) -> int:
+    """Upper bound of the bucket holding the p-th percentile (same rank rule as mcp_observability.percentile)."""
+    total = sum(hist)
+    if total <= 0:
+        return 0
+    rank = max(1, int(math.ceil((p / 100.0) * total)))
+    seen = 0
+    for idx, cnt in enumerate(hist):
+        seen += cnt
+        if seen >= rank:
+            if idx >= len(LATENCY_BUCKETS_MS):
+                return int(max_ms)
+            return int(min(LATENCY_BUCKETS_MS[idx], max_ms) if max_ms else LATENCY_BUCKETS_MS[idx])
+    return int(max_ms)
+
+
+def _day_of(payload: Dict[str, Any]) -> str:
+    ts = str(payload.get("ts", ""))
+    return ts[:10] if len(ts) >= 10 else "unknown"
+
+
+def _protocol_ms(payload: Dict[str, Any]) -> Optional[int]:
+    """Protocol-path latency of an audit line, or None when the line is not a successful protocol call.
+
+    New lines carry `protocol_ms`. Older lines fall back to `duration_ms` when the protocol
+    path answered directly; hedged lines are skipped because the runtime records those itself.
+    """
+    if payload.get("protocol_ms") is not None:
+        return int(payload["protocol_ms"])
+    if payload.get("status") != "ok" or not str(payload.get("mode", "")).startswith("protocol:") or "hedge" in payload:
+        return None
+    return int(payload.get("duration_ms", 0) or 0)
+
+
+class CallMetricsStore:
+    """Metrics db created on the first write; reads of a store that was never written see no data."""
+
+    def __init__(self, db_path: Path = DEFAULT_DB):
+        self.db_path = db_path if db_path.is_absolute() else ROOT / db_path
+        self._seeded = False
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self._ready or self.db_path.exists()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                    self._init_db()
+                    self._ready = True
+        return self._open()
+
+    def _init_db(self) -> None:
+        buckets = ",\n".join(f"  {c} INTEGER NOT NULL DEFAULT 0" for c in _BUCKET_COLS)
+        with self._open() as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS call_metrics (
+                  day TEXT NOT NULL,
+                  server TEXT NOT NULL,
+                  tool TEXT NOT NULL,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  success INTEGER NOT NULL DEFAULT 0,
+                  failed INTEGER NOT NULL DEFAULT 0,
+                  lat_sum_ms INTEGER NOT NULL DEFAULT 0,
+                  lat_max_ms INTEGER NOT NULL DEFAULT 0,
+                {buckets},
+                  PRIMARY KEY(day, server, tool)
+                )
+                """
+            )
+            # latency of successful protocol-path calls only (adaptive timeout / hedge delay input);
+            # call_metrics durations also include timeouts, local fallbacks and failures
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS protocol_latency (
+                  day TEXT NOT NULL,
+                  server TEXT NOT NULL,
+                  tool TEXT NOT NULL,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  lat_max_ms INTEGER NOT NULL DEFAULT 0,
+                {buckets},
+                  PRIMARY KEY(day, server, tool)
+                )
+                """
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT NOT NULL)")
+            conn.commit()
+
+    def _upsert(self, conn: sqlite3.Connection, payload: Dict[str, Any]) -> None:
+        duration = int(payload.get("duration_ms", 0) or 0)
+        ok = 1 if payload.get("status") == "ok" else 0
+        col = _BUCKET_COLS[bucket_index(duration)]
+        conn.execute(
+            f"""
+            INSERT INTO call_metrics(day, server, tool, total, success, failed, lat_sum_ms, lat_max_ms, {col})
+            VALUES(?,?,?,1,?,?,?,?,1)
+            ON CONFLICT(day, server, tool) DO UPDATE SET
+              total=total+1,
+              success=success+excluded.success,
+              failed=failed+excluded.failed,
+              lat_sum_ms=lat_sum_ms+excluded.lat_sum_ms,
+              lat_max_ms=MAX(lat_max_ms, excluded.lat_max_ms),
+              {col}={col}+1
+            """,
+            (
+                _day_of(payload),
+                str(payload.get("server", "unknown")),
+                str(payload.get("tool", "unknown")),
+                ok,
+                1 - ok,
+                duration,
+                duration,
+            ),
+        )
+        protocol_ms = _protocol_ms(payload)
+        if protocol_ms is not None:
+            self._upsert_protocol(conn, _day_of(payload), str(payload.get("server", "unknown")), str(payload.get("tool", "unknown")), protocol_ms)
+
+    def _upsert_protocol(self, conn: sqlite3.Connection, day: str, server: str, tool: str, duration: int) -> None:
+        col = _BUCKET_COLS[bucket_index(duration)]
+        conn.execute(
+            f"""
+            INSERT INTO protocol_latency(day, server, tool, total, lat_max_ms, {col})
+            VALUES(?,?,?,1,?,1)
+            ON CONFLICT(day, server, tool) DO UPDATE SET
+              total=total+1,
+              lat_max_ms=MAX(lat_max_ms, excluded.lat_max_ms),
+              {col}={col}+1
+            """,
+            (day, server, tool, duration),
+        )
+
+    def record_protocol_latency(self, server: str, tool: str, duration_ms: int, ts: str = "") -> None:
+        """Protocol-path sample that has no audit line of its own (e.g. a hedged call that lost the race)."""
+        day = _day_of({"ts": ts or time.strftime("%Y-%m-%d %H:%M:%S")})
+        with self._connect() as conn:
+            self._upsert_protocol(conn, day, server, tool, int(duration_ms))
+            conn.commit()
+
+    def record(self, payload: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            self._upsert(conn, payload)
+            conn.commit()
+
+    def record_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        with self._connect() as conn:
+            for row in rows:
+                self._upsert(conn, row)
+                count += 1
+            conn.commit()
+        return count
+
+    def is_seeded(self) -> bool:
+        if not self.exists():
+            return False
+        with self._connect() as conn:
+            row = conn.execute("SELECT v FROM meta WHERE k='seeded_from_log'").fetchone()
+        return row is not None
+
+    def seed_from_log(self, log_path: Path) -> int:
+        """One-time backfill from the JSONL audit log; later calls are no-ops."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT v FROM meta WHERE k='seeded_from_log'").fetchone() is not None:
+                conn.rollback()
+                self._seeded = True
+                return 0
+            count = 0
+            if log_path.exists():
+                with open(log_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            row = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        self._upsert(conn, row)
+                        count += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO meta(k, v) VALUES('seeded_from_log', ?)",
+                (json.dumps({"log": str(log_path), "rows": count}, ensure_ascii=False),),
+            )
+            conn.commit()
+        self._seeded = True
+        return count
+
+    def ensure_seeded(self, log_path: Path) -> None:
+        if self._seeded:
+            return
+        if self.is_seeded():
+            self._seeded = True
+            return
+        self.seed_from_log(log_path)
+
+    def server_tool_metrics(self, days: int = 14) -> Dict[str, Dict[str, Any]]:
+        """Per server/tool stats over the latest `days` days that have data (matches aggregate() windowing)."""
+        if not self.exists():
+            return {}
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in _BUCKET_COLS)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT server, tool, SUM(total) AS total, SUM(success) AS success, SUM(failed) AS failed,
+                       SUM(lat_sum_ms) AS lat_sum_ms, MAX(lat_max_ms) AS lat_max_ms, {sums}
+                FROM call_metrics
+                WHERE day IN (SELECT DISTINCT day FROM call_metrics ORDER BY day DESC LIMIT ?)
+                GROUP BY server, tool
+                """,
+                (max(1, int(days)),),
+            ).fetchall()
+        out: Dict[str, Dict[str, Any]] = {}
+        for r in rows:
+            total = int(r["total"] or 0)
+            hist = [int(r[c] or 0) for c in _BUCKET_COLS]
+            out[f"{r['server']}/{r['tool']}"] = {
+                "server": r["server"],
+                "tool": r["tool"],
+                "total": total,
+                "success_rate": round((int(r["success"] or 0) / total) * 100, 2) if total else 0.0,
+                "avg_ms": round(int(r["lat_sum_ms"] or 0) / total, 2) if total else 0.0,
+                "p95_ms": histogram_percentile(hist, 95.0, int(r["lat_max_ms"] or 0)),
+                "failed": int(r["failed"] or 0),
+            }
+        return out
+
+    def latency_profile(self, server: str, tool: str, days: int = 14) -> Dict[str, int]:
+        """Sample count and p90/p95 of successful protocol-path latency for one server/tool.
+
+        Feeds adaptive timeouts and hedging, so timed-out, fallen-back and failed calls are excluded.
+        """
+        if not self.exists():
+            return {"total": 0, "p90_ms": 0, "p95_ms": 0}
+        sums = ", ".join(f"SUM({c}) AS {c}" for c in _BUCKET_COLS)
+        with self._connect() as conn:
+            r = conn.execute(
+                f"""
+                SELECT SUM(total) AS total, MAX(lat_max_ms) AS lat_max_ms, {sums}
+                FROM protocol_latency
+                WHERE server=? AND tool=?
+                  AND day IN (SELECT DISTINCT day FROM protocol_latency ORDER BY day DESC LIMIT ?)
+                """,
+                (server, tool, max(1, int(days))),
+            ).fetchone()
+        hist = [int(r[c] or 0) for c in _BUCKET_COLS] if r is not None else []
+        max_ms = int(r["lat_max_ms"] or 0) if r is not None else 0
+        return {
+            "total": sum(hist),
+            "p90_ms": histogram_percentile(hist, 90.0, max_ms),
+            "p95_ms": histogram_percentile(hist, 95.0, max_ms),
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MCP rolling call metrics store")
+    parser.add_argument("--db", default=str(DEFAULT_DB))
+    parser.add_argument("--seed-log", default="", help="backfill once from an audit JSONL log")
+    parser.add_argument("--days", type=int, default=14)
+    args = parser.parse_args()
+
+    store = CallMetricsStore(Path(args.db))
+    seeded = store.seed_from_log(Path(args.seed_log)) if args.seed_log else 0
+    rows = sorted(store.server_tool_metrics(days=args.days).values(), key=lambda x: x["total"], reverse=True)
+    print(json.dumps({"db": str(store.db_path), "seeded_rows": seeded, "server_tool": rows}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -26,6 +26,16 @@ def load_log_path() -> Path:
     return p
 
 
+def load_metrics_db_path() -> Path:
+    with open(CONFIG, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    fp = cfg.get("settings", {}).get("logging", {}).get("metricsDbPath", "日志/mcp/call_metrics.db")
+    p = Path(fp)
+    if not p.is_absolute():
+        p = ROOT / p
+    return p
+
+
 def percentile(vals: List[int], p: float) -> int:
     if not vals:
         return 0
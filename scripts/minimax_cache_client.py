@@ -27,6 +27,7 @@ MiniMax 主动缓存客户端 - 支持 Anthropic API 兼容的 Prompt 缓存功
 
 from __future__ import annotations
 
+import hashlib
 import os
 import time
 from dataclasses import dataclass, field
@@ -45,7 +46,14 @@ except ImportError:
     def secure_mask(value: str) -> str:
         return value[:8] + "****" if len(value) > 8 else "****"
 
+try:
+    from scripts.result_cache import ResultCache, shared_result_cache
+except ImportError:
+    from result_cache import ResultCache, shared_result_cache
+
 ROOT = Path(__file__).resolve().parents[1]
+# 服务端 prompt 缓存的本地状态（model + 系统提示哈希 -> 最近写入时间）
+PROMPT_CACHE_NS = "minimax_prompt"
 DEFAULT_CONFIG = ROOT / "config" / "image_creator_hub.toml"
 
 
@@ -83,6 +91,7 @@ class MiniMaxCacheClient:
         base_url: Optional[str] = None,
         model: Optional[str] = None,
         cache_ttl: int = CACHE_TTL_SECONDS,
+        engine: Optional[ResultCache] = None,
     ):
         """
         初始化缓存客户端
@@ -92,6 +101,7 @@ class MiniMaxCacheClient:
             base_url: API 端点（默认 https://api.minimaxi.com/anthropic）
             model: 使用的模型（默认 MiniMax-M2.5）
             cache_ttl: 缓存生命周期（默认 5 分钟）
+            engine: 记录 prompt 缓存状态的缓存引擎（默认进程共享实例）
         """
         self.api_key = api_key or os.getenv("MINIMAX_API_KEY", "").strip()
         if not self.api_key:
@@ -110,16 +120,32 @@ class MiniMaxCacheClient:
             api_key=self.api_key,
         )
 
-        # 缓存状态追踪
-        self._last_cache_time: Optional[float] = None
+        # 缓存状态追踪：每个系统提示独立记录，TTL 由缓存引擎惰性判断
+        self._engine = engine or shared_result_cache()
         self._last_stats: Optional[CacheStats] = None
         self._system_content: str = ""
-
-    def _is_cache_valid(self) -> bool:
-        """检查缓存是否在有效期内"""
-        if self._last_cache_time is None:
+        self._last_cache_key: Optional[str] = None
+
+    def _prompt_cache_key(self, system_content: str, model: Optional[str] = None) -> str:
+        digest = hashlib.sha256(system_content.encode("utf-8")).hexdigest()
+        return f"{model or self.model}:{digest}"
+
+    def _is_cache_valid(self, system_content: Optional[str] = None, model: Optional[str] = None) -> bool:
+        """检查缓存是否在有效期内（默认检查最近一次请求的系统提示）"""
+        if system_content is None:
+            key = self._last_cache_key
+        else:
+            key = self._prompt_cache_key(system_content, model)
+        if key is None:
             return False
-        return (time.time() - self._last_cache_time) < self.cache_ttl
+        return self._engine.get(key, namespace=PROMPT_CACHE_NS) is not None
+
+    def _mark_cached(self, system_content: str, model: Optional[str] = None) -> None:
+        """请求完成后刷新该系统提示的缓存有效期"""
+        key = self._prompt_cache_key(system_content, model)
+        self._engine.set(key, time.time(), ttl=self.cache_ttl, namespace=PROMPT_CACHE_NS)
+        self._system_content = system_content
+        self._last_cache_key = key
 
     def _build_system_block(
         self,
@@ -195,11 +221,7 @@ class MiniMaxCacheClient:
                 formatted_messages.append(msg)
 
         # 检查是否可以使用缓存
-        use_cache = (
-            self._is_cache_valid()
-            and self._system_content == system_content
-            and cache_system
-        )
+        use_cache = cache_system and self._is_cache_valid(system_content, model)
 
         request_kwargs = {
             "model": model or self.model,
@@ -218,8 +240,8 @@ class MiniMaxCacheClient:
         response = self._client.messages.create(**request_kwargs)
 
         # 更新缓存状态
-        self._system_content = system_content
-        self._last_cache_time = time.time()
+        if cache_system:
+            self._mark_cached(system_content, model)
 
         # 提取缓存统计
         if hasattr(response, "usage") and response.usage:
@@ -275,7 +297,7 @@ class MiniMaxCacheClient:
                 formatted_messages.append(msg)
 
         # 检查缓存
-        use_cache = self._is_cache_valid() and self._system_content == system_content
+        use_cache = cache_system and self._is_cache_valid(system_content, model)
 
         request_kwargs = {
             "model": model or self.model,
@@ -292,7 +314,9 @@ class MiniMaxCacheClient:
 
     def reset_cache(self):
         """手动重置缓存"""
-        self._last_cache_time = None
+        if self._last_cache_key is not None:
+            self._engine.delete(self._last_cache_key, namespace=PROMPT_CACHE_NS)
+        self._last_cache_key = None
         self._system_content = ""
 
     @property
@@ -226,16 +226,20 @@ def _merge_retrieved_sources(
         url = str(item.get("url", "")).strip()
         if any(title == str(existing.get("title", "")).strip() and url == str(existing.get("url", "")).strip() for existing in evidence):
             continue
-        evidence.append(
-            {
-                "id": str(item.get("id", f"S{next_idx}")).strip() or f"S{next_idx}",
-                "title": title,
-                "type": str(item.get("type", item.get("connector", "external"))).strip(),
-                "url": url,
-                "relevance": "medium",
-                "note": str(item.get("abstract", item.get("form", ""))).strip() or ("检索适配器返回，仍需核验原文" if lang == "zh" else "Returned by source adapter; validate original document"),
-            }
-        )
+        entry = {
+            "id": str(item.get("id", f"S{next_idx}")).strip() or f"S{next_idx}",
+            "title": title,
+            "type": str(item.get("type", item.get("connector", "external"))).strip(),
+            "url": url,
+            "relevance": "medium",
+            "note": str(item.get("abstract", item.get("form", ""))).strip() or ("检索适配器返回，仍需核验原文" if lang == "zh" else "Returned by source adapter; validate original document"),
+        }
+        passages = item.get("passages")
+        if isinstance(passages, list) and passages:
+            # knowledge hits: matched passages with file offsets, quotable without reopening the doc
+            entry["path"] = str(item.get("path", "")).strip()
+            entry["passages"] = passages
+        evidence.append(entry)
         plan.append(
             {
                 "name": title,
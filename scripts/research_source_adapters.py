@@ -6,12 +6,27 @@ from __future__ import annotations
 import json
 import os
 import re
-import ssl
 import sqlite3
+import threading
+import time
 import urllib.parse
 import urllib.request
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+try:
+    from scripts.knowledge_index import PASSAGES_PER_DOC, final_rank, index_generation, search_passages
+    from scripts.knowledge_vectors import dense_search
+    from scripts.http_cache import shared_http_cache
+    from scripts.result_cache import shared_result_cache
+except ImportError:
+    from knowledge_index import PASSAGES_PER_DOC, final_rank, index_generation, search_passages
+    from knowledge_vectors import dense_search
+    from http_cache import shared_http_cache
+    from result_cache import shared_result_cache
 
 ROOT = Path(__file__).resolve().parents[1]
 ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
@@ -24,51 +39,158 @@ OPENALEX_BASE = "https://api.openalex.org/works"
 SEC_SUBMISSIONS_BASE = "https://data.sec.gov/submissions"
 SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
 DEFAULT_USER_AGENT = "AgentSystem Research Hub/1.0 (contact: local-user)"
+HTTP_TIMEOUT_S = 30.0
+# max-age (seconds) of cached responses per source, by URL prefix; older entries are revalidated
+HTTP_MAX_AGE_S = [
+    (SEC_TICKERS_URL, 7 * 86400.0),
+    (SEC_SUBMISSIONS_BASE, 12 * 3600.0),
+    (OPENALEX_BASE, 24 * 3600.0),
+]
+DEFAULT_HTTP_MAX_AGE_S = 3600.0
+# lookup_sources: per-connector deadlines inside one overall budget (seconds); params
+# `lookup_timeout_s` (number or {connector: seconds}) and `lookup_budget_s` override them.
+CONNECTOR_TIMEOUT_S = {"knowledge": 5.0, "openalex": 12.0, "sec": 15.0}
+LOOKUP_BUDGET_S = 20.0
+# Index lookups are cached per (index generation, normalized query); the TTL is only a backstop
+# for indexes changed without going through knowledge_index.
+KNOWLEDGE_CACHE_NS = "knowledge_search"
+KNOWLEDGE_CACHE_TTL = 900.0
+
+# open index connections kept per process (LRU by index file)
+KNOWLEDGE_CONN_LIMIT = 4
+
+_KNOWLEDGE_CONNS: "OrderedDict[str, Tuple[sqlite3.Connection, int]]" = OrderedDict()
+_KNOWLEDGE_LOCK = threading.Lock()
+
+
+def _json_get(
+    url: str, headers: Dict[str, str] | None = None, timeout: float = HTTP_TIMEOUT_S, offline: bool | None = None
+) -> Dict[str, Any]:
+    """GET JSON through the shared on-disk HTTP cache (conditional revalidation, stale when offline)."""
+    max_age = next((age for prefix, age in HTTP_MAX_AGE_S if url.startswith(prefix)), DEFAULT_HTTP_MAX_AGE_S)
+    return shared_http_cache().get_json(url, headers, max_age=max_age, timeout=timeout, offline=offline)
+
 
+@contextmanager
+def _knowledge_conn(db_path: Path) -> Iterator[sqlite3.Connection]:
+    """Process-level connection per index file, reopened if the file is replaced; one query at a time.
 
-def _json_get(url: str, headers: Dict[str, str] | None = None) -> Dict[str, Any]:
-    req = urllib.request.Request(url=url, method="GET", headers=headers or {})
-    ctx = ssl.create_default_context()
-    with urllib.request.urlopen(req, timeout=30, context=ctx) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    At most KNOWLEDGE_CONN_LIMIT files stay open (least recently used closed first), and
+    connections to files that were deleted or replaced are closed on the next lookup, so no
+    descriptor outlives its index file for long.
+    """
+    key = str(db_path)
+    inode = os.stat(key).st_ino
+    with _KNOWLEDGE_LOCK:
+        for other, (conn, other_inode) in list(_KNOWLEDGE_CONNS.items()):
+            if other == key:
+                continue
+            try:
+                current = os.stat(other).st_ino == other_inode
+            except OSError:
+                current = False
+            if not current:
+                conn.close()
+                del _KNOWLEDGE_CONNS[other]
+        entry = _KNOWLEDGE_CONNS.get(key)
+        if entry is None or entry[1] != inode:
+            if entry is not None:
+                entry[0].close()
+            entry = _KNOWLEDGE_CONNS[key] = (sqlite3.connect(key, check_same_thread=False), inode)
+        _KNOWLEDGE_CONNS.move_to_end(key)
+        while len(_KNOWLEDGE_CONNS) > KNOWLEDGE_CONN_LIMIT:
+            _KNOWLEDGE_CONNS.popitem(last=False)[1][0].close()
+        yield entry[0]
+
+
+def _knowledge_row(idx: int, doc: Dict[str, Any], bm25: float) -> Dict[str, Any]:
+    passages = doc["passages"]
+    return {
+        "id": f"K{idx}",
+        "connector": "knowledge",
+        "title": str(doc["title"] or Path(doc["path"]).stem).strip(),
+        "type": str(doc["domain"] or "knowledge_doc").strip(),
+        "url": str(doc["source_url"] or "").strip(),
+        "path": str(doc["path"]).strip(),
+        "updated_at": str(doc["updated_date"] or "").strip(),
+        "confidence": float(doc["confidence"] or 0.0),
+        "snippet": passages[0]["snippet"] if passages else "",
+        # evidence locators: character offsets / start line into the source file
+        "passages": [{k: p[k] for k in ("heading", "line", "start", "end", "snippet")} for p in passages],
+        "_doc_id": int(doc["doc_id"]),
+        "_bm25": float(bm25),
+    }
 
 
 def _fts_query(db_path: Path, query: str, limit: int) -> List[Dict[str, Any]]:
-    if not db_path.exists():
-        return []
-    conn = sqlite3.connect(str(db_path))
     try:
-        cur = conn.cursor()
-        rows = cur.execute(
-            """
-            SELECT d.path, d.title, d.updated_date, d.source_url, d.confidence, COALESCE(d.domain, ''),
-                   snippet(docs_fts, 2, '[', ']', '...', 12) AS snippet_text
-            FROM docs_fts
-            JOIN docs d ON d.path = docs_fts.path
-            WHERE docs_fts MATCH ?
-            ORDER BY bm25(docs_fts)
-            LIMIT ?
-            """,
-            (query, max(1, min(20, limit))),
-        ).fetchall()
-    finally:
-        conn.close()
-    out: List[Dict[str, Any]] = []
-    for idx, row in enumerate(rows, start=1):
-        path, title, updated, source_url, confidence, domain, snippet = row
-        out.append(
-            {
-                "id": f"K{idx}",
-                "connector": "knowledge",
-                "title": str(title or Path(path).stem).strip(),
-                "type": str(domain or "knowledge_doc").strip(),
-                "url": str(source_url or "").strip(),
-                "path": str(path).strip(),
-                "updated_at": str(updated or "").strip(),
-                "confidence": float(confidence or 0.0),
-                "snippet": str(snippet or "").strip(),
-            }
-        )
+        with _knowledge_conn(db_path) as conn:
+            docs = search_passages(conn, query, max(1, min(20, limit)))
+    except sqlite3.OperationalError:
+        # index built before passages existed, or a query FTS5 cannot parse
+        return []
+    return [_knowledge_row(idx, doc, doc["bm25"]) for idx, doc in enumerate(docs, start=1)]
+
+
+def _hybrid_rerank(db_path: Path, rows: List[Dict[str, Any]], dense: List[tuple], limit: int) -> List[Dict[str, Any]]:
+    """Fuse BM25 rows with dense passage hits by RRF (knowledge_index.final_rank).
+
+    A document's dense rank is that of its best passage; dense-only documents are
+    looked up by id and carry the matching passages as their snippet.
+    """
+    by_id: Dict[int, Dict[str, Any]] = {row["_doc_id"]: row for row in rows}
+    bm25_rank = {row["_doc_id"]: idx for idx, row in enumerate(rows, start=1)}
+    with _knowledge_conn(db_path) as conn:
+        pids = [pid for pid, _score in dense]
+        marks = ",".join("?" * len(pids))
+        found = {
+            r[0]: r[1:]
+            for r in conn.execute(
+                f"SELECT id, doc_id, heading, start_offset, end_offset, line, substr(text, 1, 180) FROM passages WHERE id IN ({marks})",
+                pids,
+            )
+        }
+        extra: Dict[int, List[Dict[str, Any]]] = {}
+        dense_rank: Dict[int, int] = {}
+        for pid in pids:
+            if pid not in found:
+                continue  # vectors older than the index; rebuild with knowledge_vectors.py
+            doc_id, heading, start, end, line, head = found[pid]
+            dense_rank.setdefault(doc_id, len(dense_rank) + 1)
+            if doc_id not in by_id and len(extra.setdefault(doc_id, [])) < PASSAGES_PER_DOC:
+                snippet = str(head or "").replace("\n", " ").strip()
+                extra[doc_id].append({"heading": heading or "", "start": start, "end": end, "line": line, "snippet": snippet})
+        if extra:
+            marks = ",".join("?" * len(extra))
+            fetched = conn.execute(
+                f"""
+                SELECT id, path, title, updated_date, source_url, confidence, COALESCE(domain, '')
+                FROM docs WHERE id IN ({marks})
+                """,
+                list(extra),
+            ).fetchall()
+        else:
+            fetched = []
+    for doc_id, path, title, updated, source_url, confidence, domain in fetched:
+        doc = {
+            "doc_id": doc_id,
+            "path": path,
+            "title": title,
+            "updated_date": updated,
+            "source_url": source_url,
+            "confidence": confidence,
+            "domain": domain,
+            "passages": extra[doc_id],
+        }
+        by_id[doc_id] = _knowledge_row(0, doc, 0.0)
+    scored = []
+    for doc_id, row in by_id.items():
+        rank = final_rank(row["_bm25"], row["updated_at"], row["confidence"], bm25_rank.get(doc_id), dense_rank.get(doc_id))
+        scored.append((rank, row))
+    scored.sort(key=lambda x: (-x[0], x[1]["path"]))
+    out = [row for _rank, row in scored[:limit]]
+    for idx, row in enumerate(out, start=1):
+        row["id"] = f"K{idx}"
     return out
 
 
@@ -118,13 +240,31 @@ def _fallback_file_search(root: Path, query: str, limit: int) -> List[Dict[str,
     return [{k: v for k, v in row.items() if k != "_score"} for row in rows[:limit]]
 
 
+def _search_index(db_path: Path, query: str, limit: int) -> List[Dict[str, Any]]:
+    # optional dense tier (knowledge_vectors build); absent/stale matrix or no numpy -> BM25 only
+    with _knowledge_conn(db_path) as conn:
+        dense = dense_search(db_path, query, k=max(50, limit * 10), conn=conn)
+    rows = _fts_query(db_path, query, max(20, limit) if dense else limit)
+    if dense:
+        rows = _hybrid_rerank(db_path, rows, dense, limit)
+    return [{k: v for k, v in row.items() if not k.startswith("_")} for row in rows]
+
+
 def search_knowledge(query: str, *, limit: int = 5, db_path: Path = KNOWLEDGE_INDEX_DB, root: Path = KNOWLEDGE_ROOT) -> List[Dict[str, Any]]:
     clean = query.strip()
     if not clean:
         return []
-    rows = _fts_query(db_path, clean, limit)
+    rows: List[Dict[str, Any]] = []
+    if db_path.exists():
+        with _knowledge_conn(db_path) as conn:
+            generation = index_generation(conn)
+        key = json.dumps([str(db_path), generation, limit, " ".join(clean.lower().split())], ensure_ascii=False)
+        rows = shared_result_cache().get_or_compute(
+            key, lambda: _search_index(db_path, clean, limit), ttl=KNOWLEDGE_CACHE_TTL, namespace=KNOWLEDGE_CACHE_NS
+        )
     if rows:
-        return rows
+        # callers annotate rows (ids, evidence merges); keep the cached copies intact
+        return [dict(row) for row in rows]
     if root.exists():
         return _fallback_file_search(root, clean, limit)
     return []
@@ -228,7 +368,39 @@ def lookup_sec_filings(identifier: str, *, per_form: int = 5, fetcher: Fetcher |
     return out
 
 
+def _deadline_fetcher(fetcher: Fetcher | None, deadline: float, offline: bool | None = None) -> Fetcher:
+    """Bound every request of a connector (e.g. SEC's CIK lookup + submissions) by its deadline."""
+
+    def fetch(url: str, headers: Dict[str, str]) -> Dict[str, Any]:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"connector deadline passed before GET {url}")
+        if fetcher is not None:
+            return fetcher(url, headers)
+        return _json_get(url, headers, timeout=min(HTTP_TIMEOUT_S, remaining), offline=offline)
+
+    return fetch
+
+
+def _connector_timeouts(params: Dict[str, Any]) -> Dict[str, float]:
+    raw = params.get("lookup_timeout_s")
+    out = dict(CONNECTOR_TIMEOUT_S)
+    try:
+        if isinstance(raw, dict):
+            out.update({str(k).strip().lower(): float(v) for k, v in raw.items()})
+        elif raw not in (None, ""):
+            out = {name: float(raw) for name in out}
+    except (TypeError, ValueError):
+        pass
+    return out
+
+
 def lookup_sources(query: str, params: Dict[str, Any], *, fetcher: Fetcher | None = None) -> Dict[str, Any]:
+    """Query the selected connectors concurrently.
+
+    Each connector runs against its own deadline (capped by the overall budget); whatever
+    finished in time is returned, and late connectors are reported in `errors` / `timed_out`.
+    """
     connectors = params.get("source_connectors", [])
     if isinstance(connectors, str):
         connectors = [part.strip() for part in connectors.split(",") if part.strip()]
@@ -239,30 +411,85 @@ def lookup_sources(query: str, params: Dict[str, Any], *, fetcher: Fetcher | Non
 
     mailto = str(params.get("mailto", "")).strip()
     per_page = int(params.get("lookup_limit", 5) or 5)
-    source_results: List[Dict[str, Any]] = []
+    try:
+        budget = float(params.get("lookup_budget_s", LOOKUP_BUDGET_S) or LOOKUP_BUDGET_S)
+    except (TypeError, ValueError):
+        budget = LOOKUP_BUDGET_S
+    timeouts = _connector_timeouts(params)
+    # `offline`: serve cached HTTP responses only (reproducible reports without network)
+    offline = True if str(params.get("offline", "")).strip().lower() in {"1", "true", "yes"} else None
+    identifier = (
+        str(params.get("sec_identifier", "")).strip()
+        or str(params.get("ticker", "")).strip()
+        or str(params.get("company", "")).strip()
+    )
+
+    start = time.monotonic()
+    jobs: Dict[str, Callable[[], List[Dict[str, Any]]]] = {}
+    deadlines: Dict[str, float] = {}
     errors: List[Dict[str, str]] = []
     for connector in connectors:
         name = str(connector).strip().lower()
+        if name in jobs:
+            continue
+        deadline = start + min(budget, timeouts.get(name, budget))
+        fetch = _deadline_fetcher(fetcher, deadline, offline)
+        if name == "knowledge":
+            jobs[name] = lambda: search_knowledge(query, limit=per_page)
+        elif name == "openalex":
+            jobs[name] = lambda fetch=fetch: search_openalex(query, per_page=per_page, mailto=mailto, fetcher=fetch)
+        elif name == "sec":
+            if not identifier:
+                continue
+            jobs[name] = lambda fetch=fetch: lookup_sec_filings(identifier, per_form=per_page, fetcher=fetch)
+        else:
+            errors.append({"connector": name, "error": "unsupported_connector"})
+            continue
+        deadlines[name] = deadline
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    timings_ms: Dict[str, int] = {}
+    timed_out: List[str] = []
+    if jobs:
+        pool = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="lookup")
         try:
-            if name == "knowledge":
-                source_results.extend(search_knowledge(query, limit=per_page))
-            elif name == "openalex":
-                source_results.extend(search_openalex(query, per_page=per_page, mailto=mailto, fetcher=fetcher))
-            elif name == "sec":
-                identifier = (
-                    str(params.get("sec_identifier", "")).strip()
-                    or str(params.get("ticker", "")).strip()
-                    or str(params.get("company", "")).strip()
+            futures = {pool.submit(job): name for name, job in jobs.items()}
+            pending = set(futures)
+            while pending:
+                now = time.monotonic()
+                for fut in [f for f in pending if deadlines[futures[f]] <= now]:
+                    pending.discard(fut)
+                    name = futures[fut]
+                    timed_out.append(name)
+                    errors.append({"connector": name, "error": f"TimeoutError: no result within {deadlines[name] - start:.1f}s"})
+                if not pending:
+                    break
+                done, pending = wait(
+                    pending,
+                    timeout=max(0.0, min(deadlines[futures[f]] for f in pending) - now),
+                    return_when=FIRST_COMPLETED,
                 )
-                if identifier:
-                    source_results.extend(lookup_sec_filings(identifier, per_form=per_page, fetcher=fetcher))
-            else:
-                errors.append({"connector": name, "error": "unsupported_connector"})
-        except Exception as exc:
-            errors.append({"connector": name, "error": f"{type(exc).__name__}: {exc}"})
+                for fut in done:
+                    name = futures[fut]
+                    timings_ms[name] = int((time.monotonic() - start) * 1000)
+                    try:
+                        results[name] = fut.result()
+                    except Exception as exc:
+                        errors.append({"connector": name, "error": f"{type(exc).__name__}: {exc}"})
+        finally:
+            # late connectors are abandoned, not awaited; their requests end at their own deadline
+            pool.shutdown(wait=False)
+
+    source_results: List[Dict[str, Any]] = []
+    for name in jobs:
+        source_results.extend(results.get(name, []))
     return {
         "query": query,
         "connectors": connectors,
         "items": source_results,
         "errors": errors,
+        "partial": bool(timed_out),
+        "timed_out": timed_out,
+        "timings_ms": timings_ms,
     }
+
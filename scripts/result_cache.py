@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+统一缓存引擎 - Result Cache
+
+ToolUseRouter、MCPCacheMiddleware、CacheService、SkillCache、MiniMaxCacheClient
+共用的多命名空间缓存：
+- 按字节计量的 LRU（超出 max_bytes 时淘汰最久未用的条目，跨命名空间统一预算）
+- 每个条目独立 TTL，读取时惰性过期（purge_expired 可选主动清扫）
+- 命名空间隔离键空间，并分别统计命中/未命中/字节数
+- 可选 sqlite 磁盘层（跨进程/重启复用，仅存 JSON 可表示的值），内存未命中时回填
+- single-flight：相同 key 的并发计算只执行一次，其余调用等待同一结果
+
+使用示例：
+    from scripts.result_cache import shared_result_cache
+
+    cache = shared_result_cache()
+    value = cache.get_or_compute("tool:web_search:abc", lambda: do_call(), ttl=60)
+    cache.set("minimax-docx", {"system_prompt": "..."}, ttl=300, namespace="skill")
+    print(cache.stats())
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 60.0
+DEFAULT_NAMESPACE = "results"
+NO_EXPIRY = float("inf")
+# 设置后共享缓存启用磁盘持久化（相对路径基于 ROOT）
+DISK_ENV = "AGENTSYSTEM_RESULT_CACHE_DB"
+
+_MISSING = object()
+_COUNTERS = ("hits", "misses", "disk_hits", "sets", "evictions", "expired", "bytes_served")
+
+
+def _encode(value: Any) -> Tuple[Optional[bytes], int]:
+    """序列化为 JSON 并计算大小；无法按原样往返 JSON 的值（元组、非字符串键、自定义对象等）只估算大小、只留在内存"""
+    try:
+        blob = json.dumps(value, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+        if json.loads(blob) != value:
+            return None, len(blob)
+        return blob, len(blob)
+    except (TypeError, ValueError, RecursionError):
+        return None, sys.getsizeof(value)
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ResultCache:
+    """字节上限 LRU + 命名空间 + 可选磁盘层 + single-flight"""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        default_ttl: float = DEFAULT_TTL,
+        disk_path: Optional[Path] = None,
+    ):
+        self.max_bytes = max(1, int(max_bytes))
+        self.default_ttl = float(default_ttl)
+        self.disk_path = disk_path
+        # (namespace, key) -> (value, expires_at, size)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._ns_bytes: Dict[str, int] = {}
+        self._ns_entries: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self._async_flights: Dict[Tuple[int, str, str], asyncio.Future] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._shared_flights = 0
+        if self.disk_path is not None:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL;")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS cache_entries (
+                      ns TEXT NOT NULL,
+                      k TEXT NOT NULL,
+                      v BLOB NOT NULL,
+                      expires_at REAL NOT NULL,
+                      size INTEGER NOT NULL,
+                      PRIMARY KEY(ns, k)
+                    )
+                    """
+                )
+                conn.commit()
+
+    def _count(self, namespace: str, name: str, n: int = 1) -> None:
+        ns = self._counters.get(namespace)
+        if ns is None:
+            ns = self._counters[namespace] = {c: 0 for c in _COUNTERS}
+        ns[name] += n
+
+    # ==================== 磁盘层 ====================
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.disk_path, timeout=30)
+
+    def _disk_get(self, namespace: str, key: str, now: float) -> Any:
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT v, expires_at FROM cache_entries WHERE ns=? AND k=?", (namespace, key)).fetchone()
+                if row is None:
+                    return _MISSING
+                if row[1] <= now:
+                    conn.execute("DELETE FROM cache_entries WHERE ns=? AND k=?", (namespace, key))
+                    conn.commit()
+                    return _MISSING
+            return json.loads(bytes(row[0]).decode("utf-8")), row[1], len(row[0])
+        except (sqlite3.Error, ValueError):
+            return _MISSING
+
+    def _disk_set(self, namespace: str, key: str, blob: bytes, expires_at: float) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries(ns, k, v, expires_at, size) VALUES(?,?,?,?,?)",
+                    (namespace, key, sqlite3.Binary(blob), expires_at, len(blob)),
+                )
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    def _disk_delete(self, namespace: Optional[str] = None, key: Optional[str] = None) -> None:
+        try:
+            with self._connect() as conn:
+                if namespace is None:
+                    conn.execute("DELETE FROM cache_entries")
+                elif key is None:
+                    conn.execute("DELETE FROM cache_entries WHERE ns=?", (namespace,))
+                else:
+                    conn.execute("DELETE FROM cache_entries WHERE ns=? AND k=?", (namespace, key))
+                conn.commit()
+        except sqlite3.Error:
+            pass
+
+    # ==================== 内存层 ====================
+
+    def _drop(self, ikey: Tuple[str, str]) -> Optional[Tuple[Any, float, int]]:
+        old = self._entries.pop(ikey, None)
+        if old is not None:
+            self._bytes -= old[2]
+            self._ns_bytes[ikey[0]] -= old[2]
+            self._ns_entries[ikey[0]] -= 1
+        return old
+
+    def _store(self, ikey: Tuple[str, str], value: Any, expires_at: float, size: int) -> None:
+        with self._lock:
+            self._drop(ikey)
+            if size > self.max_bytes:
+                return
+            self._entries[ikey] = (value, expires_at, size)
+            self._bytes += size
+            self._ns_bytes[ikey[0]] = self._ns_bytes.get(ikey[0], 0) + size
+            self._ns_entries[ikey[0]] = self._ns_entries.get(ikey[0], 0) + 1
+            while self._bytes > self.max_bytes and self._entries:
+                victim = next(iter(self._entries))
+                self._drop(victim)
+                self._count(victim[0], "evictions")
+
+    def get(
+        self,
+        key: str,
+        default: Any = None,
+        namespace: str = DEFAULT_NAMESPACE,
+        accept: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """读取未过期的值；内存未命中时查磁盘层并回填。accept 拒绝的值按未命中计数并返回 default"""
+        now = time.time()
+        ikey = (namespace, key)
+        with self._lock:
+            hit = self._entries.get(ikey)
+            if hit is not None:
+                if hit[1] > now:
+                    if accept is not None and not accept(hit[0]):
+                        self._count(namespace, "misses")
+                        return default
+                    self._entries.move_to_end(ikey)
+                    self._count(namespace, "hits")
+                    self._count(namespace, "bytes_served", hit[2])
+                    return hit[0]
+                self._drop(ikey)
+                self._count(namespace, "expired")
+        if self.disk_path is not None:
+            found = self._disk_get(namespace, key, now)
+            if found is not _MISSING:
+                value, expires_at, size = found
+                self._store(ikey, value, expires_at, size)
+                if accept is not None and not accept(value):
+                    with self._lock:
+                        self._count(namespace, "misses")
+                    return default
+                with self._lock:
+                    self._count(namespace, "hits")
+                    self._count(namespace, "disk_hits")
+                    self._count(namespace, "bytes_served", size)
+                return value
+        with self._lock:
+            self._count(namespace, "misses")
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, namespace: str = DEFAULT_NAMESPACE) -> None:
+        """写入；ttl 为空用默认值，<=0 不缓存，NO_EXPIRY 表示只受容量淘汰"""
+        ttl = self.default_ttl if ttl is None else float(ttl)
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        blob, size = _encode(value)
+        self._store((namespace, key), value, expires_at, size)
+        with self._lock:
+            self._count(namespace, "sets")
+        if self.disk_path is not None and blob is not None:
+            self._disk_set(namespace, key, blob, expires_at)
+
+    def delete(self, key: str, namespace: str = DEFAULT_NAMESPACE) -> None:
+        with self._lock:
+            self._drop((namespace, key))
+        if self.disk_path is not None:
+            self._disk_delete(namespace, key)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """清空某个命名空间（None 表示全部）"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                self._bytes = 0
+                self._ns_bytes.clear()
+                self._ns_entries.clear()
+            else:
+                for ikey in [k for k in self._entries if k[0] == namespace]:
+                    self._drop(ikey)
+        if self.disk_path is not None:
+            self._disk_delete(namespace)
+
+    def keys(self, namespace: str = DEFAULT_NAMESPACE) -> List[str]:
+        """命名空间内未过期的键（按最近使用排序，最新在后）"""
+        now = time.time()
+        with self._lock:
+            return [k for (ns, k), (_v, exp, _s) in self._entries.items() if ns == namespace and exp > now]
+
+    def purge_expired(self, namespace: Optional[str] = None) -> int:
+        """主动清除内存中的过期条目，返回清除数量"""
+        now = time.time()
+        with self._lock:
+            stale = [k for k, (_v, exp, _s) in self._entries.items() if exp <= now and (namespace is None or k[0] == namespace)]
+            for ikey in stale:
+                self._drop(ikey)
+                self._count(ikey[0], "expired")
+        if self.disk_path is not None:
+            try:
+                with self._connect() as conn:
+                    if namespace is None:
+                        conn.execute("DELETE FROM cache_entries WHERE expires_at<=?", (now,))
+                    else:
+                        conn.execute("DELETE FROM cache_entries WHERE ns=? AND expires_at<=?", (namespace, now))
+                    conn.commit()
+            except sqlite3.Error:
+                pass
+        return len(stale)
+
+    # ==================== single-flight ====================
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[float] = None,
+        cacheable: Callable[[Any], bool] = lambda _v: True,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> Any:
+        """命中直接返回；否则同 key 的并发调用只有一个执行 compute，其余等待其结果"""
+        value = self.get(key, _MISSING, namespace=namespace)
+        if value is not _MISSING:
+            return value
+        ikey = (namespace, key)
+        with self._lock:
+            flight = self._flights.get(ikey)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[ikey] = flight
+            else:
+                self._shared_flights += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = compute()
+            if cacheable(flight.value):
+                self.set(key, flight.value, ttl, namespace=namespace)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(ikey, None)
+            flight.event.set()
+
+    async def aget_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None,
+        cacheable: Callable[[Any], bool] = lambda _v: True,
+        namespace: str = DEFAULT_NAMESPACE,
+    ) -> Any:
+        """get_or_compute 的协程版本（single-flight 作用于同一事件循环内）"""
+        value = self.get(key, _MISSING, namespace=namespace)
+        if value is not _MISSING:
+            return value
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), namespace, key)
+        with self._lock:
+            pending = self._async_flights.get(flight_key)
+            if pending is None:
+                future = loop.create_future()
+                self._async_flights[flight_key] = future
+            else:
+                self._shared_flights += 1
+        if pending is not None:
+            return await asyncio.shield(pending)
+        try:
+            value = await compute()
+            if cacheable(value):
+                self.set(key, value, ttl, namespace=namespace)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有跟随者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_flights.pop(flight_key, None)
+
+    # ==================== 统计 ====================
+
+    def reset_stats(self, namespace: Optional[str] = None) -> None:
+        """重置计数器（不影响已缓存的条目）"""
+        with self._lock:
+            if namespace is None:
+                self._counters.clear()
+                self._shared_flights = 0
+            else:
+                self._counters.pop(namespace, None)
+
+    def namespace_stats(self, namespace: str) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters.get(namespace) or {c: 0 for c in _COUNTERS})
+            lookups = counters["hits"] + counters["misses"]
+            return {
+                **counters,
+                "entries": self._ns_entries.get(namespace, 0),
+                "bytes": self._ns_bytes.get(namespace, 0),
+                "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {c: sum(ns[c] for ns in self._counters.values()) for c in _COUNTERS}
+            lookups = totals["hits"] + totals["misses"]
+            names = sorted(set(self._counters) | set(self._ns_entries))
+            return {
+                **totals,
+                "shared_flights": self._shared_flights,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(totals["hits"] / lookups, 4) if lookups else 0.0,
+                "disk_path": str(self.disk_path) if self.disk_path is not None else None,
+                "namespaces": {ns: self.namespace_stats(ns) for ns in names},
+            }
+
+
+_SHARED: Optional[ResultCache] = None
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_result_cache() -> ResultCache:
+    """进程内共享的缓存引擎；设置 AGENTSYSTEM_RESULT_CACHE_DB 时启用磁盘持久化"""
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            disk = os.getenv(DISK_ENV, "").strip()
+            disk_path = None
+            if disk:
+                disk_path = Path(disk) if Path(disk).is_absolute() else ROOT / disk
+            _SHARED = ResultCache(disk_path=disk_path)
+        return _SHARED
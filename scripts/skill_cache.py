@@ -32,8 +32,6 @@ Skill 缓存模块 - 为 AgentSystem 技能提供缓存支持
 
 from __future__ import annotations
 
-import hashlib
-import json
 import time
 from dataclasses import dataclass
 from pathlib import Path
@@ -74,6 +72,7 @@ class SkillCache:
 
     def __init__(self, ttl: int = DEFAULT_TTL):
         self.ttl = ttl
+        # 技能定义常驻内存，不进共享引擎的 LRU，避免被大体积工具结果淘汰
         self._skill_definitions: Dict[str, SkillDefinition] = {}
 
     # ==================== 技能缓存 ====================
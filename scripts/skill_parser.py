@@ -9,6 +9,7 @@ Usage:
     python3 scripts/skill_parser.py parse policy-pbc
     python3 scripts/skill_parser.py match "分析支付监管"
     python3 scripts/skill_parser.py extract "分析北京支付行业" policy-pbc
+    python3 scripts/skill_parser.py bench [repeat]
 """
 
 import argparse
@@ -16,11 +17,18 @@ import os
 import re
 import sys
 import json
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import yaml
 
+try:
+    from scripts.keyword_automaton import KeywordAutomaton
+except ModuleNotFoundError:  # direct script execution
+    from keyword_automaton import KeywordAutomaton  # type: ignore
+
 # 配置
 SCRIPT_DIR = Path(__file__).parent
 SKILL_DIR = SCRIPT_DIR.parent / "技能库"
@@ -60,13 +68,183 @@ class SkillMeta:
         return f"SkillMeta({self.name}, v{self.version}, triggers={len(self.triggers)})"
 
 
+class _FastPathUnsupported(Exception):
+    """front-matter 超出受限 schema，交给完整 YAML 解析"""
+
+
+_FM_BOOL = {
+    **{w: True for w in ("yes", "Yes", "YES", "true", "True", "TRUE", "on", "On", "ON")},
+    **{w: False for w in ("no", "No", "NO", "false", "False", "FALSE", "off", "Off", "OFF")},
+}
+_FM_NULL = {"", "~", "null", "Null", "NULL"}
+_FM_INT = re.compile(r"[-+]?(?:0|[1-9][0-9]*)$")
+_FM_FLOAT = re.compile(r"[-+]?[0-9]+\.[0-9]*$")
+# YAML 1.1 会隐式解析成数字/时间戳等的其它写法，快路径不处理
+_FM_AMBIGUOUS = re.compile(r"[-+]?[0-9_.]+(?:[eE][-+]?[0-9]+)?$|[-+]?\.|[-+]?0[xXbBo]|[0-9]+(?::[0-9]+)+|\d{4}-\d")
+_FM_SPECIAL = set("[]{}#&*!|>'\"%@`,?:-<=")
+
+
+def _fm_scalar(raw: str) -> Any:
+    v = raw.strip()
+    if v in _FM_NULL:
+        return None
+    if v in _FM_BOOL:
+        return _FM_BOOL[v]
+    if _FM_INT.match(v):
+        return int(v)
+    if _FM_FLOAT.match(v):
+        return float(v)
+    if len(v) >= 2 and v[0] == v[-1] == "'" and "'" not in v[1:-1].replace("''", ""):
+        return v[1:-1].replace("''", "'")
+    if len(v) >= 2 and v[0] == v[-1] == '"' and '"' not in v[1:-1] and "\\" not in v:
+        return v[1:-1]
+    if v[0] in _FM_SPECIAL or _FM_AMBIGUOUS.match(v) or ": " in v or " #" in v or v.endswith(":") or "\t" in v:
+        raise _FastPathUnsupported(v)
+    return v
+
+
+def _fm_flow(raw: str) -> Any:
+    v = raw.strip()
+    inner = v[1:-1]
+    if any(ch in inner for ch in "[]{}'\""):
+        raise _FastPathUnsupported(v)
+    items = [x.strip() for x in inner.split(",")]
+    if items == [""]:
+        items = []
+    # 尾逗号、空项（YAML 报错或丢弃）都交给完整解析
+    if any(not x for x in items):
+        raise _FastPathUnsupported(v)
+    if v[0] == "[":
+        return [_fm_scalar(x) for x in items]
+    out: Dict[Any, Any] = {}
+    for item in items:
+        # `{b:1}` 在 YAML 中是键 "b:1"，只有 ": " 才分隔键值
+        key, sep, val = item.partition(": ")
+        if not sep:
+            raise _FastPathUnsupported(v)
+        out[_fm_scalar(key)] = _fm_scalar(val)
+    return out
+
+
+def _fm_value(raw: str) -> Any:
+    v = raw.strip()
+    if len(v) >= 2 and (v[0], v[-1]) in {("[", "]"), ("{", "}")}:
+        return _fm_flow(v)
+    return _fm_scalar(v)
+
+
+def _fm_split_key(content: str) -> Optional[tuple]:
+    """`key: value` / `key:` -> (key, value)；不是映射行返回 None"""
+    if content[0] in _FM_SPECIAL:
+        return None
+    if content.endswith(":"):
+        return content[:-1], ""
+    idx = content.find(": ")
+    if idx <= 0:
+        return None
+    return content[:idx], content[idx + 2 :]
+
+
+def _fm_is_item(content: str) -> bool:
+    return content == "-" or content.startswith("- ")
+
+
+def _fm_block(lines: List[List[Any]], pos: int, indent: int) -> tuple:
+    if _fm_is_item(lines[pos][1]):
+        return _fm_seq(lines, pos, indent)
+    return _fm_map(lines, pos, indent)
+
+
+def _fm_child(lines: List[List[Any]], pos: int, indent: int, allow_same_seq: bool) -> tuple:
+    """值为空时的下一层块：更深缩进，或（映射值）同缩进的序列"""
+    if pos < len(lines):
+        nxt_indent, nxt = lines[pos]
+        if nxt_indent > indent:
+            return _fm_block(lines, pos, nxt_indent)
+        if allow_same_seq and nxt_indent == indent and _fm_is_item(nxt):
+            return _fm_seq(lines, pos, indent)
+    return None, pos
+
+
+def _fm_map(lines: List[List[Any]], pos: int, indent: int) -> tuple:
+    out: Dict[Any, Any] = {}
+    while pos < len(lines):
+        cur_indent, content = lines[pos]
+        if cur_indent < indent or (cur_indent == indent and _fm_is_item(content)):
+            break
+        if cur_indent > indent:
+            raise _FastPathUnsupported(content)
+        kv = _fm_split_key(content)
+        if kv is None:
+            raise _FastPathUnsupported(content)
+        key = _fm_scalar(kv[0])
+        if kv[1].strip():
+            out[key] = _fm_value(kv[1])
+            pos += 1
+        else:
+            out[key], pos = _fm_child(lines, pos + 1, indent, allow_same_seq=True)
+    return out, pos
+
+
+def _fm_seq(lines: List[List[Any]], pos: int, indent: int) -> tuple:
+    out: List[Any] = []
+    while pos < len(lines):
+        cur_indent, content = lines[pos]
+        if cur_indent < indent or not _fm_is_item(content):
+            if cur_indent > indent:
+                raise _FastPathUnsupported(content)
+            break
+        if cur_indent > indent:
+            raise _FastPathUnsupported(content)
+        rest = content[1:].lstrip()
+        if not rest:
+            value, pos = _fm_child(lines, pos + 1, indent, allow_same_seq=False)
+            out.append(value)
+            continue
+        if _fm_split_key(rest) is not None:
+            # `- key: value` 开启一个以 rest 列为缩进的映射
+            item_indent = cur_indent + len(content) - len(rest)
+            lines[pos] = [item_indent, rest]
+            value, pos = _fm_map(lines, pos, item_indent)
+            out.append(value)
+            continue
+        out.append(_fm_value(rest))
+        pos += 1
+    return out, pos
+
+
+def parse_front_matter_fast(yaml_content: str) -> Optional[Dict[str, Any]]:
+    """受限 schema 的 front-matter 快速解析（块映射/序列、行内列表、标量）
+
+    超出子集时抛出 _FastPathUnsupported，由调用方回退到 yaml.safe_load。
+    """
+    lines: List[List[Any]] = []
+    for raw in yaml_content.split("\n"):
+        stripped = raw.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped in {"---", "..."} or "\t" in raw[: len(raw) - len(raw.lstrip())]:
+            raise _FastPathUnsupported(raw)
+        lines.append([len(raw) - len(raw.lstrip(" ")), stripped])
+    if not lines:
+        return None
+    value, pos = _fm_block(lines, 0, lines[0][0])
+    if pos != len(lines) or not isinstance(value, dict):
+        raise _FastPathUnsupported("trailing content")
+    return value
+
+
 def parse_yaml_front_matter(content: str, silent: bool = False) -> Optional[Dict[str, Any]]:
-    """解析 YAML front-matter"""
+    """解析 YAML front-matter（先走受限 schema 快路径，复杂内容回退完整 YAML）"""
     # 匹配 --- 包裹的 YAML 内容
     pattern = r"^---\s*\n(.*?)\n---"
     match = re.match(pattern, content, re.DOTALL)
     if match:
         yaml_content = match.group(1)
+        try:
+            return parse_front_matter_fast(yaml_content)
+        except _FastPathUnsupported:
+            pass
         try:
             return yaml.safe_load(yaml_content)
         except yaml.YAMLError as e:
@@ -105,32 +283,136 @@ def parse_all_skills(skill_dir: Path = None, silent: bool = False) -> List[Skill
     return skills
 
 
-def match_triggers(text: str, skills: List[SkillMeta]) -> List[Dict[str, Any]]:
-    """匹配触发短语"""
-    text_lower = text.lower()
-    results = []
+FUZZY_MIN_SIMILARITY = 0.6
+FUZZY_WEIGHT = 0.5  # 模糊命中按 10 * 相似度 * 权重 计分，排在同数量精确命中之后
+
+
+def _fuzzy_normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _char_ngrams(text: str, n: int = 2) -> set:
+    compact = _fuzzy_normalize(text)
+    if len(compact) < n:
+        return {compact} if compact else set()
+    return {compact[i : i + n] for i in range(len(compact) - n + 1)}
+
+
+def _substring_distance(pattern: str, text: str) -> int:
+    """pattern 与 text 任一连续子串之间的最小编辑距离（Sellers 算法，O(len(pattern) * len(text))）"""
+    col = list(range(len(pattern) + 1))
+    best = len(pattern)
+    for ch in text:
+        diag, col[0] = col[0], 0
+        for i in range(1, len(col)):
+            cur = min(col[i] + 1, col[i - 1] + 1, diag + (pattern[i - 1] != ch))
+            diag, col[i] = col[i], cur
+        best = min(best, col[-1])
+    return best
+
+
+class TriggerIndex:
+    """预编译的触发短语索引
+
+    精确匹配：所有技能触发短语编译为一个 Aho-Corasick 自动机，单次扫描文本；
+    模糊匹配：触发短语的字符 bigram 倒排索引（gram -> 触发短语）只做候选过滤，
+    相似度 = 1 - 短语与文本中最接近的连续片段的编辑距离 / 短语长度，
+    因此顺序和位置都参与计算，可容忍少量插字、漏字、错字（如 anlaysis），
+    而散落在长文本各处的同样字符不会被当作命中。
+    """
+
+    def __init__(self, skills: List[SkillMeta]):
+        self.skills = list(skills)
+        self.exact = KeywordAutomaton()
+        self.grams: Dict[str, List[Tuple[int, int]]] = {}
+        self.gram_counts: Dict[Tuple[int, int], int] = {}
+        for sid, skill in enumerate(self.skills):
+            self.exact.add_many(skill.triggers, sid)
+            for tid, trigger in enumerate(skill.triggers):
+                grams = _char_ngrams(str(trigger))
+                # 过短的短语模糊匹配没有意义（一处差异就低于阈值）
+                if len(str(trigger).strip()) < 3:
+                    continue
+                self.gram_counts[(sid, tid)] = len(grams)
+                for gram in grams:
+                    self.grams.setdefault(gram, []).append((sid, tid))
+        self.exact.build()
+
+    def match(self, text: str, fuzzy: bool = False, min_similarity: float = FUZZY_MIN_SIMILARITY) -> List[Dict[str, Any]]:
+        exact_hits = self.exact.match(text)
+        fuzzy_hits: Dict[int, List[Tuple[int, float]]] = {}
+        if fuzzy:
+            compact = _fuzzy_normalize(text)
+            shared: Dict[Tuple[int, int], int] = {}
+            for gram in _char_ngrams(text):
+                for key in self.grams.get(gram, ()):
+                    shared[key] = shared.get(key, 0) + 1
+            for (sid, tid), cnt in shared.items():
+                trigger = self.skills[sid].triggers[tid]
+                if trigger in exact_hits.get(sid, []):
+                    continue
+                phrase = _fuzzy_normalize(str(trigger))
+                max_edits = int((1.0 - min_similarity) * len(phrase))
+                # q-gram 引理：编辑距离 <= k 的片段至少与短语共享 grams - 2k 个 bigram
+                if cnt < self.gram_counts[(sid, tid)] - 2 * max_edits:
+                    continue
+                similarity = 1.0 - _substring_distance(phrase, compact) / len(phrase)
+                if similarity < min_similarity:
+                    continue
+                fuzzy_hits.setdefault(sid, []).append((tid, round(similarity, 3)))
+
+        results = []
+        for sid, skill in enumerate(self.skills):
+            matched = exact_hits.get(sid, [])
+            near = sorted(fuzzy_hits.get(sid, []))
+            if not matched and not near:
+                continue
+            row: Dict[str, Any] = {
+                "skill": skill.name,
+                "score": 10 * len(matched),
+                "matched_triggers": matched,
+                "version": skill.version,
+            }
+            if fuzzy:
+                row["fuzzy_triggers"] = [{"trigger": skill.triggers[tid], "similarity": sim} for tid, sim in near]
+                row["score"] = round(row["score"] + sum(10 * sim * FUZZY_WEIGHT for _tid, sim in near), 2)
+            results.append(row)
+        # 按分数排序（稳定：同分保持技能顺序）
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
 
-    for skill in skills:
-        score = 0
-        matched_triggers = []
 
-        for trigger in skill.triggers:
-            trigger_lower = trigger.lower()
-            if trigger_lower in text_lower:
-                score += 10
-                matched_triggers.append(trigger)
+_TRIGGER_INDEX: Optional[Tuple[Tuple[Any, ...], TriggerIndex]] = None
 
-        if matched_triggers:
-            results.append({
-                "skill": skill.name,
-                "score": score,
-                "matched_triggers": matched_triggers,
-                "version": skill.version,
-            })
 
-    # 按分数排序
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results
+def build_trigger_index(skills: List[SkillMeta]) -> TriggerIndex:
+    """按技能列表内容缓存的触发索引（技能库不变时复用）"""
+    global _TRIGGER_INDEX
+    sig = tuple((s.name, s.version, tuple(map(str, s.triggers))) for s in skills)
+    if _TRIGGER_INDEX is None or _TRIGGER_INDEX[0] != sig:
+        _TRIGGER_INDEX = (sig, TriggerIndex(skills))
+    return _TRIGGER_INDEX[1]
+
+
+def match_triggers(
+    text: str,
+    skills: List[SkillMeta],
+    fuzzy: bool = False,
+    min_similarity: float = FUZZY_MIN_SIMILARITY,
+) -> List[Dict[str, Any]]:
+    """匹配触发短语（精确命中每条 10 分；fuzzy=True 时追加近似命中）"""
+    return build_trigger_index(skills).match(text, fuzzy=fuzzy, min_similarity=min_similarity)
+
+
+@lru_cache(maxsize=1024)
+def _alias_patterns(alias: str) -> Tuple[Optional[str], Any, Any]:
+    # 别名不含正则元字符时，可先做子串预判，避免无谓的正则扫描
+    literal = alias if re.escape(alias) == alias else None
+    return (
+        literal,
+        re.compile(rf"{alias}[:：]\s*(.+?)(?:\s|$)"),
+        re.compile(rf"{alias}\s+(.+?)(?:\s|$)"),
+    )
 
 
 def extract_parameters(text: str, skill: SkillMeta) -> Dict[str, Any]:
@@ -144,11 +426,12 @@ def extract_parameters(text: str, skill: SkillMeta) -> Dict[str, Any]:
         # 尝试从文本中匹配
         for alias in aliases:
             # 简单的模式匹配: "alias: 值" 或 "alias 值"
-            pattern1 = rf"{alias}[:：]\s*(.+?)(?:\s|$)"
-            pattern2 = rf"{alias}\s+(.+?)(?:\s|$)"
+            literal, pattern1, pattern2 = _alias_patterns(str(alias))
+            if literal is not None and literal not in text:
+                continue
 
             for pattern in [pattern1, pattern2]:
-                match = re.search(pattern, text)
+                match = pattern.search(text)
                 if match:
                     value = match.group(1).strip()
                     # 去除可能的引号
@@ -159,6 +442,60 @@ def extract_parameters(text: str, skill: SkillMeta) -> Dict[str, Any]:
     return params
 
 
+def bench_cold_load(skill_dir: Path = None, repeat: int = 20) -> Dict[str, Any]:
+    """技能库冷加载基准：完整 parse_all_skills，以及 front-matter 快路径 vs 纯 YAML"""
+    skill_dir = skill_dir or SKILL_DIR
+    repeat = max(1, int(repeat))
+    blocks = []
+    for md_file in skill_dir.glob("*.md"):
+        if "references" in md_file.parts:
+            continue
+        match = re.match(r"^---\s*\n(.*?)\n---", md_file.read_text(encoding="utf-8"), re.DOTALL)
+        if match:
+            blocks.append(match.group(1))
+
+    fast_hits = 0
+    for block in blocks:
+        try:
+            parse_front_matter_fast(block)
+            fast_hits += 1
+        except _FastPathUnsupported:
+            pass
+
+    def _timed(fn) -> float:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return round((time.perf_counter() - t0) * 1000 / repeat, 3)
+
+    def _yaml_only() -> None:
+        for block in blocks:
+            try:
+                yaml.safe_load(block)
+            except yaml.YAMLError:
+                pass
+
+    def _with_fast_path() -> None:
+        for block in blocks:
+            try:
+                parse_front_matter_fast(block)
+            except _FastPathUnsupported:
+                try:
+                    yaml.safe_load(block)
+                except yaml.YAMLError:
+                    pass
+
+    return {
+        "skill_dir": str(skill_dir),
+        "files_with_front_matter": len(blocks),
+        "fast_path_files": fast_hits,
+        "repeat": repeat,
+        "parse_all_skills_ms": _timed(lambda: parse_all_skills(skill_dir, silent=True)),
+        "front_matter_yaml_ms": _timed(_yaml_only),
+        "front_matter_fast_ms": _timed(_with_fast_path),
+    }
+
+
 def list_skills(skills: List[SkillMeta]) -> None:
     """列出所有技能"""
     print(f"\n{'='*60}")
@@ -179,7 +516,7 @@ def list_skills(skills: List[SkillMeta]) -> None:
 def main():
     parser = argparse.ArgumentParser(description="AgentSystem 技能解析器")
     parser.add_argument("--list", action="store_true", help="列出所有技能")
-    parser.add_argument("command", nargs="?", help="子命令: parse, match, extract")
+    parser.add_argument("command", nargs="?", help="子命令: parse, match, extract, bench")
     parser.add_argument("args", nargs=argparse.REMAINDER, help="命令参数")
 
     args = parser.parse_args()
@@ -216,7 +553,7 @@ def main():
             return
 
         skills = parse_all_skills()
-        results = match_triggers(text, skills)
+        results = match_triggers(text, skills, fuzzy=True)
 
         print(f"\n匹配结果: \"{text}\"")
         print(f"{'='*50}\n")
@@ -224,6 +561,9 @@ def main():
         for r in results:
             print(f"✓ {r['skill']} (score: {r['score']})")
             print(f"   匹配: {', '.join(r['matched_triggers'])}")
+            if r.get("fuzzy_triggers"):
+                near = [f"{x['trigger']}≈{x['similarity']}" for x in r["fuzzy_triggers"]]
+                print(f"   近似: {', '.join(near)}")
             print()
         return
 
@@ -252,6 +592,12 @@ def main():
         print(json.dumps(params, ensure_ascii=False, indent=2))
         return
 
+    if args.command == "bench":
+        # 技能库冷加载基准
+        repeat = int(args.args[0]) if args.args else 20
+        print(json.dumps(bench_cold_load(repeat=repeat), ensure_ascii=False, indent=2))
+        return
+
     print(f"Unknown command: {args.command}")
 
 
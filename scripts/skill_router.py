@@ -4,13 +4,18 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import sys
+import threading
+import time
 import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 BOOT_ROOT = Path(__file__).resolve().parents[1]
 if str(BOOT_ROOT) not in sys.path:
@@ -29,6 +34,7 @@ try:
     from scripts.stock_market_hub import run_report as run_stock_hub_report
     from scripts.stock_market_hub import load_cfg as load_stock_hub_cfg
     from scripts.stock_market_hub import pick_symbols as pick_stock_symbols
+    from scripts.keyword_automaton import KeywordAutomaton
     from scripts.skill_parser import parse_all_skills, match_triggers, extract_parameters
     from scripts.skill_tracer import SkillTracer
 except ModuleNotFoundError:  # direct script execution
@@ -44,12 +50,16 @@ except ModuleNotFoundError:  # direct script execution
     from stock_market_hub import run_report as run_stock_hub_report  # type: ignore
     from stock_market_hub import load_cfg as load_stock_hub_cfg  # type: ignore
     from stock_market_hub import pick_symbols as pick_stock_symbols  # type: ignore
+    from keyword_automaton import KeywordAutomaton  # type: ignore
     from skill_parser import parse_all_skills, match_triggers, extract_parameters  # type: ignore
     from skill_tracer import SkillTracer  # type: ignore
 
 ROOT = Path(__file__).resolve().parents[1]
 ROOT = Path(os.getenv("AGENTSYSTEM_ROOT", str(ROOT))).resolve()
 ROUTE_DOC = ROOT / "工作流" / "技能路由.md"
+ROUTE_CACHE_DIR = ROOT / "日志" / "skill_router" / "route_tables"
+ROUTE_CACHE_VERSION = 1
+TRACE_DIR = ROOT / "日志" / "skill_traces"
 STOCK_HUB_CFG = ROOT / "config" / "stock_market_hub.toml"
 IMAGE_HUB_CFG = ROOT / "config" / "image_creator_hub.toml"
 
@@ -190,53 +200,141 @@ def parse_route_doc(path: Path = ROUTE_DOC) -> List[Dict[str, Any]]:
     return rules
 
 
+_ROUTE_TABLES: Dict[str, Tuple[Tuple[int, int], List[Dict[str, Any]]]] = {}
+_SKILLS: List[Any] | None = None
+
+
+def load_route_table(path: Path = ROUTE_DOC, cache_dir: Path | None = None) -> List[Dict[str, Any]]:
+    """Parsed route rules, loaded once per process.
+
+    The parse result is persisted as a versioned JSON artifact named by the
+    route doc's sha256, so the markdown is only re-parsed when it changes and
+    replaying a candidate doc never overwrites the artifact of the live one.
+    Writers go through a per-process/per-thread temp file, so parallel replay
+    workers never clobber each other's half-written output.
+    """
+    if not path.exists():
+        raise SkillRouterError(f"route doc not found: {path}")
+    st = path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _ROUTE_TABLES.get(str(path))
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    cache_dir = ROUTE_CACHE_DIR if cache_dir is None else cache_dir
+    cache_path = cache_dir / f"{digest}.json"
+    rules: List[Dict[str, Any]] | None = None
+    try:
+        cached = json.loads(cache_path.read_text(encoding="utf-8"))
+        if cached.get("version") == ROUTE_CACHE_VERSION and cached.get("sha256") == digest:
+            rules = cached.get("rules")
+    except (OSError, ValueError):
+        rules = None
+    if not isinstance(rules, list):
+        rules = parse_route_doc(path)
+        tmp = cache_dir / f".{digest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(
+                json.dumps(
+                    {"version": ROUTE_CACHE_VERSION, "source": str(path), "sha256": digest, "rules": rules},
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            # 缓存只是加速手段：写失败不影响本次结果，但要清掉残留临时文件并留下痕迹
+            try:
+                tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+            print(f"Warning: route cache write skipped: {e}", file=sys.stderr)
+    _ROUTE_TABLES[str(path)] = (stamp, rules)
+    return rules
+
+
+def _load_skills() -> List[Any]:
+    global _SKILLS
+    if _SKILLS is None:
+        _SKILLS = parse_all_skills(silent=True)
+    return _SKILLS
+
+
+_WORD_GROUPS = {
+    "strong_exec": STRONG_EXEC_KEYWORDS,
+    "plan": PLAN_WORDS,
+    "market": MARKET_WORDS,
+    "image": IMAGE_WORDS,
+    "research": RESEARCH_WORDS,
+}
+_COMPILED: Tuple[Any, int, KeywordAutomaton] | None = None
+
+
+def compile_routes(rules: List[Dict[str, Any]]) -> KeywordAutomaton:
+    """One automaton over the fixed word groups plus every rule keyword (payload: group name or rule index)."""
+    matcher = KeywordAutomaton()
+    for group, words in _WORD_GROUPS.items():
+        matcher.add_many(sorted(words), group)
+    for idx, rule in enumerate(rules):
+        matcher.add_many(rule["keywords"], idx)
+    return matcher.build()
+
+
+def _compiled_for(rules: List[Dict[str, Any]]) -> KeywordAutomaton:
+    global _COMPILED
+    if _COMPILED is None or _COMPILED[0] is not rules or _COMPILED[1] != len(rules):
+        _COMPILED = (rules, len(rules), compile_routes(rules))
+    return _COMPILED[2]
+
+
 def route_text(text: str, rules: List[Dict[str, Any]]) -> Dict[str, Any]:
-    low = text.lower()
+    hits_by = _compiled_for(rules).match(text)
 
-    if any(k in low for k in STRONG_EXEC_KEYWORDS):
+    if hits_by.get("strong_exec"):
         return {
             "section": "冲突消解（新增）",
             "skill": "minimax-xlsx",
             "description": "强优先执行类",
-            "keywords": [k for k in STRONG_EXEC_KEYWORDS if k in low],
+            "keywords": hits_by["strong_exec"],
             "score": 100,
         }
 
-    if any(w in low for w in MARKET_WORDS):
+    if hits_by.get("market"):
         return {
             "section": "市场量化类",
             "skill": "stock-market-hub + mcp-freefirst",
             "description": "全球股票市场分析 + 量化回测 + 免费信源抓取",
-            "keywords": [w for w in MARKET_WORDS if w in low],
+            "keywords": hits_by["market"],
             "score": 90,
         }
 
-    if any(w in low for w in IMAGE_WORDS):
+    if hits_by.get("image"):
         return {
             "section": "图像创作类",
             "skill": "image-creator-hub",
             "description": "多子代理图像生成中枢",
-            "keywords": [w for w in IMAGE_WORDS if w in low],
+            "keywords": hits_by["image"],
             "score": 88,
         }
 
-    if any(w in low for w in RESEARCH_WORDS):
+    if hits_by.get("research"):
         return {
             "section": "研究分析类",
             "skill": "research-hub",
             "description": "证据驱动的研究报告与战略分析中枢",
-            "keywords": [w for w in RESEARCH_WORDS if w in low],
+            "keywords": hits_by["research"],
             "score": 89,
         }
 
-    plan_hits = [w for w in PLAN_WORDS if w in low]
+    plan_hits = hits_by.get("plan", [])
     best: Tuple[int, Dict[str, Any]] | None = None
-    for rule in rules:
-        hits = [k for k in rule["keywords"] if k.lower() in low]
-        if not hits:
-            continue
+    for idx in sorted(k for k in hits_by if isinstance(k, int)):
+        rule = rules[idx]
+        hits = hits_by[idx]
         score = len(hits) + SECTION_BONUS.get(rule["section"], 0)
-        if plan_hits and any(k in low for k in STRONG_EXEC_KEYWORDS):
+        if plan_hits and hits_by.get("strong_exec"):
             score += 1
         cand = {
             "section": rule["section"],
@@ -264,15 +362,21 @@ def route_text_enhanced(text: str, rules: List[Dict[str, Any]]) -> Dict[str, Any
     """
     增强版路由：结合传统规则匹配 + 技能元数据触发匹配
     """
-    # 1. 优先使用技能解析器的触发短语匹配
+    # 1. 优先使用技能解析器的触发短语匹配（含近似命中，容忍措辞/拼写小差异）
     try:
-        skills = parse_all_skills(silent=True)
-        trigger_matches = match_triggers(text, skills)
+        skills = _load_skills()
+        trigger_matches = match_triggers(text, skills, fuzzy=True)
 
         if trigger_matches:
-            # 使用最高分的触发匹配结果
-            best_match = trigger_matches[0]
+            # 有精确命中的技能优先，其次才是最高分的近似命中
+            best_match = next((m for m in trigger_matches if m["matched_triggers"]), trigger_matches[0])
             skill_name = best_match["skill"]
+            near = [x["trigger"] for x in best_match.get("fuzzy_triggers", [])]
+            if not best_match["matched_triggers"]:
+                # 只有近似命中时，传统规则有明确命中则以规则为准
+                fallback = route_text(text, rules)
+                if fallback["skill"] != "clarify":
+                    return fallback
 
             # 尝试提取参数
             skill_obj = next((s for s in skills if s.name == skill_name), None)
@@ -284,7 +388,7 @@ def route_text_enhanced(text: str, rules: List[Dict[str, Any]]) -> Dict[str, Any
                 "section": "技能元数据触发",
                 "skill": skill_name,
                 "description": f"通过触发短语匹配 (score: {best_match['score']})",
-                "keywords": best_match["matched_triggers"],
+                "keywords": best_match["matched_triggers"] + near,
                 "score": best_match["score"] + 20,  # 触发匹配优先权更高
                 "params": params,  # 提取的参数
                 "calls": skill_obj.calls if skill_obj else [],  # 技能链
@@ -296,6 +400,139 @@ def route_text_enhanced(text: str, rules: List[Dict[str, Any]]) -> Dict[str, Any
     # 2. 回退到传统规则匹配
     return route_text(text, rules)
 
+def route_batch(
+    texts: Iterable[str],
+    rules: List[Dict[str, Any]] | None = None,
+    enhanced: bool = False,
+) -> List[Dict[str, Any]]:
+    """Route many texts against one compiled table; results keep input order."""
+    rules = load_route_table() if rules is None else rules
+    fn = route_text_enhanced if enhanced else route_text
+    return [fn(str(text), rules) for text in texts]
+
+
+_REPLAY_RULES: List[Dict[str, Any]] | None = None
+
+
+def _init_replay_worker(route_doc: str, cache_dir: str = "") -> None:
+    global _REPLAY_RULES
+    _REPLAY_RULES = load_route_table(Path(route_doc), Path(cache_dir) if cache_dir else None)
+
+
+def _replay_chunk(texts: List[str], enhanced: bool) -> List[Tuple[str, int]]:
+    return [(r["skill"], int(r.get("score", 0) or 0)) for r in route_batch(texts, _REPLAY_RULES, enhanced=enhanced)]
+
+
+def _payload_text(path: str) -> str:
+    try:
+        payload = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return ""
+    request = payload.get("request", {}) if isinstance(payload, dict) else {}
+    if isinstance(request, dict) and request.get("text"):
+        return str(request["text"])
+    return str(payload.get("text", "")) if isinstance(payload, dict) else ""
+
+
+def load_replay_requests(paths: List[Path]) -> List[Dict[str, Any]]:
+    """Historical requests from skill_tracer route logs or agent_runs.jsonl.
+
+    Trace rows carry the recorded skill; agent run rows only point at their
+    payload, so their text is read from `payload_path` and they have no
+    recorded decision.
+    """
+    files: List[Path] = []
+    for path in paths:
+        files.extend(sorted(path.glob("*.jsonl")) if path.is_dir() else [path])
+    out: List[Dict[str, Any]] = []
+    for file in files:
+        if not file.exists():
+            continue
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(row, dict):
+                    continue
+                if row.get("type") == "route" and row.get("input_text"):
+                    route = row.get("route", {}) if isinstance(row.get("route"), dict) else {}
+                    out.append({"id": row.get("trace_id", ""), "text": str(row["input_text"]), "recorded": route.get("skill")})
+                elif row.get("run_id") and row.get("payload_path"):
+                    text = _payload_text(str(row["payload_path"]))
+                    if text:
+                        out.append({"id": row["run_id"], "text": text, "recorded": None})
+                elif row.get("text") or row.get("query"):
+                    out.append({"id": row.get("id", ""), "text": str(row.get("text") or row.get("query")), "recorded": row.get("skill")})
+    return out
+
+
+def replay_routes(
+    requests: List[Dict[str, Any]],
+    route_doc: Path = ROUTE_DOC,
+    workers: int = 0,
+    enhanced: bool = False,
+    chunk_size: int = 2000,
+    max_samples: int = 50,
+    cache_dir: Path | None = None,
+) -> Dict[str, Any]:
+    """Re-route historical requests with the current table and diff against recorded skills."""
+    t0 = time.perf_counter()
+    # Routing is deterministic per text, so each distinct request is routed once.
+    texts = list(dict.fromkeys(r["text"] for r in requests))
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), max(1, chunk_size))]
+    workers = int(workers or 0)
+    routed: List[Tuple[str, int]] = []
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_replay_worker, initargs=(str(route_doc), str(cache_dir or ""))) as pool:
+            for part in pool.map(_replay_chunk, chunks, [enhanced] * len(chunks)):
+                routed.extend(part)
+    else:
+        _init_replay_worker(str(route_doc), str(cache_dir or ""))
+        for chunk in chunks:
+            routed.extend(_replay_chunk(chunk, enhanced))
+    decisions = dict(zip(texts, routed))
+    elapsed = time.perf_counter() - t0
+
+    transitions: Counter = Counter()
+    skills: Counter = Counter()
+    samples: List[Dict[str, Any]] = []
+    unchanged = unrecorded = 0
+    for req in requests:
+        skill, score = decisions[req["text"]]
+        skills[skill] += 1
+        recorded = req.get("recorded")
+        if not recorded:
+            unrecorded += 1
+            continue
+        if recorded == skill:
+            unchanged += 1
+            continue
+        transitions[f"{recorded} -> {skill}"] += 1
+        if len(samples) < max_samples:
+            samples.append({"id": req.get("id", ""), "text": req["text"], "recorded": recorded, "replayed": skill, "score": score})
+    changed = sum(transitions.values())
+    return {
+        "route_doc": str(route_doc),
+        "mode": "enhanced" if enhanced else "rules",
+        "workers": workers if workers > 1 and len(chunks) > 1 else 1,
+        "total": len(requests),
+        "distinct_texts": len(texts),
+        "recorded": unchanged + changed,
+        "unchanged": unchanged,
+        "changed": changed,
+        "unrecorded": unrecorded,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "routes_per_sec": round(len(requests) / elapsed, 1) if elapsed else None,
+        "transitions": dict(transitions.most_common()),
+        "skills": dict(skills.most_common()),
+        "samples": samples,
+    }
+
 
 def _server_from_skill(skill: str) -> str:
     s = skill.lower()
@@ -329,10 +566,9 @@ def _default_call(server: str, text: str) -> Tuple[str, Dict[str, Any]]:
 
 
 def execute_route(text: str, params_json: str) -> Dict[str, Any]:
-    import time
     start_time = time.time()
 
-    rules = parse_route_doc()
+    rules = load_route_table()
     # 使用增强版路由（结合技能元数据触发匹配）
     route = route_text_enhanced(text, rules)
     skill = route["skill"]
@@ -668,7 +904,10 @@ def build_cli() -> argparse.ArgumentParser:
     sub = p.add_subparsers(dest="command")
 
     rt = sub.add_parser("route", help="route text")
-    rt.add_argument("--text", required=True)
+    rt.add_argument("--text", default="")
+    rt.add_argument("--bench", action="store_true", help="report routing throughput on a sample corpus")
+    rt.add_argument("--corpus", default="", help="bench corpus: .txt (one request per line) or .jsonl with a text field")
+    rt.add_argument("--repeat", type=int, default=200)
 
     ex = sub.add_parser("execute", help="route and execute")
     ex.add_argument("--text", required=True)
@@ -678,6 +917,13 @@ def build_cli() -> argparse.ArgumentParser:
     au.add_argument("--text", required=True)
     au.add_argument("--params-json", default="{}")
 
+    rp = sub.add_parser("replay", help="re-route historical requests and diff against recorded decisions")
+    rp.add_argument("--log", action="append", default=[], help="skill trace JSONL / agent_runs.jsonl / directory (repeatable)")
+    rp.add_argument("--route-doc", default=str(ROUTE_DOC))
+    rp.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    rp.add_argument("--rules-only", action="store_true", help="skip skill trigger matching (execute records enhanced routes)")
+    rp.add_argument("--samples", type=int, default=50)
+
     sub.add_parser("dump", help="dump parsed rules")
     return p
 
@@ -686,6 +932,76 @@ def print_json(obj: Any) -> None:
     print(json.dumps(obj, ensure_ascii=False, indent=2))
 
 
+BENCH_CORPUS = [
+    "请帮我获取网页内容",
+    "我打算更新这张表，excel直接修改原文件",
+    "请分析513180的K线和买卖点",
+    "analyze SPY support resistance",
+    "帮我做一个低多边形风格人物图",
+    "请做支付SaaS市场规模和竞争拆解研报",
+    "做一份咨询风格PPT",
+    "查询本地数据库里的交易明细",
+    "整理本周会议纪要并生成待办",
+    "分析北京支付行业监管政策",
+    "做一个通用任务处理方案",
+    "读取知识库里的监管文件",
+]
+
+
+def load_bench_corpus(path: str) -> List[str]:
+    if not path:
+        return list(BENCH_CORPUS)
+    texts: List[str] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            line = str(row.get("text") or row.get("query") or "").strip()
+        if line:
+            texts.append(line)
+    return texts or list(BENCH_CORPUS)
+
+
+def bench_routing(texts: List[str], repeat: int = 200, cache_dir: Path | None = None) -> Dict[str, Any]:
+    repeat = max(1, int(repeat))
+    t0 = time.perf_counter()
+    rules = parse_route_doc()
+    parse_ms = (time.perf_counter() - t0) * 1000
+    _ROUTE_TABLES.clear()
+    t0 = time.perf_counter()
+    rules = load_route_table(cache_dir=cache_dir)
+    load_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    _compiled_for(rules)
+    compile_ms = (time.perf_counter() - t0) * 1000
+
+    def _throughput(fn: Any) -> Dict[str, Any]:
+        t = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                fn(text, rules)
+        elapsed = time.perf_counter() - t
+        n = repeat * len(texts)
+        return {"routes": n, "elapsed_ms": round(elapsed * 1000, 2), "routes_per_sec": round(n / elapsed, 1) if elapsed else None}
+
+    _load_skills()
+    return {
+        "corpus_size": len(texts),
+        "repeat": repeat,
+        "rules": len(rules),
+        "parse_route_doc_ms": round(parse_ms, 3),
+        "load_route_table_ms": round(load_ms, 3),
+        "compile_automaton_ms": round(compile_ms, 3),
+        "route_text": _throughput(route_text),
+        "route_text_enhanced": _throughput(route_text_enhanced),
+    }
+
+
 def main(argv: List[str] | None = None) -> int:
     parser = build_cli()
     args = parser.parse_args(argv)
@@ -698,7 +1014,25 @@ def main(argv: List[str] | None = None) -> int:
             print_json({"rules": parse_route_doc()})
             return 0
         if args.command == "route":
-            print_json(route_text_enhanced(args.text, parse_route_doc()))
+            if args.bench:
+                print_json(bench_routing(load_bench_corpus(args.corpus), repeat=args.repeat))
+                return 0
+            if not args.text:
+                raise SkillRouterError("--text is required unless --bench is set")
+            print_json(route_text_enhanced(args.text, load_route_table()))
+            return 0
+        if args.command == "replay":
+            logs = [Path(x) for x in args.log] or [TRACE_DIR]
+            requests = load_replay_requests(logs)
+            print_json(
+                replay_routes(
+                    requests,
+                    route_doc=Path(args.route_doc),
+                    workers=args.workers,
+                    enhanced=not args.rules_only,
+                    max_samples=args.samples,
+                )
+            )
             return 0
         if args.command == "execute":
             print_json(execute_route(args.text, args.params_json))
@@ -5,7 +5,8 @@ Tool Use Router - 统一工具路由器
 功能：
 - 统一管理 MCP、MiniMax API、本地函数三种工具来源
 - 智能路由：根据工具声明自动选择执行方式
-- 缓存支持：工具定义和执行结果缓存
+- 缓存支持：工具定义和执行结果缓存（共享字节上限 LRU，按工具 TTL，single-flight）
+- 执行策略：本地函数可按 inline / thread / process 执行，支持并发上限与超时
 
 使用示例：
     from scripts.tool_use_router import ToolUseRouter, create_router
@@ -18,14 +19,25 @@ Tool Use Router - 统一工具路由器
 
     # 注册自定义工具
     router.register_function("calculate_roi", calculate_roi_func)
+
+    # 慢函数放到线程池，最多 2 个并发，5 秒超时
+    router.register_function("fetch_report", fetch_report, ExecutionPolicy(mode="thread", max_concurrency=2, timeout_sec=5))
+
+    # 同一轮模型输出的多个工具调用并发执行，结果按调用顺序返回
+    results = await router.execute_tools([ToolCall("a", {}), ToolCall("b", {})])
 """
 
 from __future__ import annotations
 
 import asyncio
+import functools
 import hashlib
 import json
+import threading
 import time
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Union
@@ -34,13 +46,15 @@ ROOT = Path(__file__).resolve().parents[1]
 
 # 尝试导入依赖模块
 try:
-    from scripts.cache_service import cache_service
     from scripts.mcp_connector import Runtime, Registry
     from scripts.minimax_cache_client import MiniMaxCacheClient
+    from scripts.result_cache import ResultCache, shared_result_cache
 except ImportError:
-    from cache_service import cache_service
     from mcp_connector import Runtime, Registry
     from minimax_cache_client import MiniMaxCacheClient
+    from result_cache import ResultCache, shared_result_cache
+
+DEFAULT_TOOL_TTL = 60.0  # 工具结果默认缓存秒数
 
 
 @dataclass
@@ -54,6 +68,25 @@ class ToolDefinition:
     function: Optional[Callable] = None  # 本地函数
 
 
+@dataclass
+class ExecutionPolicy:
+    """本地函数执行策略
+
+    mode: inline（调用方线程/事件循环内直接执行）、thread（线程池）、
+          process（进程池，函数与参数需可 pickle）
+    max_concurrency: 该函数同时执行的上限，None 表示不限；在调用方（事件循环/同步调用线程）
+                     排队，不占用执行池线程；异步调用按事件循环计数，同步调用另计
+    timeout_sec: 超时秒数，None 表示不限，从拿到并发名额后开始计时；
+                 线程内的函数超时后无法强制中断，只是不再等待（名额在函数真正结束后才归还）
+    """
+    mode: str = "inline"
+    max_concurrency: Optional[int] = None
+    timeout_sec: Optional[float] = None
+
+
+EXECUTION_MODES = {"inline", "thread", "process"}
+
+
 @dataclass
 class ToolCall:
     """工具调用请求"""
@@ -78,15 +111,26 @@ class LocalFunctionRegistry:
 
     def __init__(self):
         self._functions: Dict[str, Callable] = {}
+        self._policies: Dict[str, ExecutionPolicy] = {}
 
-    def register(self, name: str, func: Callable):
+    def register(self, name: str, func: Callable, policy: Optional[ExecutionPolicy] = None):
         """注册本地函数"""
+        if policy is not None and policy.mode not in EXECUTION_MODES:
+            raise ValueError(f"unknown execution mode: {policy.mode}")
         self._functions[name] = func
+        if policy is not None:
+            self._policies[name] = policy
+        else:
+            self._policies.pop(name, None)
 
     def get(self, name: str) -> Optional[Callable]:
         """获取本地函数"""
         return self._functions.get(name)
 
+    def get_policy(self, name: str) -> Optional[ExecutionPolicy]:
+        """获取函数的执行策略（未单独设置时为 None）"""
+        return self._policies.get(name)
+
     def list_all(self) -> List[str]:
         """列出所有注册的函数"""
         return list(self._functions.keys())
@@ -95,6 +139,7 @@ class LocalFunctionRegistry:
         """注销函数"""
         if name in self._functions:
             del self._functions[name]
+        self._policies.pop(name, None)
 
 
 class ToolUseRouter:
@@ -111,14 +156,36 @@ class ToolUseRouter:
         self,
         mcp_runtime: Optional[Runtime] = None,
         minimax_client: Optional[MiniMaxCacheClient] = None,
+        default_policy: Optional[ExecutionPolicy] = None,
+        max_workers: int = 8,
+        result_cache: Optional[ResultCache] = None,
+        tool_ttls: Optional[Dict[str, float]] = None,
+        cache_scope: str = "",
     ):
         self._mcp_runtime = mcp_runtime
         self._minimax_client = minimax_client
         self._local_functions = LocalFunctionRegistry()
 
+        # 执行池（按需创建）与每个函数的并发闸门
+        self._default_policy = default_policy or ExecutionPolicy()
+        self._max_workers = max(1, int(max_workers))
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._gates: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_gates: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
         # 工具定义缓存
         self._tool_definitions: Dict[str, ToolDefinition] = {}
 
+        # 工具调用结果缓存（默认与 MCPCacheMiddleware / CacheService 共享）
+        self._result_cache = result_cache or shared_result_cache()
+        self._tool_ttls: Dict[str, float] = dict(tool_ttls or {})
+        # 结果缓存键的作用域：共享缓存中不同用途的路由器可用它彼此隔离
+        self._cache_scope = cache_scope
+
         # 执行统计
         self._stats = {
             "mcp_calls": 0,
@@ -148,7 +215,9 @@ class ToolUseRouter:
         runtime = self._ensure_mcp_runtime()
 
         try:
-            result = runtime.call(server, tool, params)
+            # MCP 调用是阻塞 IO，放到线程池执行，避免占住事件循环
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool("thread"), functools.partial(runtime.call, server, tool, params))
             self._stats["mcp_calls"] += 1
             return ToolResult(
                 tool_call_id=tool,
@@ -248,54 +317,139 @@ class ToolUseRouter:
 
     # ==================== 本地函数相关 ====================
 
-    def register_function(self, name: str, func: Callable):
-        """注册本地函数"""
-        self._local_functions.register(name, func)
+    def register_function(self, name: str, func: Callable, policy: Optional[ExecutionPolicy] = None):
+        """注册本地函数（policy 为空时使用路由器默认策略）"""
+        self._local_functions.register(name, func, policy)
+        with self._pool_lock:
+            self._gates.pop(name, None)
+            for gates in self._async_gates.values():
+                gates.pop(name, None)
+
+    def _policy_for(self, name: str) -> ExecutionPolicy:
+        return self._local_functions.get_policy(name) or self._default_policy
+
+    def _pool(self, mode: str) -> Executor:
+        """按需创建线程池/进程池"""
+        with self._pool_lock:
+            if mode == "process":
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(max_workers=self._max_workers)
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tool-fn")
+            return self._thread_pool
+
+    def _gate(self, name: str, policy: ExecutionPolicy) -> Optional[threading.BoundedSemaphore]:
+        if not policy.max_concurrency:
+            return None
+        with self._pool_lock:
+            gate = self._gates.get(name)
+            if gate is None:
+                gate = threading.BoundedSemaphore(max(1, int(policy.max_concurrency)))
+                self._gates[name] = gate
+            return gate
+
+    def _async_gate(self, name: str, policy: ExecutionPolicy) -> Optional[asyncio.Semaphore]:
+        """当前事件循环内的并发闸门（asyncio.Semaphore 绑定创建它的事件循环）"""
+        if not policy.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._pool_lock:
+            gates = self._async_gates.setdefault(loop, {})
+            gate = gates.get(name)
+            if gate is None:
+                gate = asyncio.Semaphore(max(1, int(policy.max_concurrency)))
+                gates[name] = gate
+            return gate
+
+    def _function_result(self, name: str, start: float, result: Any = None, error: Optional[str] = None) -> ToolResult:
+        if error is None:
+            self._stats["function_calls"] += 1
+        return ToolResult(
+            tool_call_id=name,
+            content=str(result) if error is None else f"Error: {error}",
+            is_error=error is not None,
+            execution_time_ms=int((time.time() - start) * 1000),
+            source="function"
+        )
 
     def execute_function(
         self,
         name: str,
         params: Dict[str, Any]
     ) -> ToolResult:
-        """执行本地函数"""
+        """执行本地函数（同步接口；thread/process 策略下在池中执行并按超时等待）"""
         start = time.time()
         func = self._local_functions.get(name)
 
         if func is None:
-            return ToolResult(
-                tool_call_id=name,
-                content=f"Error: Function '{name}' not found",
-                is_error=True,
-                execution_time_ms=int((time.time() - start) * 1000),
-                source="function"
-            )
-
+            return self._function_result(name, start, error=f"Function '{name}' not found")
+
+        policy = self._policy_for(name)
+        gate = self._gate(name, policy)
+        # 在调用线程排队拿名额，不占执行池线程；超时从提交后开始算
+        if gate is not None:
+            gate.acquire()
+        handed_off = False
         try:
-            # 尝试同步执行
-            if asyncio.iscoroutinefunction(func):
-                # 异步函数
-                result = asyncio.run(func(**params))
+            if policy.mode == "inline":
+                result = _call_function(func, params)
             else:
-                # 同步函数
-                result = func(**params)
-
-            self._stats["function_calls"] += 1
+                future = self._pool(policy.mode).submit(_call_function, func, params)
+                if gate is not None:
+                    # 超时后函数仍在运行，名额等它真正结束再归还
+                    future.add_done_callback(lambda _f: gate.release())
+                    handed_off = True
+                result = future.result(timeout=policy.timeout_sec)
+            return self._function_result(name, start, result)
+        except FutureTimeoutError:
+            return self._function_result(name, start, error=f"Function '{name}' timed out after {policy.timeout_sec}s")
+        except Exception as e:
+            return self._function_result(name, start, error=str(e))
+        finally:
+            if gate is not None and not handed_off:
+                gate.release()
 
-            return ToolResult(
-                tool_call_id=name,
-                content=str(result),
-                execution_time_ms=int((time.time() - start) * 1000),
-                source="function"
-            )
+    async def execute_function_async(
+        self,
+        name: str,
+        params: Dict[str, Any]
+    ) -> ToolResult:
+        """执行本地函数（异步接口；thread/process 策略不阻塞事件循环）"""
+        start = time.time()
+        func = self._local_functions.get(name)
 
+        if func is None:
+            return self._function_result(name, start, error=f"Function '{name}' not found")
+
+        policy = self._policy_for(name)
+        gate = self._async_gate(name, policy)
+        # 在事件循环里排队拿名额，再派发到执行池；超时从拿到名额后开始算
+        if gate is not None:
+            await gate.acquire()
+        handed_off = False
+        try:
+            if policy.mode == "inline":
+                if asyncio.iscoroutinefunction(func):
+                    result = await asyncio.wait_for(func(**params), timeout=policy.timeout_sec)
+                else:
+                    result = func(**params)
+            else:
+                loop = asyncio.get_running_loop()
+                future = self._pool(policy.mode).submit(_call_function, func, params)
+                if gate is not None:
+                    # 超时后函数仍在运行，名额等它真正结束再归还
+                    future.add_done_callback(lambda _f: _release_threadsafe(loop, gate))
+                    handed_off = True
+                result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=policy.timeout_sec)
+            return self._function_result(name, start, result)
+        except asyncio.TimeoutError:
+            return self._function_result(name, start, error=f"Function '{name}' timed out after {policy.timeout_sec}s")
         except Exception as e:
-            return ToolResult(
-                tool_call_id=name,
-                content=f"Error: {str(e)}",
-                is_error=True,
-                execution_time_ms=int((time.time() - start) * 1000),
-                source="function"
-            )
+            return self._function_result(name, start, error=str(e))
+        finally:
+            if gate is not None and not handed_off:
+                gate.release()
 
     def list_functions(self) -> List[str]:
         """列出所有本地函数"""
@@ -320,46 +474,98 @@ class ToolUseRouter:
         source = tool_call.source or self._resolve_tool_source(tool_call.name)
 
         # 检查缓存
-        cache_key = self._generate_cache_key(tool_call, source)
-        cached = cache_service._call_cache.get(cache_key)
-        if cached and (time.time() - cached["cached_at"]) < 60:
+        cache_key = self._generate_cache_key(tool_call, source, context.get("server") if source == "mcp" else None)
+        ttl = self._tool_ttls.get(tool_call.name, DEFAULT_TOOL_TTL)
+        executed = False
+
+        async def _run() -> ToolResult:
+            nonlocal executed
+            executed = True
+            return await self._dispatch(tool_call, source, context)
+
+        if ttl <= 0:
+            return await _run()
+
+        # 命中缓存直接返回；相同调用并发时只执行一次；错误结果不缓存
+        result = await self._result_cache.aget_or_compute(
+            cache_key, _run, ttl=ttl, cacheable=lambda r: not r.is_error
+        )
+        if not executed:
             self._stats["cache_hits"] += 1
-            return cached["result"]
+        return result
 
-        # 执行工具
+    async def _dispatch(self, tool_call: ToolCall, source: str, context: Dict[str, Any]) -> ToolResult:
+        """按来源执行工具"""
         if source == "mcp":
-            result = await self.execute_mcp_tool(
+            return await self.execute_mcp_tool(
                 server=context.get("server", "filesystem"),
                 tool=tool_call.name,
                 params=tool_call.arguments
             )
-        elif source == "minimax":
-            result = await self.execute_minimax_tool(
+        if source == "minimax":
+            return await self.execute_minimax_tool(
                 tool_name=tool_call.name,
                 tool_input=tool_call.arguments,
                 messages=context.get("messages", []),
                 tools=context.get("tools", [])
             )
-        elif source == "function":
-            result = self.execute_function(
+        if source == "function":
+            return await self.execute_function_async(
                 name=tool_call.name,
                 params=tool_call.arguments
             )
-        else:
-            result = ToolResult(
-                tool_call_id=tool_call.name,
-                content=f"Error: Unknown tool source: {source}",
-                is_error=True,
-                source="unknown"
-            )
-
-        # 缓存结果
-        cache_service._call_cache[cache_key] = {
-            "result": result,
-            "cached_at": time.time()
-        }
+        return ToolResult(
+            tool_call_id=tool_call.name,
+            content=f"Error: Unknown tool source: {source}",
+            is_error=True,
+            source="unknown"
+        )
+
+    def set_tool_ttl(self, name: str, ttl_sec: float):
+        """设置单个工具的结果缓存秒数（<=0 表示不缓存）"""
+        self._tool_ttls[name] = float(ttl_sec)
+
+    async def execute_tools(
+        self,
+        tool_calls: List[ToolCall],
+        context: Optional[Dict[str, Any]] = None,
+        max_concurrency: Optional[int] = None,
+    ) -> List[ToolResult]:
+        """
+        批量执行同一轮模型输出中互不依赖的工具调用
 
-        return result
+        调用并发执行（可用 max_concurrency 限流），结果按 tool_calls 的顺序返回
+        """
+        limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def _one(call: ToolCall) -> ToolResult:
+            if limit is None:
+                return await self.execute_tool(call, context)
+            async with limit:
+                return await self.execute_tool(call, context)
+
+        outcomes = await asyncio.gather(*[_one(c) for c in tool_calls], return_exceptions=True)
+        results: List[ToolResult] = []
+        for call, outcome in zip(tool_calls, outcomes):
+            if isinstance(outcome, BaseException):
+                outcome = ToolResult(
+                    tool_call_id=call.id or call.name,
+                    content=f"Error: {str(outcome)}",
+                    is_error=True,
+                    source=call.source or "unknown"
+                )
+            results.append(outcome)
+        return results
+
+    def close(self):
+        """关闭执行池"""
+        with self._pool_lock:
+            pools = [self._thread_pool, self._process_pool]
+            self._thread_pool = None
+            self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
 
     def _resolve_tool_source(self, tool_name: str) -> str:
         """解析工具来源"""
@@ -382,13 +588,22 @@ class ToolUseRouter:
         # 默认使用 MiniMax
         return "minimax"
 
-    def _generate_cache_key(self, tool_call: ToolCall, source: str) -> str:
-        """生成缓存键"""
-        content = json.dumps({
+    def _generate_cache_key(self, tool_call: ToolCall, source: str, server: Optional[str] = None) -> str:
+        """生成缓存键（本地函数按实际注册的可调用对象区分，同名不同实现不会串结果）"""
+        payload = {
             "source": source,
             "name": tool_call.name,
             "arguments": tool_call.arguments
-        }, sort_keys=True)
+        }
+        if server:
+            payload["server"] = server
+        if self._cache_scope:
+            payload["scope"] = self._cache_scope
+        if source == "function":
+            func = self._local_functions.get(tool_call.name)
+            if func is not None:
+                payload["callable"] = _callable_id(func)
+        content = json.dumps(payload, sort_keys=True, default=str)
         return f"tool_call:{hashlib.sha256(content.encode()).hexdigest()}"
 
     # ==================== 工具定义管理 ====================
@@ -414,7 +629,8 @@ class ToolUseRouter:
         total = self._stats["total_calls"]
         return {
             **self._stats,
-            "cache_hit_rate": f"{(self._stats['cache_hits'] / total * 100):.1f}%" if total > 0 else "0%"
+            "cache_hit_rate": f"{(self._stats['cache_hits'] / total * 100):.1f}%" if total > 0 else "0%",
+            "result_cache": self._result_cache.stats(),
         }
 
     def reset_stats(self):
@@ -428,14 +644,39 @@ class ToolUseRouter:
         }
 
 
+def _call_function(func: Callable, params: Dict[str, Any]) -> Any:
+    """在当前线程/进程内执行函数（协程函数用独立事件循环运行）"""
+    if asyncio.iscoroutinefunction(func):
+        return asyncio.run(func(**params))
+    return func(**params)
+
+
+def _callable_id(func: Callable) -> str:
+    """可跨进程复现的函数标识：模块.限定名:首行号（partial 取其底层函数）"""
+    target = getattr(func, "func", func)
+    module = getattr(target, "__module__", None) or type(target).__module__
+    qualname = getattr(target, "__qualname__", None) or type(target).__qualname__
+    code = getattr(target, "__code__", None)
+    return f"{module}.{qualname}:{code.co_firstlineno}" if code is not None else f"{module}.{qualname}"
+
+
+def _release_threadsafe(loop: asyncio.AbstractEventLoop, gate: asyncio.Semaphore) -> None:
+    """在执行池线程中归还 asyncio 闸门（Semaphore 不是线程安全的，需回到事件循环）"""
+    try:
+        loop.call_soon_threadsafe(gate.release)
+    except RuntimeError:
+        pass  # 事件循环已关闭，闸门随之作废
+
+
 # ==================== 便捷函数 ====================
 
 def create_router(
     mcp_runtime: Optional[Runtime] = None,
-    minimax_client: Optional[MiniMaxCacheClient] = None
+    minimax_client: Optional[MiniMaxCacheClient] = None,
+    default_policy: Optional[ExecutionPolicy] = None,
 ) -> ToolUseRouter:
     """创建工具路由器"""
-    return ToolUseRouter(mcp_runtime, minimax_client)
+    return ToolUseRouter(mcp_runtime, minimax_client, default_policy=default_policy)
 
 
 def get_router() -> ToolUseRouter:
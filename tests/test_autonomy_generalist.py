@@ -3,7 +3,8 @@ import tempfile
 import unittest
 from pathlib import Path
 
-from scripts.autonomy_generalist import run_request
+from scripts.autonomy_generalist import _skill_score, compile_skill_index, run_request, score_skills
+from scripts.skill_parser import parse_all_skills
 
 
 class AutonomyGeneralistTest(unittest.TestCase):
@@ -28,6 +29,12 @@ class AutonomyGeneralistTest(unittest.TestCase):
                 self.assertTrue(Path(item["path"]).exists())
             self.assertTrue(memory_file.exists())
 
+    def test_indexed_skill_scores_match_per_skill_scoring(self):
+        skills = parse_all_skills(silent=True)
+        index = compile_skill_index(skills)
+        for text in ["请帮我获取网页内容并给出执行方案", "做一份咨询风格PPT", "analyze SPY kline", "低多边形 image 人物图", ""]:
+            self.assertEqual(score_skills(text, index), [_skill_score(text, s) for s in skills])
+
     def test_allowed_strategies_filter(self):
         with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
             root = Path(td)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import time
+import unittest
+
+from scripts.cache_service import CacheService, cache_service
+from scripts.result_cache import ResultCache
+from scripts.skill_cache import SkillCache
+
+
+class CacheServiceTest(unittest.TestCase):
+    def test_namespaced_tiers_share_one_engine(self):
+        engine = ResultCache()
+        cs = CacheService(result_cache=engine)
+        cs.cache_tools("minimax", {"tools": [{"name": "web_search"}]})
+        cs.cache_skill_prompt("minimax-docx", {"system": "你是文档处理专家"})
+        cs.cache_document_summary("doc_1", {"summary": "金融报告", "keywords": ["ETF"]})
+        cs.cache_call_result("minimax", "call-result")
+
+        self.assertEqual(cs.get_cached_tools("minimax"), {"tools": [{"name": "web_search"}]})
+        self.assertIsNone(cs.get_cached_tools("fetch"))
+        self.assertEqual(cs.get_cached_call_result("minimax"), "call-result")
+        self.assertIsNone(cs.get_cached_document_summary("doc_1", query="债券"))
+        self.assertIsNotNone(cs.get_cached_document_summary("doc_1", query="etf 走势"))
+        # 被查询过滤掉的摘要不算命中
+        context = engine.namespace_stats("context")
+        self.assertEqual((context["hits"], context["misses"]), (1, 1))
+
+        stats = cs.get_stats()
+        self.assertEqual((stats.tool_hits, stats.tool_misses), (1, 1))
+        tool_bytes = engine.namespace_stats("tool")["bytes"]
+        self.assertGreater(stats.total_tokens_saved, 0)
+        self.assertGreaterEqual(stats.total_tokens_saved, tool_bytes // 4)
+        info = cs.get_cache_info()
+        self.assertEqual(info["tool_cache"]["keys"], ["minimax"])
+        self.assertEqual(info["tool_cache"]["bytes"], tool_bytes)
+
+        cs.clear_all()
+        # 共享的 results 命名空间属于路由器，clear_all 不动它
+        self.assertEqual(engine.stats()["entries"], 1)
+        self.assertEqual(cs.get_cached_call_result("minimax"), "call-result")
+        self.assertEqual(cs.get_stats().tool_hits, 0)
+
+    def test_ttl_is_lazy_and_conversation_appends(self):
+        cs = CacheService(ttl=0.05, result_cache=ResultCache())
+        cs.append_to_conversation("s1", {"role": "user", "content": "hi"})
+        cs.append_to_conversation("s1", {"role": "assistant", "content": "hello"})
+        self.assertEqual(len(cs.get_cached_conversation("s1")["messages"]), 2)
+        time.sleep(0.08)
+        self.assertEqual(cs.clear_expired(), 1)
+        self.assertIsNone(cs.get_cached_conversation("s1"))
+
+    def test_skill_definitions_survive_engine_eviction(self):
+        sc = SkillCache()
+        sc.cache_skill("demo-skill", system_prompt="你是演示助手", tools=["Read"])
+        skill = sc.get_skill("demo-skill")
+        self.assertEqual(skill.tools, ["Read"])
+        self.assertIn("demo-skill", sc.get_stats()["cached_skills"])
+        self.assertEqual(sc.build_system_prompt("demo-skill", "补充"), "你是演示助手\n\n补充")
+        # 共享引擎中的技能提示被淘汰后，技能定义仍在
+        cache_service.engine.clear("skill")
+        self.assertIs(sc.get_skill("demo-skill"), skill)
+        self.assertIsNone(sc.get_skill("unknown-skill"))
+        sc.clear()
+        self.assertEqual(sc.get_stats()["cached_skills"], [])
+
+if __name__ == "__main__":
+    unittest.main()
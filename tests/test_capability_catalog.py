@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
+import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 from scripts.skill_parser import SkillMeta
+from scripts import capability_catalog
 from scripts.capability_catalog import scan
 
 
@@ -51,6 +54,39 @@ class CapabilityCatalogTest(unittest.TestCase):
         self.assertEqual(report["skills"][0]["maturity"], "needs-contract")
         self.assertTrue(report["gaps"])
 
+    def test_incremental_scan_only_reparses_changed_skills(self):
+        doc = "---\nskill:\n  name: {name}\n  description: {desc}\ntriggers: [t]\ncalls: [c]\noutput: {{format: json}}\n---\nbody\n"
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            skill_dir = root / "skills"
+            skill_dir.mkdir()
+            (skill_dir / "a.md").write_text(doc.format(name="alpha", desc="policy"), encoding="utf-8")
+            (skill_dir / "b.md").write_text(doc.format(name="beta", desc="ppt"), encoding="utf-8")
+            contracts = root / "contracts.toml"
+            contracts.write_text("", encoding="utf-8")
+            cfg = {"defaults": {"contracts_cfg": str(contracts)}, "layer_mapping": {}}
+            cache = root / "cache.json"
+
+            first = scan(cfg=cfg, skill_dir=skill_dir, cache_path=cache)
+            self.assertEqual(first["cache"]["recomputed"], 2)
+            self.assertTrue(cache.exists())
+            self.assertEqual(list(root.glob("*.tmp")), [])
+
+            capability_catalog._CATALOG_STATE.clear()
+            with patch.object(capability_catalog, "parse_skill_file", side_effect=AssertionError("re-parsed")):
+                warm = scan(cfg=cfg, skill_dir=skill_dir, cache_path=cache)
+            self.assertEqual(warm["skills"], first["skills"])
+
+            (skill_dir / "b.md").write_text(doc.format(name="beta", desc="excel"), encoding="utf-8")
+            changed = scan(cfg=cfg, skill_dir=skill_dir, cache_path=cache)
+            self.assertEqual(changed["cache"]["recomputed"], 1)
+            rows = {r["skill"]: r for r in changed["skills"]}
+            self.assertEqual(rows["beta"]["layer"], "delivery-dataops")
+
+            remapped = scan(cfg={**cfg, "layer_mapping": {"alpha": "custom"}}, skill_dir=skill_dir, cache_path=cache)
+            self.assertEqual(remapped["cache"]["recomputed"], 2)
+            self.assertEqual({r["skill"]: r for r in remapped["skills"]}["alpha"]["layer"], "custom")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import gzip
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from scripts.http_cache import HttpCache, OfflineCacheMiss
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        self.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/down":
+            self.send_error(503)
+            return
+        if self.path.startswith("/p/"):
+            # uncacheable-by-validator page whose content changes on every fetch
+            body = f"{self.path}#{len(self.hits)}".encode() * 10
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        if self.path == "/gz":
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _Handler.hits.clear()
+
+    def test_fresh_revalidated_and_content_addressed(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            cache = HttpCache(Path(td))
+            first = cache.get(f"{self.base}/a", max_age=60)
+            self.assertEqual((first["cache"], first["body"]), ("miss", b'{"ok": true}'))
+            self.assertEqual(cache.get(f"{self.base}/a", max_age=60)["cache"], "fresh")
+            self.assertEqual(len(_Handler.hits), 1)
+            again = cache.get(f"{self.base}/a", max_age=0)
+            self.assertEqual((again["cache"], again["body"]), ("revalidated", b'{"ok": true}'))
+            self.assertEqual(_Handler.hits[-1], ("/a", '"v1"'))
+            self.assertEqual(cache.get_json(f"{self.base}/gz", max_age=60), {"ok": True})
+            stats = cache.stats()
+            self.assertEqual((stats["entries"], stats["bodies"]), (2, 1))
+
+    def test_offline_and_network_errors_serve_stale(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            cache = HttpCache(Path(td))
+            cache.get(f"{self.base}/a")
+            offline = HttpCache(Path(td), offline=True)
+            self.assertEqual(offline.get(f"{self.base}/a", max_age=0)["cache"], "stale")
+            with self.assertRaises(OfflineCacheMiss):
+                offline.get(f"{self.base}/b")
+            self.assertEqual(len(_Handler.hits), 1)
+
+            def broken(req, timeout):
+                raise OSError("network unreachable")
+
+            self.assertEqual(cache.get(f"{self.base}/a", max_age=0, opener=broken)["cache"], "stale")
+            with self.assertRaises(OSError):
+                cache.get(f"{self.base}/b", opener=broken)
+            with self.assertRaises(Exception):
+                cache.get(f"{self.base}/down")
+
+
+    def test_changed_content_drops_superseded_body(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            cache = HttpCache(Path(td))
+            first = cache.get(f"{self.base}/p/x", max_age=0)
+            second = cache.get(f"{self.base}/p/x", max_age=0)
+            self.assertNotEqual(first["body"], second["body"])
+            self.assertEqual([p.read_bytes() for p in cache.bodies.glob("*/*")], [second["body"]])
+
+    def test_prune_expires_old_entries_and_fits_byte_budget(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            cache = HttpCache(Path(td), max_entry_age=86400, prune_interval=3600)
+            for name in ("old", "b", "c", "d"):
+                cache.get(f"{self.base}/p/{name}")
+            size = len(cache.get(f"{self.base}/p/d")["body"])
+            now = time.time()
+            with sqlite3.connect(cache.db_path) as conn:
+                for name, age in (("old", 2 * 86400), ("b", 300), ("c", 200), ("d", 100)):
+                    conn.execute("UPDATE responses SET validated_at = ? WHERE url = ?", (now - age, f"{self.base}/p/{name}"))
+            cache.max_body_bytes = 2 * size
+            report = cache.prune(now=now + 120)
+            self.assertEqual((report["expired_entries"], report["evicted_entries"], report["removed_bodies"]), (1, 1, 2))
+            with sqlite3.connect(cache.db_path) as conn:
+                urls = sorted(r[0] for r in conn.execute("SELECT url FROM responses"))
+            self.assertEqual(urls, [f"{self.base}/p/c", f"{self.base}/p/d"])
+            self.assertEqual(len(list(cache.bodies.glob("*/*"))), 2)
+            self.assertLessEqual(report["body_bytes"], cache.max_body_bytes)
+
+if __name__ == "__main__":
+    unittest.main()
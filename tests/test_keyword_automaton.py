@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import unittest
+
+from scripts.keyword_automaton import KeywordAutomaton
+
+
+class KeywordAutomatonTest(unittest.TestCase):
+    def test_overlapping_hits_grouped_by_payload(self):
+        m = KeywordAutomaton()
+        m.add_many(["he", "she", "hers"], "r1")
+        m.add_many(["His", "表格"], "r2")
+        m.add_many(["nothing"], "r3")
+        hits = m.build().match("USHERS 更新表格")
+        self.assertEqual(hits["r1"], ["he", "she", "hers"])
+        self.assertEqual(hits["r2"], ["表格"])
+        self.assertNotIn("r3", hits)
+
+    def test_matches_substring_semantics(self):
+        keywords = ["a", "ab", "bab", "bc", "bca", "c", "caa", "k线", "K线图"]
+        m = KeywordAutomaton()
+        for i, kw in enumerate(keywords):
+            m.add(kw, i)
+        for text in ["abccab", "bcaab", "分析K线图", "xyz", ""]:
+            expected = {i for i, kw in enumerate(keywords) if kw.lower() in text.lower()}
+            self.assertEqual(set(m.match(text)), expected, text)
+
+
+if __name__ == "__main__":
+    unittest.main()
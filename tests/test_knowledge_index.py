@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+from scripts.knowledge_index import (
+    DirWatcher,
+    apply_changes,
+    build_index,
+    chunk_passages,
+    cjk_bigrams,
+    cjk_segment,
+    connect,
+    final_rank,
+    fts_match_query,
+    index_generation,
+    query_index,
+)
+from scripts.knowledge_vectors import build_vectors, dense_search, ids_path, load_index, np
+from scripts.research_source_adapters import KNOWLEDGE_CACHE_NS, search_knowledge
+from scripts.result_cache import shared_result_cache
+
+
+def _write_kb(root: Path) -> Path:
+    kb = root / "知识库"
+    (kb / "pbc_weixin").mkdir(parents=True, exist_ok=True)
+    (kb / "iresearch_information").mkdir(parents=True, exist_ok=True)
+    (kb / "pbc_weixin" / "备付金管理办法.md").write_text(
+        "# 非银行支付机构客户备付金存管办法\n更新日期：2026-01-05\n支付机构应当将客户备付金集中存管。",
+        encoding="utf-8",
+    )
+    (kb / "iresearch_information" / "SaaS报告.md").write_text(
+        "# 中国支付SaaS市场研究\n市场规模与竞争格局，SaaS 厂商收单业务。", encoding="utf-8"
+    )
+    return kb
+
+
+class KnowledgeIndexTest(unittest.TestCase):
+    def test_query_rewrite(self):
+        self.assertEqual(cjk_bigrams("支付机构 a 金"), "支付 付机 机构 金")
+        self.assertEqual(cjk_segment("中国支付SaaS市场, plain text"), "中国 国支 支付 SaaS 市场")
+        self.assertEqual(fts_match_query("payment AND rails"), "payment AND rails")
+        self.assertEqual(fts_match_query("备付金 OR 收单"), 'cjk : "备付 付金" OR cjk : "收单"')
+        self.assertEqual(fts_match_query("支付SaaS 金"), '(cjk : "支付" AND "SaaS") AND cjk : 金*')
+        self.assertEqual(fts_match_query("AND 市场 OR"), 'cjk : "市场"')
+
+    def test_chinese_queries_hit_the_index(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            rows = search_knowledge("备付金 存管", root=root / "missing", db_path=db)
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0]["type"], "pbc_policy")
+            self.assertIn("[备付金]", rows[0]["snippet"])
+            rows = search_knowledge("支付SaaS 市场", root=root / "missing", db_path=db)
+            self.assertEqual([r["title"] for r in rows], ["中国支付SaaS市场研究"])
+            self.assertEqual(search_knowledge("存管市场", root=root / "missing", db_path=db), [])
+            out = io.StringIO()
+            with redirect_stdout(out):
+                query_index(str(db), "支付机构")
+            self.assertIn("非银行支付机构客户备付金存管办法", out.getvalue())
+
+    def test_parallel_build_matches_serial(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            for i in range(12):
+                (kb / "iresearch_information" / f"报告{i}.md").write_text(f"# 行业报告{i}\n支付市场第{i}期。", encoding="utf-8")
+
+            def dump(db):
+                conn = sqlite3.connect(db)
+                try:
+                    return conn.execute(
+                        """
+                        SELECT d.path, d.title, d.domain, d.content_hash, p.ord, p.heading, p.start_offset, p.cjk
+                        FROM docs d JOIN passages p ON p.doc_id = d.id ORDER BY d.path, p.ord
+                        """
+                    ).fetchall()
+                finally:
+                    conn.close()
+
+            with redirect_stdout(io.StringIO()):
+                serial = build_index(str(kb), str(root / "serial.db"), mode="full", workers=1)
+                with mock.patch("scripts.knowledge_index.PARALLEL_MIN_FILES", 4):
+                    pooled = build_index(str(kb), str(root / "pooled.db"), mode="full", workers=2)
+                again = build_index(str(kb), str(root / "pooled.db"), workers=2)
+            self.assertEqual(dump(root / "serial.db"), dump(root / "pooled.db"))
+            self.assertEqual((serial["added"], pooled["added"], pooled["extracted"]), (14, 14, 14))
+            self.assertEqual((again["skipped"], again["extracted"]), (14, 0))
+            self.assertEqual(set(pooled["timings"]), {"scan", "extract", "write", "commit", "total"})
+
+    def test_manifest_skips_unchanged_directories(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            (kb / "日志").mkdir()
+            (kb / "日志" / "run.md").write_text("# 日志", encoding="utf-8")
+            db = str(root / "index.db")
+            with redirect_stdout(io.StringIO()):
+                first = build_index(str(kb), db)
+                self.assertEqual((first["added"], first["dirs_listed"]), (2, 3))
+                again = build_index(str(kb), db)
+                self.assertEqual((again["dirs_listed"], again["dirs_reused"], again["skipped"]), (0, 3, 2))
+
+                doc = kb / "pbc_weixin" / "备付金管理办法.md"
+                doc.write_text("# 备付金新规\n条款修订。", encoding="utf-8")
+                mtime = doc.stat().st_mtime + 5
+                os.utime(doc, (mtime, mtime))
+                trusted = build_index(str(kb), db, trust_dir_mtime=True)
+                self.assertEqual((trusted["updated"], trusted["dirs_listed"]), (0, 0))
+                edited = build_index(str(kb), db)
+                self.assertEqual((edited["updated"], edited["dirs_listed"]), (1, 0))
+
+                (kb / "iresearch_information" / "新报告.md").write_text("# 新报告\n跨境收单。", encoding="utf-8")
+                (kb / "iresearch_information" / "SaaS报告.md").unlink()
+                changed = build_index(str(kb), db, trust_dir_mtime=True)
+            self.assertEqual((changed["added"], changed["deleted"], changed["dirs_listed"]), (1, 1, 1))
+            self.assertEqual(len(search_knowledge("跨境收单", root=root / "missing", db_path=Path(db))), 1)
+
+    def test_apply_changes_and_watcher_events(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = str(root / "index.db")
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), db)
+            watcher = DirWatcher.create(str(kb))
+            new_doc = kb / "pbc_weixin" / "清算通知.md"
+            new_doc.write_text("# 清算通知\n网联清算安排。", encoding="utf-8")
+            old_doc = str(kb / "iresearch_information" / "SaaS报告.md")
+            os.remove(old_doc)
+            self.assertEqual(apply_changes(db, [str(new_doc)], [old_doc]), {"updated": 1, "deleted": 1})
+            self.assertEqual([r["title"] for r in search_knowledge("网联清算", root=root / "missing", db_path=Path(db))], ["清算通知"])
+            self.assertEqual(search_knowledge("支付SaaS", root=root / "missing", db_path=Path(db)), [])
+            if watcher is None:
+                return
+            try:
+                events = watcher.read(1.0)
+            finally:
+                watcher.close()
+            paths = {p for p, _mask in events}
+            self.assertIn(str(new_doc), paths)
+            self.assertIn(old_doc, paths)
+
+    def test_fts_stays_in_sync_through_rowid_triggers(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = str(root / "index.db")
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), db)
+                (kb / "pbc_weixin" / "备付金管理办法.md").write_text("# 清算新规\n网联清算。", encoding="utf-8")
+                apply_changes(db, [str(kb / "pbc_weixin" / "备付金管理办法.md")])
+                (kb / "iresearch_information" / "SaaS报告.md").unlink()
+                build_index(str(kb), db)
+            conn = connect(db)
+            try:
+                conn.execute("INSERT INTO passages_fts(passages_fts, rank) VALUES('integrity-check', 1)")
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0], 1)
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0], 1)
+                plan = " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN DELETE FROM docs WHERE path = ?", ("x",)))
+                self.assertIn("INDEX", plan)
+            finally:
+                conn.close()
+            self.assertEqual(search_knowledge("备付金", root=root / "missing", db_path=Path(db)), [])
+            self.assertEqual(len(search_knowledge("网联清算", root=root / "missing", db_path=Path(db))), 1)
+
+    def test_legacy_schema_is_rebuilt(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = root / "index.db"
+            conn = sqlite3.connect(db)
+            conn.execute("CREATE TABLE docs (path TEXT PRIMARY KEY, title TEXT, updated_date TEXT, source_url TEXT, confidence REAL)")
+            conn.execute("CREATE VIRTUAL TABLE docs_fts USING fts5(path, title, content, tokenize='unicode61')")
+            conn.execute("INSERT INTO docs VALUES('old.md', '旧文档', '2025-01-01', '', 50)")
+            conn.execute("INSERT INTO docs_fts VALUES('old.md', '旧文档', '备付金')")
+            conn.commit()
+            conn.close()
+            self.assertEqual(search_knowledge("备付金", root=root / "missing", db_path=db), [])
+            with redirect_stdout(io.StringIO()):
+                res = build_index(str(kb), str(db))
+            self.assertEqual((res["added"], res["total"]), (2, 2))
+            self.assertEqual(len(search_knowledge("备付金", root=root / "missing", db_path=db)), 1)
+
+    def test_chunk_passages_follow_headings(self):
+        text = "# 存管办法\n更新日期：2026-01-05\n\n## 第一章 总则\n第一条 规范。\n\n## 第二章 存管\n### 细则\n" + "备付金应当集中存管。" * 30
+        passages = chunk_passages(text, "存管办法", max_chars=120)
+        self.assertEqual([p["heading"] for p in passages[:2]], ["存管办法", "存管办法 > 第一章 总则"])
+        self.assertEqual({p["heading"] for p in passages[2:]}, {"存管办法 > 第二章 存管 > 细则"})
+        self.assertEqual(len(passages), 5)
+        for p in passages:
+            self.assertEqual(text[p["start"] : p["end"]], p["text"])
+            self.assertLessEqual(len(p["text"]), 120)
+            self.assertTrue(p["text"].endswith("。") or p["text"].startswith("更新"))
+        self.assertEqual((passages[1]["line"], passages[2]["line"]), (5, 9))
+        self.assertEqual(chunk_passages("# 日志", "日志"), [{"ord": 0, "heading": "日志", "start": 0, "end": 4, "line": 1, "text": "# 日志"}])
+
+    def test_long_documents_rank_by_passage(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            filler = "\n\n".join(f"## 第{i}条\n" + "支付机构应当建立健全内部控制制度。" * 20 for i in range(30))
+            (kb / "pbc_weixin" / "长规章.md").write_text(
+                f"# 支付机构监督管理条例\n{filler}\n\n## 第九十条 跨境收单\n跨境收单业务应当遵守外汇管理规定。", encoding="utf-8"
+            )
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            rows = search_knowledge("跨境收单 外汇", root=root / "missing", db_path=db)
+            self.assertEqual([r["title"] for r in rows], ["支付机构监督管理条例"])
+            hit = rows[0]["passages"][0]
+            self.assertEqual(hit["heading"], "支付机构监督管理条例 > 第九十条 跨境收单")
+            text = (kb / "pbc_weixin" / "长规章.md").read_text(encoding="utf-8")
+            self.assertEqual(text[hit["start"] : hit["end"]], "跨境收单业务应当遵守外汇管理规定。")
+            self.assertEqual(text.splitlines()[hit["line"] - 1], "跨境收单业务应当遵守外汇管理规定。")
+            self.assertIn("[跨境收单]", hit["snippet"])
+            rows = search_knowledge("支付机构 OR 备付金", root=root / "missing", db_path=db, limit=5)
+            self.assertEqual(len({r["path"] for r in rows}), len(rows))
+            self.assertLessEqual(max(len(r["passages"]) for r in rows), 3)
+
+    def test_search_cache_follows_index_generation(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            conn = connect(str(db))
+            try:
+                self.assertEqual(index_generation(conn), 1)
+            finally:
+                conn.close()
+            cache = shared_result_cache()
+            before = cache.namespace_stats(KNOWLEDGE_CACHE_NS)
+            first = search_knowledge("备付金 存管", root=root / "missing", db_path=db)
+            first[0]["id"] = "S9"
+            again = search_knowledge("  备付金   存管 ", root=root / "missing", db_path=db)
+            after = cache.namespace_stats(KNOWLEDGE_CACHE_NS)
+            self.assertEqual((after["misses"] - before["misses"], after["hits"] - before["hits"]), (1, 1))
+            self.assertEqual(again[0]["id"], "K1")
+
+            doc = kb / "pbc_weixin" / "备付金管理办法.md"
+            doc.write_text("# 备付金存管新规\n客户备付金存管调整。", encoding="utf-8")
+            apply_changes(str(db), [str(doc)])
+            rows = search_knowledge("备付金 存管", root=root / "missing", db_path=db)
+            self.assertEqual(rows[0]["title"], "备付金存管新规")
+            doc.unlink()
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            self.assertEqual(search_knowledge("备付金 存管", root=root / "missing", db_path=db), [])
+
+    def test_rrf_final_rank(self):
+        both = final_rank(0.0, "", 100, bm25_rank=1, dense_rank=1)
+        self.assertAlmostEqual(both, 0.6 + 0.25 * 0.4 + 0.15)
+        self.assertGreater(final_rank(0.0, "", 50, bm25_rank=1, dense_rank=3), final_rank(0.0, "", 50, bm25_rank=2))
+        self.assertAlmostEqual(final_rank(-3.0, "", 50), 0.6 / 4 + 0.1 + 0.075)
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_dense_tier_fuses_with_bm25(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            (kb / "iresearch_information" / "收单报告.md").write_text(
+                "# 收单行业观察\n收单机构 厂商竞争格局。", encoding="utf-8"
+            )
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            self.assertEqual(dense_search(db, "备付金"), [])
+            res = build_vectors(db)
+            self.assertEqual((res["rows"], res["dim"]), (3, 256))
+            hits = dense_search(db, "客户备付金集中存管")
+            conn = sqlite3.connect(db)
+            try:
+                top = conn.execute("SELECT title FROM docs WHERE id = ?", (hits[0][0],)).fetchone()[0]
+            finally:
+                conn.close()
+            self.assertEqual(top, "非银行支付机构客户备付金存管办法")
+            rows = search_knowledge("收单 竞争格局", root=root / "missing", db_path=db)
+            self.assertEqual(rows[0]["title"], "收单行业观察")
+            self.assertEqual([r["id"] for r in rows], [f"K{i}" for i in range(1, len(rows) + 1)])
+            self.assertFalse(any(k.startswith("_") for r in rows for k in r))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_stale_vectors_ignored_after_text_rebuild(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            first = root / "first"
+            first.mkdir()
+            (first / "orchard.md").write_text("# Apple orchard\napple orchard harvest season notes.", encoding="utf-8")
+            second = root / "second"
+            second.mkdir()
+            (second / "cars.md").write_text("# 汽车\n新能源汽车 销量 数据。", encoding="utf-8")
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(first), str(db))
+            build_vectors(db)
+            self.assertTrue(dense_search(db, "apple orchard"))
+            with redirect_stdout(io.StringIO()):
+                build_index(str(second), str(db), mode="full")
+            # passage ids restart at 1, so the old row would now point at the 汽车 passage
+            self.assertEqual(dense_search(db, "apple orchard"), [])
+            self.assertEqual(search_knowledge("apple orchard", root=root / "missing", db_path=db), [])
+            build_vectors(db)
+            self.assertEqual(dense_search(db, "apple orchard"), [])
+            self.assertTrue(dense_search(db, "新能源汽车"))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_vector_ids_out_of_step_with_matrix_are_rejected(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            root = Path(td)
+            kb = _write_kb(root)
+            db = root / "index.db"
+            with redirect_stdout(io.StringIO()):
+                build_index(str(kb), str(db))
+            build_vectors(db)
+            self.assertIsNotNone(load_index(db))
+            # a reader between the two os.replace calls of a rebuild sees new ids beside the old matrix
+            ids = np.load(ids_path(db))
+            np.save(ids_path(db), np.append(ids, ids[-1] + 1))
+            self.assertIsNone(load_index(db))
+            self.assertEqual(dense_search(db, "客户备付金集中存管"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
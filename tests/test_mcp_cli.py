@@ -1,15 +1,20 @@
 #!/usr/bin/env python3
 import json
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 
 from scripts.mcp_cli import (
     CircuitBreakerStore,
+    MCPError,
     cmd_pipeline,
     cmd_replay,
     cmd_route_smart,
     cmd_run,
+    plan_pipeline_dag,
+    resolve_step_refs,
 )
 from scripts.mcp_connector import Registry, Router
 
@@ -25,6 +30,25 @@ class _FakeRuntime:
         return {"server": server, "tool": tool, "ok": True}
 
 
+class _SlowRuntime:
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.params = []
+
+    def call(self, server, tool, params, route_meta=None):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.params.append(dict(params))
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return {"server": server, "tool": tool, "echo": params.get("problem", "")}
+
+
 class MCPCliTest(unittest.TestCase):
     def test_circuit_breaker_open_after_threshold(self):
         with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
@@ -34,6 +58,35 @@ class MCPCliTest(unittest.TestCase):
             self.assertFalse(store.is_open(key, cooldown_sec=999))
             store.record_failure(key, "e2", threshold=2)
             self.assertTrue(store.is_open(key, cooldown_sec=999))
+            self.assertFalse(store.is_open(key, cooldown_sec=0))
+            self.assertEqual(store.state[key]["state"], "half_open")
+
+    def test_circuit_breaker_concurrent_writers_keep_all_failures(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            path = Path(td) / "breaker.db"
+
+            def _worker():
+                store = CircuitBreakerStore(path)
+                for i in range(25):
+                    store.record_failure("fetch/get", f"e{i}", threshold=1000)
+
+            threads = [threading.Thread(target=_worker) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(CircuitBreakerStore(path).state["fetch/get"]["failures"], 100)
+
+    def test_circuit_breaker_imports_legacy_json(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            legacy = Path(td) / "breaker.json"
+            legacy.write_text(
+                json.dumps({"fetch/get": {"state": "open", "failures": 3, "opened_at": int(time.time())}}),
+                encoding="utf-8",
+            )
+            store = CircuitBreakerStore(legacy)
+            self.assertEqual(store.path.suffix, ".db")
+            self.assertTrue(store.is_open("fetch/get", cooldown_sec=999))
 
     def test_route_smart_returns_candidates(self):
         with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
@@ -52,16 +105,21 @@ class MCPCliTest(unittest.TestCase):
         self.assertIn("delivery_protocol", out)
 
     def test_run_dry_run(self):
-        out = cmd_run(
-            text="请帮我获取网页内容",
-            override_params={},
-            top_k=2,
-            max_attempts=1,
-            cooldown_sec=60,
-            failure_threshold=2,
-            dry_run=True,
-            metrics_days=3,
-        )
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            out = cmd_run(
+                text="请帮我获取网页内容",
+                override_params={},
+                top_k=2,
+                max_attempts=1,
+                cooldown_sec=60,
+                failure_threshold=2,
+                dry_run=True,
+                metrics_days=3,
+                runs_dir=Path(td) / "runs",
+                breaker_path=Path(td) / "breaker.json",
+            )
+            # a dry run only reads breaker state, so the db is never created
+            self.assertFalse((Path(td) / "breaker.db").exists())
         self.assertTrue(out["ok"])
         self.assertEqual(out["mode"], "dry-run")
         self.assertIn("selected", out)
@@ -146,12 +204,119 @@ class MCPCliTest(unittest.TestCase):
                 metrics_days=1,
                 continue_on_error=True,
                 pipelines_dir=Path(td) / "pipelines",
+                runs_dir=Path(td) / "runs",
+                breaker_path=Path(td) / "breaker.json",
             )
             self.assertTrue(out["ok"])
             self.assertEqual(out["mode"], "pipeline")
             self.assertEqual(len(out["steps"]), 2)
             self.assertTrue(Path(out["report_file"]).exists())
 
+    def test_plan_pipeline_dag(self):
+        nodes = plan_pipeline_dag(
+            [
+                {"id": "a", "text": "x", "depends_on": []},
+                {"id": "b", "text": "y", "params": {"problem": "${steps.a.result.echo}"}},
+            ]
+        )
+        self.assertEqual(nodes[1]["depends_on"], ["a"])
+        legacy = plan_pipeline_dag([{"id": "a", "text": "x"}, {"id": "b", "text": "y"}])
+        self.assertEqual(legacy[1]["after"], ["a"])
+        with self.assertRaises(MCPError):
+            plan_pipeline_dag([{"id": "a", "text": "x", "depends_on": ["b"]}, {"id": "b", "text": "y", "depends_on": ["a"]}])
+
+    def test_resolve_step_refs(self):
+        results = {"a": {"result": {"items": [{"url": "u1"}], "n": 2}}}
+        self.assertEqual(resolve_step_refs("${steps.a.result.n}", results), 2)
+        self.assertEqual(resolve_step_refs("see ${steps.a.result.items.0.url}", results), "see u1")
+        self.assertEqual(resolve_step_refs("${steps.b.result}", results, strict=False), "${steps.b.result}")
+
+    def test_pipeline_dag_runs_independent_steps_concurrently(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            pipeline_file = Path(td) / "pipeline.json"
+            pipeline_file.write_text(
+                json.dumps(
+                    {
+                        "name": "dag",
+                        "defaults": {"top_k": 1, "max_attempts": 1, "server_limits": {"sequential-thinking": 3}},
+                        "steps": [
+                            {"id": "a", "text": "请拆解这个任务", "params": {"problem": "A"}, "depends_on": []},
+                            {"id": "b", "text": "请拆解这个任务", "params": {"problem": "B"}, "depends_on": []},
+                            {"id": "c", "text": "请拆解这个任务", "params": {"problem": "C"}, "depends_on": []},
+                            {
+                                "id": "d",
+                                "text": "请拆解这个任务",
+                                "params": {"problem": "${steps.a.result.echo}+${steps.b.result.echo}"},
+                                "depends_on": ["c"],
+                            },
+                        ],
+                    },
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+            rt = _SlowRuntime(delay=0.2)
+            out = cmd_pipeline(
+                file=pipeline_file,
+                dry_run=False,
+                top_k=1,
+                max_attempts=1,
+                cooldown_sec=60,
+                failure_threshold=3,
+                metrics_days=1,
+                continue_on_error=False,
+                pipelines_dir=Path(td) / "pipelines",
+                max_parallel=3,
+                runs_dir=Path(td) / "runs",
+                breaker_path=Path(td) / "breaker.json",
+                runtime=rt,
+            )
+            self.assertTrue(out["ok"])
+            self.assertEqual([s["id"] for s in out["steps"]], ["a", "b", "c", "d"])
+            self.assertEqual(rt.peak, 3)
+            self.assertIn({"problem": "A+B"}, rt.params)
+            self.assertLess(out["duration_ms"], 4 * 200)
+
+
+    def test_pipeline_step_exception_fails_only_that_branch(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            pipeline_file = Path(td) / "pipeline.json"
+            pipeline_file.write_text(
+                json.dumps(
+                    {
+                        "name": "broken",
+                        "defaults": {"top_k": 1, "max_attempts": 1},
+                        "steps": [
+                            {"id": "a", "text": "请拆解这个任务", "max_attempts": "two", "depends_on": []},
+                            {"id": "b", "text": "请拆解这个任务", "params": {"problem": "${steps.a.result.echo}"}},
+                            {"id": "c", "text": "请拆解这个任务", "params": {"problem": "C"}, "depends_on": []},
+                        ],
+                    },
+                    ensure_ascii=False,
+                ),
+                encoding="utf-8",
+            )
+            out = cmd_pipeline(
+                file=pipeline_file,
+                dry_run=False,
+                top_k=1,
+                max_attempts=1,
+                cooldown_sec=60,
+                failure_threshold=3,
+                metrics_days=1,
+                continue_on_error=True,
+                pipelines_dir=Path(td) / "pipelines",
+                runs_dir=Path(td) / "runs",
+                breaker_path=Path(td) / "breaker.json",
+                runtime=_SlowRuntime(delay=0.01),
+            )
+            steps = {s["id"]: s for s in out["steps"]}
+            self.assertFalse(out["ok"])
+            self.assertTrue(Path(out["report_file"]).exists())
+            self.assertEqual(steps["a"]["status"], "error")
+            self.assertIn("ValueError", steps["a"]["error"])
+            self.assertEqual((steps["b"]["status"], steps["b"]["error"]), ("skipped", "dependency_failed"))
+            self.assertTrue(steps["c"]["ok"])
 
 if __name__ == "__main__":
     unittest.main()
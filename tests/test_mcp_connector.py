@@ -1,16 +1,27 @@
 #!/usr/bin/env python3
 import json
+import os
 import tempfile
+import time
 import unittest
 from pathlib import Path
 
-from scripts.mcp_connector import MCPError, PolicyEngine, Registry, Router, Runtime
+from scripts.mcp_connector import MCPError, MCPStdioClient, PolicyEngine, Registry, Router, Runtime, ServerConfig
 
 
 class MCPConnectorTest(unittest.TestCase):
     def setUp(self):
+        td = tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem")
+        self.addCleanup(td.cleanup)
         self.registry = Registry()
-        self.registry.data.setdefault("settings", {})["protocolPreferred"] = False
+        settings = self.registry.data.setdefault("settings", {})
+        settings["protocolPreferred"] = False
+        settings["logging"] = dict(
+            settings.get("logging", {}),
+            filePath=str(Path(td.name) / "calls.log"),
+            metricsDbPath=str(Path(td.name) / "metrics.db"),
+            resultsDir=str(Path(td.name) / "results"),
+        )
         self.runtime = Runtime(self.registry)
         self.router = Router()
         self.policy = PolicyEngine(self.registry)
@@ -53,6 +64,108 @@ class MCPConnectorTest(unittest.TestCase):
         payload = json.loads(lines[-1])
         self.assertIn("trace_id", payload)
 
+    def _runtime_with_metrics(self, td: str, settings: dict) -> Runtime:
+        registry = Registry()
+        cfg = registry.data.setdefault("settings", {})
+        cfg["protocolPreferred"] = True
+        cfg.setdefault("logging", {})
+        cfg["logging"] = dict(cfg["logging"], metricsDbPath=str(Path(td) / "metrics.db"), filePath=str(Path(td) / "calls.log"))
+        cfg.update(settings)
+        return Runtime(registry)
+
+    def test_adaptive_protocol_timeout_from_p95(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            runtime = self._runtime_with_metrics(td, {"adaptiveTimeout": {"enabled": True, "multiplier": 2.0, "minSamples": 5}})
+            self.assertEqual(runtime.protocol_timeout_for("fetch", "get"), runtime.registry.protocol_timeout_ms())
+            base = {"ts": "2026-02-26 10:00:00", "server": "fetch", "tool": "get"}
+            rows = [dict(base, status="ok", mode="protocol:stdio", duration_ms=150) for _ in range(10)]
+            # protocol timeouts that fell back to local, and failures, must not stretch the timeout
+            rows += [dict(base, status="ok", mode="local", duration_ms=9000) for _ in range(10)]
+            rows += [dict(base, status="error", mode="local", duration_ms=9000) for _ in range(10)]
+            runtime.audit.metrics_store().record_many(rows)
+            runtime._latency_cache.clear()
+            self.assertEqual(runtime.protocol_timeout_for("fetch", "get"), 300)
+            self.assertEqual(runtime.audit.metrics_store().server_tool_metrics()["fetch/get"]["total"], 30)
+
+    def test_hedged_call_prefers_fast_local_path(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            runtime = self._runtime_with_metrics(td, {"hedging": {"enabled": True, "fallbackDelayMs": 50}})
+
+            def _slow_protocol(srv, tool, params, timeout_ms=None):
+                time.sleep(0.5)
+                return {"from": "protocol"}
+
+            runtime._protocol_call = _slow_protocol
+            t0 = time.time()
+            out = runtime.call("sequential-thinking", "think", {"problem": "如何分步做这件事?"})
+            self.assertLess(time.time() - t0, 0.4)
+            self.assertIn("steps", out)
+            payload = json.loads(Path(td, "calls.log").read_text(encoding="utf-8").strip().splitlines()[-1])
+            self.assertEqual(payload["mode"], "local")
+            self.assertTrue(payload["hedge"]["fired"])
+            self.assertEqual(payload["hedge"]["winner"], "local")
+            self.assertNotIn("protocol_ms", payload)
+            # the losing protocol call still finishes and is kept as a latency sample
+            time.sleep(0.6)
+            prof = runtime.audit.metrics_store().latency_profile("sequential-thinking", "think")
+            self.assertEqual(prof["total"], 1)
+            self.assertGreaterEqual(prof["p95_ms"], 500)
+
+    def test_large_result_spooled_out_of_audit_line(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            runtime = self._runtime_with_metrics(td, {"protocolPreferred": False})
+            runtime.audit.max_preview_bytes = 256
+            runtime.audit.results_dir = Path(td) / "results"
+            out = runtime.call("sequential-thinking", "think", {"problem": "拆解" * 2000})
+            self.assertIn("steps", out)
+            payload = json.loads(Path(td, "calls.log").read_text(encoding="utf-8").strip().splitlines()[-1])
+            ref = payload["result_ref"]
+            self.assertIsInstance(payload["result_preview"], str)
+            self.assertLessEqual(len(payload["result_preview"].encode("utf-8")), 256 + 3)
+            body = Path(ref["path"]).read_bytes()
+            self.assertEqual(len(body), ref["bytes"])
+            self.assertEqual(json.loads(body), out)
+
+    def test_spooled_results_are_pruned_by_age_and_bytes(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            runtime = self._runtime_with_metrics(td, {"protocolPreferred": False})
+            audit = runtime.audit
+            audit.results_dir = Path(td) / "results"
+            audit.results_dir.mkdir()
+            now = time.time()
+            for name, age_days in (("expired.json", 30), ("stale.part", 30), ("old.json", 3), ("mid.json", 2), ("new.json", 1)):
+                p = audit.results_dir / name
+                p.write_bytes(b"x" * 100)
+                os.utime(p, (now - age_days * 86400, now - age_days * 86400))
+            audit.results_max_age_s = 7 * 86400
+            audit.results_max_bytes = 200
+            report = audit.prune_results(now=now)
+            self.assertEqual(sorted(p.name for p in audit.results_dir.iterdir()), ["mid.json", "new.json"])
+            self.assertEqual(report, {"removed": 3, "freed_bytes": 300, "kept_bytes": 200})
+
+            # spooling a new result applies the budget without an explicit prune call
+            audit.max_preview_bytes = 64
+            audit.results_prune_interval_s = 0
+            audit.results_max_bytes = 1350
+            _, ref = audit.spool_result({"text": "结果" * 200})
+            names = sorted(p.name for p in audit.results_dir.iterdir())
+            self.assertEqual(names, sorted([Path(ref["path"]).name, "new.json"]))
+
+    def test_stdio_parser_handles_split_frames(self):
+        client = MCPStdioClient(ServerConfig("x", "true", [], "", True, [], {}), 1000)
+        body = json.dumps({"id": 1, "result": {"text": "内容" * 500}}, ensure_ascii=False).encode("utf-8")
+        frame = f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body + b'{"id": 2}\n'
+        msgs = []
+        for i in range(0, len(frame), 97):
+            client._buf.extend(frame[i: i + 97])
+            msg = client._try_parse_message()
+            while msg is not None:
+                msgs.append(msg)
+                msg = client._try_parse_message()
+        self.assertEqual([m["id"] for m in msgs], [1, 2])
+        self.assertEqual(msgs[0]["result"]["text"], "内容" * 500)
+        self.assertEqual(len(client._buf), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
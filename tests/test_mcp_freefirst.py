@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
+import email.message
+import io
+import tempfile
+import threading
+import time
 import unittest
+import urllib.response
+from pathlib import Path
+from unittest import mock
 
-from scripts.mcp_freefirst_hub import detect_topic, select_sources
+from scripts import mcp_freefirst_hub
+from scripts.http_cache import HttpCache
+from scripts.mcp_freefirst_hub import detect_topic, run_sync, select_sources
 from scripts.mcp_freefirst_report import calc_metrics
 
 
@@ -24,6 +34,96 @@ class MCPFreeFirstTest(unittest.TestCase):
         self.assertEqual(len(out), 1)
         self.assertEqual(out[0]["id"], "a")
 
+    def test_run_sync_parallel_with_host_limit_and_budget(self):
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+
+        def fake_fetch(url, timeout, **kwargs):
+            host = url.split("/")[2]
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            try:
+                time.sleep(1.5 if "slow" in host else 0.1)
+                return {"http_status": 200, "title": host, "cache": "miss"}
+            finally:
+                with lock:
+                    active[host] -= 1
+
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            names = ["a1", "a2", "a3", "b1", "slow"]
+            cfg = {
+                "defaults": {"output_dir": td, "per_host_limit": 2, "sync_budget_sec": 0.5},
+                "topics": {"general": {"sources": names}},
+                "sources": {
+                    "a1": {"url": "https://a.example/1"},
+                    "a2": {"url": "https://a.example/2"},
+                    "a3": {"url": "https://a.example/3"},
+                    "b1": {"url": "https://b.example/"},
+                    "slow": {"url": "https://slow.example/"},
+                },
+            }
+            started = time.monotonic()
+            with mock.patch.object(mcp_freefirst_hub, "fetch_one", side_effect=fake_fetch):
+                out = run_sync(cfg, "q", "general", 5)
+            self.assertLess(time.monotonic() - started, 1.2)
+        self.assertEqual((out["attempted"], out["succeeded"], out["timed_out"]), (5, 4, 1))
+        self.assertEqual(out["coverage_rate"], 80.0)
+        self.assertEqual(out["error_class_counts"], {"timeout": 1})
+        self.assertEqual(peak["a.example"], 2)
+
+    def test_run_sync_idle_hosts_not_starved_by_busy_host(self):
+        lock = threading.Lock()
+        started = {}
+
+        def fake_fetch(url, timeout, **kwargs):
+            with lock:
+                started[url] = time.monotonic()
+            time.sleep(1.0)
+            return {"http_status": 200, "title": url, "cache": "miss"}
+
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            urls = {f"a{i}": f"https://a.example/{i}" for i in range(6)}
+            urls.update({"b1": "https://b.example/", "c1": "https://c.example/"})
+            cfg = {
+                "defaults": {"output_dir": td, "max_workers": 6, "per_host_limit": 2, "sync_budget_sec": 1.5},
+                "topics": {"general": {"sources": list(urls)}},
+                "sources": {name: {"url": url} for name, url in urls.items()},
+            }
+            t0 = time.monotonic()
+            with mock.patch.object(mcp_freefirst_hub, "fetch_one", side_effect=fake_fetch):
+                out = run_sync(cfg, "q", "general", len(urls))
+        # a.example is capped at 2, so b and c start right away instead of queueing behind it
+        self.assertLess(started["https://b.example/"] - t0, 0.3)
+        self.assertLess(started["https://c.example/"] - t0, 0.3)
+        self.assertEqual(sum(1 for url, at in started.items() if "a.example" in url and at - t0 < 0.3), 2)
+        self.assertEqual((out["attempted"], out["succeeded"], out["timed_out"]), (8, 4, 4))
+
+    def test_run_sync_reports_failed_fetch_even_with_cached_copy(self):
+        def page(req, timeout, **kwargs):
+            return urllib.response.addinfourl(io.BytesIO(b"<title>ok</title>"), email.message.Message(), req.full_url, 200), "verified"
+
+        def down(req, timeout, **kwargs):
+            raise OSError("connection refused")
+
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            cfg = {
+                "defaults": {"output_dir": td, "cache_max_age_sec": 0},
+                "topics": {"general": {"sources": ["a"]}},
+                "sources": {"a": {"url": "https://a.example/"}},
+            }
+            cache = HttpCache(Path(td) / "http_cache")
+            with mock.patch.object(mcp_freefirst_hub, "shared_http_cache", return_value=cache):
+                with mock.patch.object(mcp_freefirst_hub, "_open_with_ssl_strategy", side_effect=page):
+                    self.assertEqual(run_sync(cfg, "q", "general", 1)["succeeded"], 1)
+                with mock.patch.object(mcp_freefirst_hub, "_open_with_ssl_strategy", side_effect=down):
+                    online = run_sync(cfg, "q", "general", 1)
+                    offline = run_sync(cfg, "q", "general", 1, offline=True)
+        self.assertEqual((online["succeeded"], online["coverage_rate"]), (0, 0.0))
+        self.assertEqual(online["error_class_counts"], {"conn_refused": 1})
+        self.assertEqual((offline["succeeded"], offline["cache_counts"]), (1, {"stale": 1}))
+
     def test_calc_metrics(self):
         rows = [
             {"status": "ok", "ts": "2026-02-26 09:00:00", "url": "u", "title": "t"},
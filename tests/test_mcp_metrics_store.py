@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from scripts import mcp_cli
+from scripts.mcp_metrics_store import CallMetricsStore, histogram_percentile
+from scripts.mcp_observability import aggregate, load_records
+
+
+ROWS = [
+    {"ts": "2026-02-24 09:00:00", "status": "ok", "server": "fetch", "tool": "get", "duration_ms": 900},
+    {"ts": "2026-02-25 10:00:00", "status": "ok", "server": "filesystem", "tool": "read_file", "duration_ms": 40},
+    {"ts": "2026-02-25 10:01:00", "status": "error", "server": "filesystem", "tool": "read_file", "duration_ms": 300},
+    {"ts": "2026-02-26 10:01:00", "status": "ok", "server": "fetch", "tool": "get", "duration_ms": 200},
+]
+
+
+class MCPMetricsStoreTest(unittest.TestCase):
+    def test_counters_match_log_aggregate(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            store = CallMetricsStore(Path(td) / "metrics.db")
+            store.record_many(ROWS)
+            got = store.server_tool_metrics(days=2)
+            log = Path(td) / "calls.log"
+            log.write_text("\n".join(json.dumps(r) for r in ROWS) + "\n", encoding="utf-8")
+            expected = {f"{r['server']}/{r['tool']}": r for r in aggregate(load_records(log), days=2)["server_tool"]}
+            self.assertEqual(set(got), set(expected))
+            for key, row in expected.items():
+                self.assertEqual(got[key]["total"], row["total"])
+                self.assertEqual(got[key]["failed"], row["failed"])
+                self.assertEqual(got[key]["success_rate"], row["success_rate"])
+                self.assertEqual(got[key]["avg_ms"], row["avg_ms"])
+            self.assertEqual(got["filesystem/read_file"]["p95_ms"], 300)
+
+    def test_seed_from_log_runs_once(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            log = Path(td) / "calls.log"
+            log.write_text("\n".join(json.dumps(r) for r in ROWS) + "\n", encoding="utf-8")
+            store = CallMetricsStore(Path(td) / "metrics.db")
+            self.assertEqual(store.seed_from_log(log), 4)
+            self.assertEqual(CallMetricsStore(Path(td) / "metrics.db").seed_from_log(log), 0)
+            store.record({"ts": "2026-02-26 11:00:00", "status": "ok", "server": "fetch", "tool": "get", "duration_ms": 100})
+            self.assertEqual(store.server_tool_metrics(days=14)["fetch/get"]["total"], 3)
+
+    def test_reads_do_not_create_db(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            db = Path(td) / "nested" / "metrics.db"
+            store = CallMetricsStore(db)
+            self.assertEqual(store.server_tool_metrics(), {})
+            self.assertEqual(store.latency_profile("fetch", "get")["total"], 0)
+            self.assertFalse(store.is_seeded())
+            log = Path(td) / "calls.log"
+            log.write_text(json.dumps(ROWS[0]) + "\n", encoding="utf-8")
+            with mock.patch.object(mcp_cli, "load_log_path", return_value=log):
+                # no db yet: the audit log is aggregated read-only
+                self.assertEqual(mcp_cli.load_call_metrics(metrics_db=db)["fetch/get"]["total"], 1)
+            self.assertFalse(db.parent.exists())
+            store.record(ROWS[0])
+            self.assertEqual(store.server_tool_metrics()["fetch/get"]["total"], 1)
+
+    def test_histogram_percentile(self):
+        self.assertEqual(histogram_percentile([0, 0, 0], 95.0), 0)
+        self.assertEqual(histogram_percentile([10, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0], 95.0, max_ms=30), 30)
+        self.assertEqual(histogram_percentile([0] * 10 + [2], 95.0, max_ms=45000), 45000)
+
+
+if __name__ == "__main__":
+    unittest.main()
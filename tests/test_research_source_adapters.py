@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
+import sqlite3
 import tempfile
+import time
 import unittest
+from collections import OrderedDict
 from pathlib import Path
+from unittest import mock
 
+from scripts import research_source_adapters
 from scripts.research_source_adapters import lookup_sec_filings, lookup_sources, resolve_sec_cik, search_knowledge, search_openalex
 
 
@@ -62,6 +67,40 @@ class ResearchSourceAdaptersTest(unittest.TestCase):
         self.assertEqual(sorted(out["connectors"]), ["openalex", "sec"])
         self.assertEqual(len(out["items"]), 3)
 
+    def test_lookup_sources_returns_partial_results_on_timeout(self):
+        def slow_openalex(url, headers):
+            if "api.openalex.org" in url:
+                time.sleep(1.0)
+            return _fake_fetcher(url, headers)
+
+        started = time.monotonic()
+        out = lookup_sources(
+            "Microsoft strategy",
+            {"source_connectors": ["openalex", "sec", "bogus"], "ticker": "MSFT", "lookup_timeout_s": {"openalex": 0.2}},
+            fetcher=slow_openalex,
+        )
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertTrue(out["partial"])
+        self.assertEqual(out["timed_out"], ["openalex"])
+        self.assertEqual([row["connector"] for row in out["items"]], ["sec", "sec"])
+        self.assertEqual(sorted(e["connector"] for e in out["errors"]), ["bogus", "openalex"])
+        self.assertIn("sec", out["timings_ms"])
+
+    def test_lookup_sources_deadline_bounds_each_request(self):
+        calls = []
+
+        def slow_tickers(url, headers):
+            calls.append(url)
+            if "company_tickers.json" in url:
+                time.sleep(0.3)
+            return _fake_fetcher(url, headers)
+
+        out = lookup_sources("Microsoft", {"source_connectors": "sec", "ticker": "MSFT", "lookup_budget_s": 0.1}, fetcher=slow_tickers)
+        self.assertEqual((out["items"], out["timed_out"]), ([], ["sec"]))
+        time.sleep(0.4)
+        # the abandoned connector does not start its second request past the deadline
+        self.assertEqual(len(calls), 1)
+
     def test_search_knowledge_fallback(self):
         with tempfile.TemporaryDirectory() as td:
             root = Path(td)
@@ -85,5 +124,29 @@ class ResearchSourceAdaptersTest(unittest.TestCase):
             self.assertEqual(rows[0]["title"], "支付SaaS市场研究")
 
 
+    def test_knowledge_connections_are_bounded_and_dropped_with_their_file(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td, mock.patch.object(
+            research_source_adapters, "_KNOWLEDGE_CONNS", OrderedDict()
+        ) as conns:
+            limit = research_source_adapters.KNOWLEDGE_CONN_LIMIT
+            dbs = [Path(td) / f"index{i}.db" for i in range(limit + 2)]
+            opened = []
+            for db in dbs:
+                sqlite3.connect(db).close()
+                with research_source_adapters._knowledge_conn(db) as conn:
+                    opened.append(conn)
+            self.assertEqual(list(conns), [str(db) for db in dbs[-limit:]])
+            with self.assertRaises(sqlite3.ProgrammingError):
+                opened[0].execute("SELECT 1")
+
+            dbs[-1].unlink()
+            with research_source_adapters._knowledge_conn(dbs[-2]):
+                pass
+            self.assertNotIn(str(dbs[-1]), conns)
+            with self.assertRaises(sqlite3.ProgrammingError):
+                opened[-1].execute("SELECT 1")
+            for conn, _ in conns.values():
+                conn.close()
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from scripts.result_cache import ResultCache
+
+
+class ResultCacheTest(unittest.TestCase):
+    def test_byte_bounded_lru_eviction(self):
+        cache = ResultCache(max_bytes=700)
+        for key in ("a", "b", "c"):
+            cache.set(key, "x" * 200)
+        self.assertEqual(cache.get("a"), "x" * 200)
+        cache.set("d", "y" * 200)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        stats = cache.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["bytes"], 700)
+        cache.set("huge", "z" * 5000)
+        self.assertIsNone(cache.get("huge"))
+
+    def test_ttl_expiry_and_counters(self):
+        cache = ResultCache()
+        cache.set("k", {"v": 1}, ttl=0.05)
+        cache.set("never", 1, ttl=0)
+        self.assertEqual(cache.get("k"), {"v": 1})
+        time.sleep(0.08)
+        self.assertIsNone(cache.get("k"))
+        self.assertIsNone(cache.get("never"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expired"]), (1, 2, 1))
+
+    def test_namespaces_isolate_keys_and_counters(self):
+        cache = ResultCache()
+        cache.set("k", "tool-def", namespace="tool")
+        cache.set("k", "result")
+        self.assertEqual(cache.get("k", namespace="tool"), "tool-def")
+        self.assertEqual(cache.get("k"), "result")
+        self.assertIsNone(cache.get("missing", namespace="tool"))
+        tool = cache.namespace_stats("tool")
+        self.assertEqual((tool["hits"], tool["misses"], tool["entries"]), (1, 1, 1))
+        self.assertGreater(tool["bytes_served"], 0)
+        cache.clear("tool")
+        self.assertEqual(cache.keys("tool"), [])
+        self.assertEqual(cache.keys(), ["k"])
+        self.assertEqual(cache.stats()["namespaces"]["tool"]["bytes"], 0)
+
+    def test_disk_persistence_across_instances(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            db = Path(td) / "results.db"
+            ResultCache(disk_path=db).set("tool:x", {"rows": [1, 2]}, ttl=60)
+            ResultCache(disk_path=db).set("tool:old", 1, ttl=0.01)
+            time.sleep(0.03)
+            fresh = ResultCache(disk_path=db)
+            self.assertEqual(fresh.get("tool:x"), {"rows": [1, 2]})
+            self.assertIsNone(fresh.get("tool:old"))
+            self.assertEqual(fresh.stats()["disk_hits"], 1)
+
+    def test_disk_tier_keeps_only_json_values(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            db = Path(td) / "results.db"
+            writer = ResultCache(disk_path=db)
+            writer.set("tuple", (1, 2), ttl=60)
+            writer.set("obj", object(), ttl=60)
+            writer.set("int_keys", {1: "a"}, ttl=60)
+            writer.set("text", {"名称": ["a", 1.5, None, True]}, ttl=60)
+            self.assertEqual(writer.get("tuple"), (1, 2))
+            fresh = ResultCache(disk_path=db)
+            self.assertIsNone(fresh.get("tuple"))
+            self.assertIsNone(fresh.get("obj"))
+            self.assertIsNone(fresh.get("int_keys"))
+            self.assertEqual(fresh.get("text"), {"名称": ["a", 1.5, None, True]})
+            with sqlite3.connect(db) as conn:
+                blob = conn.execute("SELECT v FROM cache_entries WHERE k='text'").fetchone()[0]
+            self.assertEqual(json.loads(bytes(blob).decode("utf-8")), {"名称": ["a", 1.5, None, True]})
+
+    def test_single_flight_threads(self):
+        cache = ResultCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return "v"
+
+        out = []
+        threads = [threading.Thread(target=lambda: out.append(cache.get_or_compute("same", compute))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(out, ["v"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get_or_compute("same", compute), "v")
+        self.assertEqual(len(calls), 1)
+
+    def test_single_flight_async_and_uncacheable(self):
+        cache = ResultCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.02)
+            return "bad"
+
+        async def main():
+            return await asyncio.gather(*[cache.aget_or_compute("k", compute, cacheable=lambda v: v != "bad") for _ in range(4)])
+
+        self.assertEqual(asyncio.run(main()), ["bad"] * 4)
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(cache.get("k"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import re
+import unittest
+
+import yaml
+
+from pathlib import Path
+
+from scripts.skill_parser import (
+    SKILL_DIR,
+    SkillMeta,
+    _FastPathUnsupported,
+    extract_parameters,
+    match_triggers,
+    parse_front_matter_fast,
+    parse_yaml_front_matter,
+)
+
+
+def _skill(name, triggers, parameters=None):
+    data = {"skill": {"name": name, "version": "1.0"}, "triggers": triggers, "parameters": parameters or []}
+    return SkillMeta(data, Path(f"/tmp/{name}.md"))
+
+
+FRONT_MATTER = """skill:
+  name: digest
+  version: 1.0
+  description: 信息摘要 - 多源采集 (v2)
+
+triggers:
+  - 摘要
+  - Excel
+# comment
+parameters:
+  - name: limit
+    type: integer
+    required: true
+    default: 10
+    aliases: [数量, 条数]
+    options:
+      - 4h: 4小时增量
+      - daily: 日度摘要
+calls:
+- serp-api
+allowed-tools: Task, Read, Write
+output: {format: json}
+empty:
+"""
+
+
+class SkillParserTest(unittest.TestCase):
+    def test_fast_path_matches_yaml(self):
+        self.assertEqual(parse_front_matter_fast(FRONT_MATTER), yaml.safe_load(FRONT_MATTER))
+
+    def test_fast_path_matches_yaml_for_skill_library(self):
+        for md_file in SKILL_DIR.glob("*.md"):
+            match = re.match(r"^---\s*\n(.*?)\n---", md_file.read_text(encoding="utf-8"), re.DOTALL)
+            if not match:
+                continue
+            try:
+                fast = parse_front_matter_fast(match.group(1))
+            except _FastPathUnsupported:
+                continue
+            self.assertEqual(fast, yaml.safe_load(match.group(1)), md_file.name)
+
+    def test_unsupported_constructs_fall_back_to_yaml(self):
+        for block in ("date: 2026-02-27", "text: |\n  multi\n  line", "anchor: &a x", "n: 1e5", "h: [a, [b]]"):
+            with self.assertRaises(_FastPathUnsupported):
+                parse_front_matter_fast(block)
+            self.assertEqual(parse_yaml_front_matter(f"---\n{block}\n---\nbody"), yaml.safe_load(block))
+
+    def test_flow_collections_match_yaml_or_fall_back(self):
+        must_fall_back = ("a: [x, y,]", "a: {b:1}", "a: [x,,y]", "a: {b: 1,}", "a: [,]")
+        agree = ("a: [x, y]", "a: []", "a: [ ]", "a: {}", "a: {b: 1, c: d}", "a: [1, 2.5, yes, ~]", "a: [x:y]")
+        for block in must_fall_back + agree:
+            try:
+                expected = yaml.safe_load(block)
+            except yaml.YAMLError:
+                expected = None
+            try:
+                fast = parse_front_matter_fast(block)
+            except _FastPathUnsupported:
+                self.assertIn(block, must_fall_back)
+                continue
+            self.assertNotIn(block, must_fall_back)
+            self.assertIsNotNone(expected, block)
+            self.assertEqual(fast, expected, block)
+
+    def test_match_triggers_exact_ranking(self):
+        skills = [_skill("xlsx", ["Excel", "表格"]), _skill("policy", ["分析政策", "监管动态", "支付行业"])]
+        out = match_triggers("分析政策并看监管动态，导出excel", skills)
+        self.assertEqual([r["skill"] for r in out], ["policy", "xlsx"])
+        self.assertEqual(out[0]["score"], 20)
+        self.assertEqual(out[0]["matched_triggers"], ["分析政策", "监管动态"])
+        self.assertEqual(out[1]["matched_triggers"], ["Excel"])
+        self.assertNotIn("fuzzy_triggers", out[0])
+
+    def test_match_triggers_fuzzy_tolerates_phrasing(self):
+        skills = [_skill("policy", ["分析政策", "监管动态"]), _skill("xlsx", ["表格"]), _skill("research", ["market analysis"])]
+        self.assertEqual(match_triggers("帮我分析下政策", skills), [])
+        out = match_triggers("帮我分析下政策，顺便做个表格", skills, fuzzy=True)
+        self.assertEqual([r["skill"] for r in out], ["xlsx", "policy"])
+        self.assertEqual(out[1]["matched_triggers"], [])
+        self.assertEqual(out[1]["fuzzy_triggers"], [{"trigger": "分析政策", "similarity": 0.75}])
+        self.assertLess(out[1]["score"], 10)
+        typo = match_triggers("please run a markte anlaysis", skills, fuzzy=True)
+        self.assertEqual(typo[0]["skill"], "research")
+        self.assertGreaterEqual(typo[0]["fuzzy_triggers"][0]["similarity"], 0.6)
+
+    def test_match_triggers_fuzzy_needs_contiguous_phrase(self):
+        skills = [_skill("policy", ["分析政策"]), _skill("research", ["market analysis"])]
+        # every bigram of the trigger is present, but scattered across the text or out of order
+        self.assertEqual(match_triggers("我们先分析一下数据，然后再讨论相关的政策问题", skills, fuzzy=True), [])
+        self.assertEqual(match_triggers("analysis of the stock market", skills, fuzzy=True), [])
+
+    def test_extract_parameters_by_alias(self):
+        skill = _skill("policy", ["分析政策"], [{"name": "region", "aliases": ["地区", "城市"]}, {"name": "topic", "aliases": ["主题"]}])
+        self.assertEqual(extract_parameters("主题: 跨境支付 城市 北京", skill), {"topic": "跨境支付", "region": "北京"})
+
+
+if __name__ == "__main__":
+    unittest.main()
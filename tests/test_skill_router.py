@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
+import json
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import patch
 
+from scripts.skill_parser import SkillMeta
 from scripts.skill_router import parse_route_doc, route_text
 from scripts import skill_router
 
 
 class SkillRouterTest(unittest.TestCase):
+    def setUp(self):
+        # keep route table artifacts written by load_route_table() out of the repo's 日志/
+        td = tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem")
+        self.addCleanup(td.cleanup)
+        self.cache_dir = Path(td.name) / "route_tables"
+        patcher = patch.object(skill_router, "ROUTE_CACHE_DIR", self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_parse_route_doc_has_mcp(self):
         rules = parse_route_doc()
         self.assertTrue(rules)
@@ -43,6 +56,71 @@ class SkillRouterTest(unittest.TestCase):
         route = route_text("请做支付SaaS市场规模和竞争拆解研报", rules)
         self.assertEqual(route["skill"], "research-hub")
 
+    def test_load_route_table_uses_hashed_artifact(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            doc = Path(td) / "routes.md"
+            cache_dir = Path(td) / "route_tables"
+            doc.write_text(skill_router.ROUTE_DOC.read_text(encoding="utf-8"), encoding="utf-8")
+            rules = skill_router.load_route_table(doc, cache_dir)
+            self.assertEqual(rules, parse_route_doc(doc))
+            (artifact,) = cache_dir.iterdir()
+            self.assertEqual(json.loads(artifact.read_text(encoding="utf-8"))["version"], skill_router.ROUTE_CACHE_VERSION)
+
+            skill_router._ROUTE_TABLES.clear()
+            with patch.object(skill_router, "parse_route_doc", side_effect=AssertionError("re-parsed")):
+                self.assertEqual(skill_router.load_route_table(doc, cache_dir), rules)
+
+            doc.write_text(doc.read_text(encoding="utf-8") + "\n### 新分类\n| 需求关键词 | 技能 | 说明 |\n|-----------|------|------|\n| 新词 | new-skill | demo |\n", encoding="utf-8")
+            updated = skill_router.load_route_table(doc, cache_dir)
+            self.assertEqual(updated[-1]["skill"], "new-skill")
+
+    def test_candidate_doc_keeps_live_route_artifact(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            live, candidate = Path(td) / "live.md", Path(td) / "candidate.md"
+            cache_dir = Path(td) / "route_tables"
+            live.write_text(skill_router.ROUTE_DOC.read_text(encoding="utf-8"), encoding="utf-8")
+            candidate.write_text(live.read_text(encoding="utf-8") + "\n### 候选\n| 需求关键词 | 技能 | 说明 |\n|-----------|------|------|\n| 候选词 | cand-skill | demo |\n", encoding="utf-8")
+            live_rules = skill_router.load_route_table(live, cache_dir)
+            skill_router.load_route_table(candidate, cache_dir)
+            self.assertEqual(len(list(cache_dir.glob("*.json"))), 2)
+            self.assertEqual(list(cache_dir.glob("*.tmp")), [])
+
+            skill_router._ROUTE_TABLES.clear()
+            with patch.object(skill_router, "parse_route_doc", side_effect=AssertionError("re-parsed")):
+                self.assertEqual(skill_router.load_route_table(live, cache_dir), live_rules)
+                self.assertEqual(skill_router.load_route_table(candidate, cache_dir)[-1]["skill"], "cand-skill")
+
+    def test_bench_routing_reports_throughput(self):
+        out = skill_router.bench_routing(["请帮我获取网页内容"], repeat=2, cache_dir=self.cache_dir)
+        self.assertEqual(out["route_text"]["routes"], 2)
+        self.assertGreater(out["rules"], 0)
+
+    def test_route_batch_keeps_order(self):
+        rules = parse_route_doc()
+        texts = ["请帮我获取网页内容", "analyze SPY support resistance", "做一个通用任务处理方案"]
+        self.assertEqual(skill_router.route_batch(texts, rules), [route_text(t, rules) for t in texts])
+
+    def test_replay_routes_diffs_recorded_decisions(self):
+        with tempfile.TemporaryDirectory(dir="/Volumes/Luis_MacData/AgentSystem") as td:
+            traces = Path(td) / "2026-03-01.jsonl"
+            payload = Path(td) / "agent_run_1.json"
+            payload.write_text(json.dumps({"request": {"text": "帮我做一个低多边形风格人物图"}}, ensure_ascii=False), encoding="utf-8")
+            rows = [
+                {"type": "route", "trace_id": "a", "input_text": "请分析513180的K线和买卖点", "route": {"skill": "stock-market-hub + mcp-freefirst"}},
+                {"type": "route", "trace_id": "b", "input_text": "我打算更新这张表，excel直接修改原文件", "route": {"skill": "clarify"}},
+                {"type": "execution", "trace_id": "b", "skill": "clarify", "success": True},
+                {"run_id": "r1", "payload_path": str(payload)},
+            ]
+            traces.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in rows) + "\n", encoding="utf-8")
+            requests = skill_router.load_replay_requests([Path(td)])
+            self.assertEqual(len(requests), 3)
+            for workers in (1, 2):
+                out = skill_router.replay_routes(requests, workers=workers, enhanced=False, chunk_size=1, cache_dir=self.cache_dir)
+                self.assertEqual((out["total"], out["unchanged"], out["changed"], out["unrecorded"]), (3, 1, 1, 1))
+                self.assertEqual(out["transitions"], {"clarify -> minimax-xlsx": 1})
+                self.assertEqual(out["samples"][0]["id"], "b")
+                self.assertEqual(out["skills"]["image-creator-hub"], 1)
+
     def test_execute_mckinsey_ppt_route(self):
         with patch.object(skill_router, "route_text_enhanced", return_value={"skill": "mckinsey-ppt"}):
             out = skill_router.execute_route("做一份咨询风格PPT", "{}")
@@ -72,5 +150,16 @@ class SkillRouterTest(unittest.TestCase):
         self.assertTrue(out["result"]["ok"])
 
 
+    def test_enhanced_route_uses_fuzzy_triggers_only_without_a_rule_hit(self):
+        skills = [SkillMeta({"skill": {"name": "demo-minutes"}, "triggers": ["整理季报纪要"]}, Path("/tmp/demo-minutes.md"))]
+        rules = parse_route_doc()
+        with patch.object(skill_router, "_load_skills", return_value=skills):
+            route = skill_router.route_text_enhanced("请整理一下季报纪要", rules)
+            self.assertEqual(route["skill"], "demo-minutes")
+            self.assertEqual(route["keywords"], ["整理季报纪要"])
+            # a near-miss trigger does not override an explicit rule match
+            route = skill_router.route_text_enhanced("帮我起草周报摘要，再整理一下季报纪要", rules)
+            self.assertEqual(route["skill"], "digest")
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import asyncio
+import threading
+import time
+import unittest
+
+from scripts.result_cache import ResultCache
+from scripts.tool_use_router import ExecutionPolicy, ToolCall, ToolUseRouter
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+class ToolUseRouterExecutionTest(unittest.TestCase):
+    def setUp(self):
+        self.router = ToolUseRouter(mcp_runtime=object(), minimax_client=object())
+
+    def tearDown(self):
+        self.router.close()
+
+    def test_execute_tools_runs_thread_functions_concurrently_in_call_order(self):
+        def slow(tag: str, delay: float) -> str:
+            time.sleep(delay)
+            return tag
+
+        self.router.register_function("slow", slow, ExecutionPolicy(mode="thread"))
+        calls = [ToolCall("slow", {"tag": f"batch-{i}", "delay": 0.2 - i * 0.05}, source="function") for i in range(3)]
+        t0 = time.perf_counter()
+        results = asyncio.run(self.router.execute_tools(calls))
+        elapsed = time.perf_counter() - t0
+        self.assertEqual([r.content for r in results], ["batch-0", "batch-1", "batch-2"])
+        self.assertLess(elapsed, 0.4)
+
+    def test_thread_policy_timeout(self):
+        self.router.register_function("stuck", lambda seconds: time.sleep(seconds), ExecutionPolicy(mode="thread", timeout_sec=0.05))
+        res = asyncio.run(self.router.execute_tools([ToolCall("stuck", {"seconds": 0.5}, source="function")]))[0]
+        self.assertTrue(res.is_error)
+        self.assertIn("timed out", res.content)
+        sync_res = self.router.execute_function("stuck", {"seconds": 0.3})
+        self.assertTrue(sync_res.is_error)
+
+    def test_max_concurrency_limits_parallel_runs(self):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def tracked(i: int) -> int:
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.03)
+            with lock:
+                state["active"] -= 1
+            return i
+
+        self.router.register_function("tracked", tracked, ExecutionPolicy(mode="thread", max_concurrency=1))
+        calls = [ToolCall("tracked", {"i": i}, source="function") for i in range(4)]
+        results = asyncio.run(self.router.execute_tools(calls))
+        self.assertEqual([r.content for r in results], ["0", "1", "2", "3"])
+        self.assertEqual(state["peak"], 1)
+
+    def test_concurrency_gate_waits_outside_pool_and_before_timeout(self):
+        router = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), max_workers=2, result_cache=ResultCache())
+        active = {"gated": 0, "peak": 0, "coro": 0, "coro_peak": 0}
+
+        def gated(i: int) -> int:
+            active["gated"] += 1
+            active["peak"] = max(active["peak"], active["gated"])
+            time.sleep(0.15)
+            active["gated"] -= 1
+            return i
+
+        async def coro(i: int) -> int:
+            active["coro"] += 1
+            active["coro_peak"] = max(active["coro_peak"], active["coro"])
+            await asyncio.sleep(0.05)
+            active["coro"] -= 1
+            return i
+
+        router.register_function("gated", gated, ExecutionPolicy(mode="thread", max_concurrency=1, timeout_sec=0.25))
+        router.register_function("free", lambda: "free", ExecutionPolicy(mode="thread"))
+        router.register_function("coro", coro, ExecutionPolicy(max_concurrency=1, timeout_sec=0.08))
+        calls = [ToolCall("gated", {"i": i}, source="function") for i in range(3)]
+        calls += [ToolCall("free", {}, source="function")]
+        calls += [ToolCall("coro", {"i": i}, source="function") for i in range(3)]
+        results = asyncio.run(router.execute_tools(calls))
+        router.close()
+        # queued calls do not eat their own timeout budget
+        self.assertEqual([r.content for r in results], ["0", "1", "2", "free", "0", "1", "2"])
+        self.assertEqual((active["peak"], active["coro_peak"]), (1, 1))
+        # waiting "gated" calls do not hold the second pool thread
+        self.assertLess(results[3].execution_time_ms, 100)
+
+    def test_process_policy_and_inline_coroutine(self):
+        async def agen(x: int) -> int:
+            await asyncio.sleep(0)
+            return x + 1
+
+        self.router.register_function("square", _square, ExecutionPolicy(mode="process"))
+        self.router.register_function("agen", agen)
+        results = asyncio.run(
+            self.router.execute_tools(
+                [ToolCall("square", {"x": 7}, source="function"), ToolCall("agen", {"x": 41}, source="function")]
+            )
+        )
+        self.assertEqual([r.content for r in results], ["49", "42"])
+        self.assertEqual(self.router.execute_function("square", {"x": 3}).content, "9")
+
+    def test_identical_calls_share_one_execution_and_per_tool_ttl(self):
+        router = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), result_cache=ResultCache())
+        calls = []
+
+        def lookup(q: str) -> str:
+            calls.append(q)
+            time.sleep(0.05)
+            return q.upper()
+
+        router.register_function("lookup", lookup, ExecutionPolicy(mode="thread"))
+        router.register_function("fresh", lookup)
+        router.set_tool_ttl("fresh", 0)
+        batch = [ToolCall("lookup", {"q": "a"}, source="function")] * 3 + [ToolCall("fresh", {"q": "b"}, source="function")] * 2
+        results = asyncio.run(router.execute_tools(batch))
+        self.assertEqual([r.content for r in results], ["A", "A", "A", "B", "B"])
+        self.assertEqual(calls.count("a"), 1)
+        self.assertEqual(calls.count("b"), 2)
+        stats = router.get_stats()
+        self.assertEqual(stats["cache_hits"], 2)
+        self.assertEqual(stats["result_cache"]["entries"], 1)
+        router.close()
+
+    def test_shared_cache_keys_follow_the_registered_callable(self):
+        shared = ResultCache()
+        first = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), result_cache=shared)
+        second = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), result_cache=shared)
+        scoped = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), result_cache=shared, cache_scope="tenant-b")
+        first.register_function("calc", _square)
+        second.register_function("calc", lambda x: x + 1)
+        scoped.register_function("calc", _square)
+        call = [ToolCall("calc", {"x": 4}, source="function")]
+        self.assertEqual(asyncio.run(first.execute_tools(call))[0].content, "16")
+        self.assertEqual(asyncio.run(second.execute_tools(call))[0].content, "5")
+        asyncio.run(scoped.execute_tools(call))
+        self.assertEqual(scoped.get_stats()["cache_hits"], 0)
+        # the same callable under the same name is still shared across routers
+        again = ToolUseRouter(mcp_runtime=object(), minimax_client=object(), result_cache=shared)
+        again.register_function("calc", _square)
+        asyncio.run(again.execute_tools(call))
+        self.assertEqual(again.get_stats()["cache_hits"], 1)
+        for router in (first, second, scoped, again):
+            router.close()
+
+    def test_unknown_mode_rejected(self):
+        with self.assertRaises(ValueError):
+            self.router.register_function("bad", _square, ExecutionPolicy(mode="gpu"))
+
+
+if __name__ == "__main__":
+    unittest.main()